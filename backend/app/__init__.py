@@ -55,8 +55,41 @@ def create_app(config_name='default'):
     with app.app_context():
         db.create_all()
     
+    # 创建任务调度器
+    scheduler = configure_task_scheduler(app)
+    if app.config.get('TASK_SCHEDULER_AUTOSTART'):
+        scheduler.start()
+    
     return app
 
+def configure_task_scheduler(app):
+    """创建任务调度器并注册到 app.extensions['task_scheduler']
+
+    调度参数从 SystemConfig、站点连接上限从 FtpSite 读取，启动时加载，修改后由模型同步到调度器。
+    """
+    from app.core.priority_queue import PriorityTaskQueue
+    from app.core.resource_manager import ResourceManager, SystemResources
+    from app.core.task_scheduler import TaskScheduler
+    from app.models import FtpSite, SystemConfig
+    
+    def get_config(key, default=None):
+        with app.app_context():
+            return SystemConfig.get_config(key, default)
+    
+    def get_sites():
+        with app.app_context():
+            return FtpSite.query.all()
+    
+    resources = SystemResources(
+        max_ftp_connections=app.config['MAX_FTP_CONNECTIONS'],
+        max_bandwidth_kbps=app.config['DEFAULT_BANDWIDTH_LIMIT'],
+        max_concurrent_tasks=app.config['MAX_CONCURRENT_TASKS']
+    )
+    scheduler = TaskScheduler(ResourceManager(resources), PriorityTaskQueue(),
+                              get_config=get_config, get_sites=get_sites)
+    app.extensions['task_scheduler'] = scheduler
+    return scheduler
+
 def configure_celery(app, celery):
     """配置Celery"""
     celery.conf.update(
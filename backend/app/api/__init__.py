@@ -19,4 +19,4 @@ from . import auth
 # from . import tasks
 # from . import monitors
 # from . import logs
-# from . import system
+from . import system
@@ -0,0 +1,79 @@
+from flask import request, jsonify, current_app
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from app.models import User
+from app.api import api_bp
+
+def get_task_scheduler():
+    """获取应用中运行的任务调度器（创建调度器时注册到 app.extensions['task_scheduler']）"""
+    return current_app.extensions.get('task_scheduler')
+
+def admin_required_response():
+    """当前用户不是管理员时返回错误响应，否则返回None"""
+    user = User.query.get(get_jwt_identity())
+    if not user or not user.is_admin:
+        return jsonify({
+            'success': False,
+            'message': '需要管理员权限'
+        }), 403
+    return None
+
+def scheduler_unavailable_response():
+    return jsonify({
+        'success': False,
+        'message': '任务调度器未启动'
+    }), 503
+
+@api_bp.route('/system/scheduler', methods=['GET'])
+@jwt_required()
+def get_scheduler_status():
+    """获取调度器状态"""
+    try:
+        error_response = admin_required_response()
+        if error_response:
+            return error_response
+
+        scheduler = get_task_scheduler()
+        if scheduler is None:
+            return scheduler_unavailable_response()
+
+        return jsonify({
+            'success': True,
+            'scheduler': scheduler.get_scheduler_status()
+        })
+
+    except Exception as e:
+        current_app.logger.error(f'获取调度器状态错误: {str(e)}')
+        return jsonify({
+            'success': False,
+            'message': '获取调度器状态失败'
+        }), 500
+
+@api_bp.route('/system/scheduler/metrics', methods=['GET'])
+@jwt_required()
+def get_scheduler_metrics():
+    """获取调度指标：排队等待时间、执行时间、被抢占次数和传输字节数的分布
+
+    按全局、优先级、站点分组；参数 buckets=true 时附带直方图的非空桶，用于绘制完整分布。
+    """
+    try:
+        error_response = admin_required_response()
+        if error_response:
+            return error_response
+
+        scheduler = get_task_scheduler()
+        if scheduler is None:
+            return scheduler_unavailable_response()
+
+        include_buckets = request.args.get('buckets', 'false').lower() in ('1', 'true', 'yes')
+        return jsonify({
+            'success': True,
+            'stats': scheduler.stats,
+            'metrics': scheduler.metrics.get_summary(buckets=include_buckets)
+        })
+
+    except Exception as e:
+        current_app.logger.error(f'获取调度指标错误: {str(e)}')
+        return jsonify({
+            'success': False,
+            'message': '获取调度指标失败'
+        }), 500
@@ -29,6 +29,8 @@ class Config:
     MAX_CONCURRENT_TASKS = int(os.environ.get('MAX_CONCURRENT_TASKS', 10))
     MAX_FTP_CONNECTIONS = int(os.environ.get('MAX_FTP_CONNECTIONS', 20))
     DEFAULT_BANDWIDTH_LIMIT = int(os.environ.get('DEFAULT_BANDWIDTH_LIMIT', 10240))  # KB/s
+    # 只在运行API服务的进程中启动调度器，Celery、CLI 等其他进程也会调用 create_app
+    TASK_SCHEDULER_AUTOSTART = os.environ.get('TASK_SCHEDULER_AUTOSTART', 'false').lower() in ('true', '1', 'yes')
     
     # 日志配置
     LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
@@ -53,6 +55,7 @@ class TestingConfig(Config):
     """测试环境配置"""
     TESTING = True
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+    TASK_SCHEDULER_AUTOSTART = False
     WTF_CSRF_ENABLED = False
 
 class ProductionConfig(Config):
@@ -0,0 +1,213 @@
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+from .proc_stats import HostStatsSampler
+
+class SiteConcurrency:
+    """单个站点的并发控制状态（AIMD）"""
+
+    def __init__(self, limit: int, now: float):
+        self.limit = limit
+        self.window_start = now
+        self.window_bytes = 0
+        self.window_completed = 0
+        self.window_errors = 0
+        self.window_started = 0
+        self.window_retries = 0  # 窗口内启动的任务中属于重试的个数
+        self.saturated = False  # 窗口内是否因并发上限挡住过任务
+        self.last_throughput = None  # 上个窗口的吞吐量（字节/秒）
+        self.last_retry_rate = 0.0  # 上个窗口的重试率
+        self.last_wait_seconds = 0.0  # 上个窗口结束时的平均等待时间
+        self.last_action = None  # increase / decrease / backoff / hold
+        self.hold_until = 0.0  # 在此之前不再增加并发
+        self.avg_wait_seconds = 0.0  # 排队等待时间的指数移动平均
+
+class AdaptiveController:
+    """自适应并发控制器
+
+    按站点测量实际吞吐量、错误率、重试率和排队等待时间，周期性地以AIMD方式调整每个站点的并发上限：
+    - 窗口内有任务因并发上限而等待、排队等待时间在增长，且上次加并发后吞吐量仍在上升：并发 +1
+    - 加并发后吞吐量没有明显提升（进入平台期）：并发 -1，并暂停一段时间再尝试增加
+    - 出现错误（错误率超过阈值）：并发乘以 decrease_factor
+    - 重试率超过阈值且比上个窗口高（站点开始出现临时故障）：并发 -1
+    - 主机CPU或磁盘繁忙：不再增加，并逐步回退
+    """
+
+    def __init__(self, initial_limit: int = 2, min_limit: int = 1, max_limit: int = 8,
+                 interval: float = 10.0, host_sampler: HostStatsSampler = None,
+                 site_cap: Callable = None, clock: Callable[[], float] = time.time):
+        self.clock = clock
+        # 站点当前的连接上限 site_cap(site_id)，None表示不限制（如 SiteConnectionLimits.limit），
+        # 每次评估前用作各站点并发上限的上界，421后学到的上限随时间回升时随之放开
+        self.site_cap = site_cap
+        self.initial_limit = initial_limit
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.interval = interval  # 评估窗口长度（秒）
+        self.gain_threshold = 0.05  # 吞吐量提升超过5%才认为仍在上升
+        self.error_threshold = 0.1  # 错误率阈值
+        self.retry_threshold = 0.2  # 重试率阈值（窗口内启动的任务中重试所占比例）
+        self.decrease_factor = 0.5
+        self.hold_seconds = interval * 6  # 平台期后暂停增加的时间
+        self.cpu_high_percent = 90.0
+        self.disk_high_percent = 90.0
+        self.wait_alpha = 0.2
+
+        self.host_sampler = host_sampler or HostStatsSampler()
+        self.host_stats = {"cpu_percent": None, "disk_busy_percent": None}
+        self.host_sampler.sample()  # 建立基线
+
+        self.sites = {}  # site_id -> SiteConcurrency
+        self.site_max_limits = {}  # site_id -> 并发上限的上界（如站点配置的最大连接数）
+        self.task_bytes = {}  # task_id -> 已计入的字节数
+        self.last_update = self.clock()
+        self.lock = threading.Lock()
+
+    def _site(self, site_id) -> SiteConcurrency:
+        site = self.sites.get(site_id)
+        if site is None:
+            if self.site_cap is not None and site_id is not None:
+                self._set_site_max_limit(site_id, self.site_cap(site_id))
+            limit = min(self.initial_limit, self.site_max_limits.get(site_id, self.max_limit))
+            site = self.sites[site_id] = SiteConcurrency(limit, self.clock())
+        return site
+
+    def set_site_max_limit(self, site_id, max_limit: Optional[int]):
+        """设置站点并发上限的上界（站点配置或421后学到的连接上限），None表示只受 max_limit 限制"""
+        with self.lock:
+            self._set_site_max_limit(site_id, max_limit)
+            site = self.sites.get(site_id)
+            if site is not None:
+                site.limit = min(site.limit, self.site_max_limits.get(site_id, self.max_limit))
+
+    def _set_site_max_limit(self, site_id, max_limit: Optional[int]):
+        """调用方需持有锁"""
+        if max_limit is None:
+            self.site_max_limits.pop(site_id, None)
+        else:
+            self.site_max_limits[site_id] = min(max(max_limit, self.min_limit), self.max_limit)
+
+    # 信号采集（在调度线程和工作线程中调用）
+
+    def has_capacity(self, site_id, running: int) -> bool:
+        """站点当前并发数是否低于上限，否则记录为饱和"""
+        with self.lock:
+            site = self._site(site_id)
+            if running < site.limit:
+                return True
+            site.saturated = True
+            return False
+
+    def record_start(self, site_id, wait_seconds: float, is_retry: bool):
+        with self.lock:
+            site = self._site(site_id)
+            site.avg_wait_seconds += self.wait_alpha * (wait_seconds - site.avg_wait_seconds)
+            site.window_started += 1
+            if is_retry:
+                site.window_retries += 1
+
+    def record_progress(self, task_id: str, site_id, transferred_bytes: int):
+        """记录任务累计传输字节数，只计入增量"""
+        with self.lock:
+            delta = transferred_bytes - self.task_bytes.get(task_id, 0)
+            if delta > 0:
+                self.task_bytes[task_id] = transferred_bytes
+                self._site(site_id).window_bytes += delta
+
+    def record_finish(self, task_id: str, site_id, transferred_bytes: int, success: Optional[bool]):
+        """记录任务结束，success为None表示未结束（让出时间片、被抢占或取消）"""
+        self.record_progress(task_id, site_id, transferred_bytes)
+        with self.lock:
+            self.task_bytes.pop(task_id, None)
+            site = self._site(site_id)
+            if success is True:
+                site.window_completed += 1
+            elif success is False:
+                site.window_errors += 1
+
+    # 周期评估
+
+    def maybe_update(self, now: float = None) -> bool:
+        """距上次评估超过 interval 时评估所有站点，返回是否进行了评估"""
+        now = now or self.clock()
+        if now - self.last_update < self.interval:
+            return False
+        self.update(now)
+        return True
+
+    def update(self, now: float = None):
+        now = now or self.clock()
+        host_stats = self.host_sampler.sample()
+        with self.lock:
+            self.host_stats = host_stats
+            cpu = host_stats["cpu_percent"]
+            disk = host_stats["disk_busy_percent"]
+            host_busy = ((cpu is not None and cpu >= self.cpu_high_percent) or
+                         (disk is not None and disk >= self.disk_high_percent))
+            for site_id, site in self.sites.items():
+                if self.site_cap is not None and site_id is not None:
+                    self._set_site_max_limit(site_id, self.site_cap(site_id))
+                self._evaluate(site_id, site, now, host_busy)
+            self.last_update = now
+
+    def _evaluate(self, site_id, site: SiteConcurrency, now: float, host_busy: bool):
+        elapsed = max(now - site.window_start, 1e-6)
+        throughput = site.window_bytes / elapsed
+        finished = site.window_completed + site.window_errors
+        error_rate = site.window_errors / finished if finished else 0.0
+        retry_rate = site.window_retries / site.window_started if site.window_started else 0.0
+        # 窗口内没有任务启动但仍有任务被挡住时，等待时间同样在增长
+        wait_growing = (site.avg_wait_seconds > site.last_wait_seconds or
+                        (site.saturated and not site.window_started))
+        max_limit = self.site_max_limits.get(site_id, self.max_limit)
+
+        if error_rate > self.error_threshold:
+            site.limit = max(self.min_limit, int(site.limit * self.decrease_factor))
+            site.last_action = "decrease"
+        elif host_busy:
+            site.limit = max(self.min_limit, site.limit - 1)
+            site.last_action = "backoff"
+        elif retry_rate > self.retry_threshold and retry_rate > site.last_retry_rate:
+            site.limit = max(self.min_limit, site.limit - 1)
+            site.last_action = "backoff"
+        elif (site.last_action == "increase" and site.last_throughput is not None and
+              throughput < site.last_throughput * (1 + self.gain_threshold)):
+            # 上次加并发没有带来吞吐提升，回退并暂停增加
+            site.limit = max(self.min_limit, site.limit - 1)
+            site.hold_until = now + self.hold_seconds
+            site.last_action = "backoff"
+        elif site.saturated and wait_growing and site.limit < max_limit and now >= site.hold_until:
+            site.limit += 1
+            site.last_action = "increase"
+        else:
+            site.last_action = "hold"
+        site.limit = min(site.limit, max_limit)
+
+        site.last_throughput = throughput
+        site.last_retry_rate = retry_rate
+        site.last_wait_seconds = site.avg_wait_seconds
+        site.window_start = now
+        site.window_bytes = 0
+        site.window_completed = 0
+        site.window_errors = 0
+        site.window_started = 0
+        site.window_retries = 0
+        site.saturated = False
+
+    def get_status(self) -> Dict:
+        with self.lock:
+            return {
+                "host": dict(self.host_stats),
+                "sites": {
+                    str(site_id): {
+                        "limit": site.limit,
+                        "throughput_bps": site.last_throughput,
+                        "last_action": site.last_action,
+                        "avg_wait_seconds": site.avg_wait_seconds,
+                        "window_errors": site.window_errors,
+                        "retry_rate": site.last_retry_rate
+                    }
+                    for site_id, site in self.sites.items()
+                }
+            }
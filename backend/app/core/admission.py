@@ -0,0 +1,213 @@
+import sys
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from .priority_queue import TaskItem
+
+def _approx_size(value, depth: int = 0) -> int:
+    """粗略估计对象占用的内存（字节），只递归到有限深度"""
+    if isinstance(value, (str, bytes)):
+        return 49 + len(value)
+    if isinstance(value, dict):
+        size = sys.getsizeof(value)
+        if depth < 3:
+            size += sum(_approx_size(key, depth + 1) + _approx_size(item, depth + 1)
+                        for key, item in value.items())
+        return size
+    if isinstance(value, (list, tuple, set)):
+        size = 56 + 8 * len(value)
+        if depth < 3:
+            size += sum(_approx_size(item, depth + 1) for item in value)
+        return size
+    return 28
+
+def _measure_task_base() -> int:
+    """空任务项本身（对象、属性字典和两个空字典字段）占用的内存，其余默认值为共享的小对象"""
+    task_item = TaskItem(task_id="", priority=0)
+    return (sys.getsizeof(task_item) + sys.getsizeof(vars(task_item)) +
+            sys.getsizeof(task_item.payload) + sys.getsizeof(task_item.resource_requirements))
+
+# 每个排队任务在队列和各二级索引（优先级堆、公平共享、老化、截止时间等）中的条目开销
+QUEUE_ENTRY_BYTES = 1024
+TASK_BASE_BYTES = _measure_task_base() + QUEUE_ENTRY_BYTES
+
+def estimate_task_bytes(task_item: TaskItem) -> int:
+    """估计一个任务在队列中占用的内存"""
+    return (TASK_BASE_BYTES + len(task_item.task_id) + _approx_size(task_item.payload) +
+            (_approx_size(task_item.resource_requirements) if task_item.resource_requirements else 0))
+
+class AdmissionRejected(Exception):
+    """任务提交被拒绝（队列已满），相当于 HTTP 429，retry_after 为建议的重试等待秒数"""
+
+    status_code = 429
+
+    def __init__(self, reason: str, message: str, retry_after: float):
+        super().__init__(message)
+        self.reason = reason  # queue_full / user_queue_full / queue_memory / host_memory
+        self.message = message
+        self.retry_after = retry_after
+
+    def to_dict(self) -> Dict:
+        return {"reason": self.reason, "message": self.message, "retry_after": self.retry_after}
+
+class AdmissionController:
+    """任务准入控制：限制排队任务的总数、每个用户的数量和估计内存，超限时拒绝新提交
+
+    作为 PriorityTaskQueue 的二级索引维护排队任务的计数和内存估计，add/discard 在队列锁内调用。
+    只检查新提交的任务；调度器放回队列的任务（让出、抢占、重试）不受限制，不会因此丢失。
+    一次提交的多个任务整体准入或整体拒绝。主机可用内存低于 min_available_memory_mb
+    （由 ResourceManager 采样）时同样拒绝。拒绝时按最近的派发速率估计队列腾出空间所需的时间，
+    作为 retry_after 返回。
+    """
+
+    def __init__(self, max_queued_tasks: int = 100_000, max_queued_per_user: int = 20_000,
+                 max_queue_memory_mb: float = 256, min_available_memory_mb: float = None,
+                 available_memory: Callable[[], Optional[float]] = None,
+                 min_retry_after: float = 1, max_retry_after: float = 300, default_retry_after: float = 30,
+                 clock: Callable[[], float] = time.time):
+        self.max_queued_tasks = max_queued_tasks  # None表示不限制，下同
+        self.max_queued_per_user = max_queued_per_user
+        self.max_queue_memory_mb = max_queue_memory_mb
+        self.min_available_memory_mb = min_available_memory_mb
+        self.available_memory = available_memory  # 返回主机可用内存（MB），未知时返回None
+        self.min_retry_after = min_retry_after
+        self.max_retry_after = max_retry_after
+        self.default_retry_after = default_retry_after  # 尚未测得派发速率时使用
+        self.clock = clock
+
+        self.queued = 0
+        self.queued_bytes = 0
+        self.per_user = {}  # user_id -> 排队任务数
+        self.task_bytes = {}  # task_id -> 入队时估计的内存
+        self.admitted = {}  # task_id -> 准入时估计的内存，入队时直接使用，避免重复估计
+        self.rejected = {}  # reason -> 累计拒绝次数
+
+        # 派发速率：每 rate_window 秒统计一次
+        self.rate_window = 10.0
+        self.window_start = clock()
+        self.window_dispatched = 0
+        self.dispatch_rate = None  # 任务/秒
+        self.lock = threading.Lock()
+
+    # 队列索引接口
+
+    def add(self, task_item: TaskItem):
+        with self.lock:
+            if task_item.task_id in self.task_bytes:
+                return
+            nbytes = self.admitted.pop(task_item.task_id, None) or estimate_task_bytes(task_item)
+            self.task_bytes[task_item.task_id] = nbytes
+            self.queued += 1
+            self.queued_bytes += nbytes
+            self.per_user[task_item.user_id] = self.per_user.get(task_item.user_id, 0) + 1
+
+    def discard(self, task_item: TaskItem):
+        with self.lock:
+            nbytes = self.task_bytes.pop(task_item.task_id, None)
+            if nbytes is None:
+                return
+            self.queued -= 1
+            self.queued_bytes -= nbytes
+            count = self.per_user[task_item.user_id] - 1
+            if count:
+                self.per_user[task_item.user_id] = count
+            else:
+                del self.per_user[task_item.user_id]
+
+    def clear(self):
+        with self.lock:
+            self.queued = 0
+            self.queued_bytes = 0
+            self.per_user.clear()
+            self.task_bytes.clear()
+            self.admitted.clear()
+
+    # 准入
+
+    def on_dispatch(self):
+        """任务被派发（用于估计队列的消化速度）"""
+        with self.lock:
+            self.window_dispatched += 1
+            self._update_rate(self.clock())
+
+    def _update_rate(self, now: float):
+        elapsed = now - self.window_start
+        if elapsed >= self.rate_window:
+            self.dispatch_rate = self.window_dispatched / elapsed
+            self.window_start = now
+            self.window_dispatched = 0
+
+    def _retry_after(self, excess_tasks: float) -> float:
+        """按派发速率估计腾出 excess_tasks 个位置所需的秒数"""
+        self._update_rate(self.clock())
+        rate = self.dispatch_rate
+        if rate is None:
+            return self.default_retry_after
+        if not rate:
+            return self.max_retry_after
+        return round(min(max(excess_tasks / rate, self.min_retry_after), self.max_retry_after), 1)
+
+    def admit(self, task_items: List[TaskItem]):
+        """检查能否接收这批任务，不能时抛出 AdmissionRejected"""
+        if not task_items:
+            return
+        if self.min_available_memory_mb is not None and self.available_memory:
+            available = self.available_memory()
+            if available is not None and available < self.min_available_memory_mb:
+                with self.lock:
+                    # 按队列消化一成所需的时间估计重试间隔
+                    self._reject("host_memory", f"主机可用内存不足（{available:.0f} MB）", self.queued * 0.1)
+
+        with self.lock:
+            estimates = {}
+            new_per_user = {}
+            for task_item in task_items:
+                if task_item.task_id not in self.task_bytes:
+                    estimates[task_item.task_id] = estimate_task_bytes(task_item)
+                    new_per_user[task_item.user_id] = new_per_user.get(task_item.user_id, 0) + 1
+            new_bytes = sum(estimates.values())
+            count = len(estimates)
+
+            if self.max_queued_tasks is not None and self.queued + count > self.max_queued_tasks:
+                self._reject("queue_full", f"调度队列已满（{self.queued}/{self.max_queued_tasks}）",
+                             self.queued + count - self.max_queued_tasks)
+
+            if self.max_queued_per_user is not None:
+                for user_id, user_count in new_per_user.items():
+                    queued = self.per_user.get(user_id, 0)
+                    if user_id is not None and queued + user_count > self.max_queued_per_user:
+                        self._reject("user_queue_full",
+                                     f"用户 {user_id} 的排队任务过多（{queued}/{self.max_queued_per_user}）",
+                                     queued + user_count - self.max_queued_per_user)
+
+            if self.max_queue_memory_mb is not None:
+                limit_bytes = self.max_queue_memory_mb * 1024 * 1024
+                if self.queued_bytes + new_bytes > limit_bytes:
+                    average = (self.queued_bytes / self.queued) if self.queued else TASK_BASE_BYTES
+                    self._reject("queue_memory",
+                                 f"调度队列内存超过上限（约 {self.queued_bytes / 1024 / 1024:.0f} MB / "
+                                 f"{self.max_queue_memory_mb} MB）",
+                                 (self.queued_bytes + new_bytes - limit_bytes) / average)
+            self.admitted.update(estimates)
+
+    def _reject(self, reason: str, message: str, excess_tasks: float):
+        """调用方需持有锁"""
+        self.rejected[reason] = self.rejected.get(reason, 0) + 1
+        raise AdmissionRejected(reason, message, self._retry_after(excess_tasks))
+
+    def get_status(self) -> Dict:
+        with self.lock:
+            return {
+                "queued_tasks": self.queued,
+                "queued_memory_mb": round(self.queued_bytes / 1024 / 1024, 2),
+                "users": len(self.per_user),
+                "dispatch_rate": self.dispatch_rate,
+                "rejected": dict(self.rejected),
+                "limits": {
+                    "max_queued_tasks": self.max_queued_tasks,
+                    "max_queued_per_user": self.max_queued_per_user,
+                    "max_queue_memory_mb": self.max_queue_memory_mb,
+                    "min_available_memory_mb": self.min_available_memory_mb
+                }
+            }
@@ -0,0 +1,104 @@
+import bisect
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .priority_queue import TaskItem, TaskPriority
+
+class AgingIndex:
+    """任务老化索引：每个优先级一个按进入时间排序的FIFO
+
+    任务在当前优先级等待超过 age_seconds 后提升一级（不超过 max_priority，默认NORMAL，
+    老化的任务不会进入HIGH与高优先级任务争抢），提升后在新的优先级重新计时。
+    每次只需检查各FIFO队首，每个任务每级只出队一次，均摊 O(1)。
+    调度器放回队列的任务（让出、抢占）保留原计时，按进入时间插入，保持FIFO有序。
+    删除采用惰性方式：出队时跳过已不在队列中或已改变优先级的记录。
+
+    作为 PriorityTaskQueue 的二级索引使用，add/discard 在队列锁内调用。
+    """
+
+    def __init__(self, max_priority: int = TaskPriority.NORMAL, clock: Callable[[], float] = time.time):
+        self.clock = clock
+        self.max_priority = max_priority  # 老化最多提升到的优先级
+        self.levels = {priority: deque() for priority in TaskPriority}  # priority -> deque[(since, task_id)]
+        self.entries = {}  # task_id -> (priority, since)
+        self.queued = set()  # FIFO中实际存在的记录 (priority, since, task_id)，避免重复入队
+        self.aged = set()  # 队列中曾被老化提升过的任务
+        self.lock = threading.Lock()
+
+    def add(self, task_item: TaskItem):
+        with self.lock:
+            if task_item.level_since is None:
+                task_item.level_since = self.clock()
+            since = task_item.level_since
+            self.entries[task_item.task_id] = (task_item.priority, since)
+            if task_item.aged_levels:
+                self.aged.add(task_item.task_id)
+            record = (task_item.priority, since, task_item.task_id)
+            if task_item.priority <= self.max_priority or record in self.queued:
+                return
+            self.queued.add(record)
+
+            # 新任务的计时最晚，直接追加；放回队列的任务保留原计时，按时间插入
+            fifo = self.levels[task_item.priority]
+            entry = (since, task_item.task_id)
+            if not fifo or entry >= fifo[-1]:
+                fifo.append(entry)
+            else:
+                bisect.insort(fifo, entry)
+
+    def discard(self, task_item: TaskItem):
+        with self.lock:
+            self.entries.pop(task_item.task_id, None)
+            self.aged.discard(task_item.task_id)
+
+    def clear(self):
+        with self.lock:
+            for fifo in self.levels.values():
+                fifo.clear()
+            self.entries.clear()
+            self.queued.clear()
+            self.aged.clear()
+
+    def _head(self, priority: int) -> Optional[Tuple[float, str]]:
+        """返回有效的队首记录，顺便丢弃失效记录"""
+        fifo = self.levels[priority]
+        while fifo:
+            since, task_id = fifo[0]
+            if self.entries.get(task_id) == (priority, since):
+                return fifo[0]
+            self._popleft(priority)
+        return None
+
+    def _popleft(self, priority: int):
+        since, task_id = self.levels[priority].popleft()
+        self.queued.discard((priority, since, task_id))
+
+    def pop_due(self, now: float, age_seconds: float) -> List[Tuple[str, int]]:
+        """取出等待超时的任务，返回 [(task_id, 新优先级)]，由调用方调整队列中的优先级"""
+        due = []
+        with self.lock:
+            for priority in range(self.max_priority + 1, TaskPriority.BACKGROUND + 1):
+                while True:
+                    head = self._head(priority)
+                    if head is None or now - head[0] < age_seconds:
+                        break
+                    self._popleft(priority)
+                    due.append((head[1], priority - 1))
+        return due
+
+    def next_due(self, now: float, age_seconds: float) -> Optional[float]:
+        """距下一个任务需要提升的秒数，没有可老化的任务时返回None"""
+        with self.lock:
+            heads = [self._head(priority)
+                     for priority in range(self.max_priority + 1, TaskPriority.BACKGROUND + 1)]
+        times = [since + age_seconds - now for since, _ in filter(None, heads)]
+        return max(min(times), 0.0) if times else None
+
+    def get_status(self) -> Dict:
+        with self.lock:
+            return {
+                "max_priority": int(self.max_priority),
+                "aged_tasks": len(self.aged)
+            }
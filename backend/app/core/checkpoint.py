@@ -0,0 +1,71 @@
+import threading
+from collections import defaultdict
+from typing import Set
+
+class CheckpointStore:
+    """断点存储接口：记录每个任务文件已完成的块，任务暂停或被抢占后据此续传"""
+
+    def save_chunk(self, task_id: str, task_file_id: int, chunk_index: int,
+                   start_offset: int, end_offset: int, checksum: str = None):
+        raise NotImplementedError
+
+    def completed_chunks(self, task_id: str, task_file_id: int) -> Set[int]:
+        raise NotImplementedError
+
+    def clear(self, task_id: str):
+        """任务结束后清理断点"""
+        pass
+
+class MemoryCheckpointStore(CheckpointStore):
+    """进程内断点存储（默认），进程重启后丢失"""
+
+    def __init__(self):
+        self.chunks = defaultdict(lambda: defaultdict(set))  # task_id -> task_file_id -> {chunk_index}
+        self.lock = threading.Lock()
+
+    def save_chunk(self, task_id: str, task_file_id: int, chunk_index: int,
+                   start_offset: int, end_offset: int, checksum: str = None):
+        with self.lock:
+            self.chunks[task_id][task_file_id].add(chunk_index)
+
+    def completed_chunks(self, task_id: str, task_file_id: int) -> Set[int]:
+        with self.lock:
+            files = self.chunks.get(task_id)
+            return set(files.get(task_file_id, ())) if files else set()
+
+    def clear(self, task_id: str):
+        with self.lock:
+            self.chunks.pop(task_id, None)
+
+class TransferChunkCheckpointStore(CheckpointStore):
+    """基于 transfer_chunks 表的断点存储
+
+    每完成一个块写入（或更新）一条 TransferChunk 记录，状态为 completed。
+    记录随任务文件级联删除，clear 不做处理。需要传入Flask应用以便在工作线程中使用数据库。
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    def save_chunk(self, task_id: str, task_file_id: int, chunk_index: int,
+                   start_offset: int, end_offset: int, checksum: str = None):
+        from app import db
+        from app.models import TransferChunk
+
+        with self.app.app_context():
+            chunk = TransferChunk.query.filter_by(
+                task_file_id=task_file_id, chunk_index=chunk_index
+            ).first()
+            if chunk is None:
+                chunk = TransferChunk(task_file_id, chunk_index, start_offset, end_offset)
+                db.session.add(chunk)
+            chunk.complete_chunk(checksum)
+
+    def completed_chunks(self, task_id: str, task_file_id: int) -> Set[int]:
+        from app.models import TransferChunk
+
+        with self.app.app_context():
+            rows = TransferChunk.query.filter_by(
+                task_file_id=task_file_id, status='completed'
+            ).with_entities(TransferChunk.chunk_index).all()
+            return {row.chunk_index for row in rows}
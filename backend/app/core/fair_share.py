@@ -0,0 +1,175 @@
+import threading
+from typing import Callable, Dict, Optional
+
+from .priority_queue import IndexedHeap, TaskItem
+
+class _Flow:
+    """一个调度流：步幅调度中的 pass 值，以及子流（用户下的站点）或任务堆（站点）"""
+
+    def __init__(self):
+        self.pass_value = 0.0
+        self.children = {}  # 仅用户流使用：site_id -> _Flow
+        self.active = set()  # 仅用户流使用：有等待任务的站点
+        self.virtual_time = 0.0  # 仅用户流使用：站点间的虚拟时间
+        self.tasks = IndexedHeap()  # 仅站点流使用
+
+class FairShareIndex:
+    """公平共享索引：按 用户 -> FTP站点 两级分流，用步幅调度（stride scheduling）按字节计费
+
+    每个流的 pass 值表示已获得的服务量（字节 / 权重），每次选择 pass 最小的用户、
+    再选该用户下 pass 最小的站点，派发该站点中优先级最高的任务。
+    派发时按预估字节数预扣，任务结束后按实际传输字节数结算，多退少补。
+    流重新活跃时 pass 不低于当前虚拟时间，空闲期间不会累积额度。
+
+    作为 PriorityTaskQueue 的二级索引使用，add/discard 在队列锁内调用。
+    """
+
+    def __init__(self, default_task_bytes: int = 1024 * 1024):
+        self.default_task_bytes = default_task_bytes  # 任务大小未知时的预估字节数
+        self.user_weights = {}  # user_id -> 权重，默认1
+        self.site_weights = {}  # site_id -> 权重，默认1
+        self.users = {}  # user_id -> _Flow
+        self.active = set()  # 有等待任务的用户
+        self.virtual_time = 0.0
+        self.charges = {}  # task_id -> (user_id, site_id, 预扣字节数)
+        self.lock = threading.RLock()
+
+    # 队列索引接口
+
+    def add(self, task_item: TaskItem):
+        with self.lock:
+            user_id, site_id = task_item.user_id, task_item.site_id
+            user = self.users.get(user_id)
+            if user is None:
+                user = self.users[user_id] = _Flow()
+            site = user.children.get(site_id)
+            if site is None:
+                site = user.children[site_id] = _Flow()
+
+            if site_id not in user.active:
+                site.pass_value = max(site.pass_value, user.virtual_time)
+                user.active.add(site_id)
+            if user_id not in self.active:
+                user.pass_value = max(user.pass_value, self.virtual_time)
+                self.active.add(user_id)
+            site.tasks.push(task_item)
+
+    def discard(self, task_item: TaskItem):
+        with self.lock:
+            user_id, site_id = task_item.user_id, task_item.site_id
+            user = self.users.get(user_id)
+            site = user.children.get(site_id) if user else None
+            if site is None or site.tasks.remove(task_item.task_id) is None:
+                return
+            if not site.tasks:
+                user.active.discard(site_id)
+                if not user.active:
+                    self.active.discard(user_id)
+
+    def clear(self):
+        with self.lock:
+            for user in self.users.values():
+                for site in user.children.values():
+                    site.tasks.clear()
+                user.active.clear()
+            self.active.clear()
+
+    # 调度接口
+
+    def select(self, site_filter: Callable = None) -> Optional[TaskItem]:
+        """选择下一个应派发的任务（不移除）
+
+        site_filter(site_id) 返回False的站点本次跳过（如站点并发已满）。
+        """
+        with self.lock:
+            if site_filter is None:
+                if not self.active:
+                    return None
+                user = min((self.users[user_id] for user_id in self.active),
+                           key=lambda flow: flow.pass_value)
+                site = min((user.children[site_id] for site_id in user.active),
+                           key=lambda flow: flow.pass_value)
+                return site.tasks.peek()
+
+            best_user, best_sites = None, None
+            for user_id in self.active:
+                user = self.users[user_id]
+                if best_user is not None and user.pass_value >= best_user.pass_value:
+                    continue
+                sites = [user.children[site_id] for site_id in user.active if site_filter(site_id)]
+                if sites:
+                    best_user, best_sites = user, sites
+            if best_user is None:
+                return None
+            return min(best_sites, key=lambda flow: flow.pass_value).tasks.peek()
+
+    def charge(self, task_item: TaskItem):
+        """任务派发时按预估字节数预扣，并推进虚拟时间"""
+        with self.lock:
+            user = self.users.get(task_item.user_id)
+            site = user.children.get(task_item.site_id) if user else None
+            if site is None:
+                return
+            self.virtual_time = max(self.virtual_time, user.pass_value)
+            user.virtual_time = max(user.virtual_time, site.pass_value)
+
+            estimated = self.estimate_bytes(task_item)
+            self._account(task_item.user_id, task_item.site_id, estimated)
+            self.charges[task_item.task_id] = (task_item.user_id, task_item.site_id, estimated)
+
+    def settle(self, task_id: str, transferred_bytes: int):
+        """任务结束、让出或未能启动时按实际字节数结算预扣额"""
+        with self.lock:
+            charge = self.charges.pop(task_id, None)
+            if charge is not None:
+                user_id, site_id, estimated = charge
+                self._account(user_id, site_id, transferred_bytes - estimated)
+
+    def estimate_bytes(self, task_item: TaskItem) -> int:
+        return task_item.total_bytes or self.default_task_bytes
+
+    def _account(self, user_id, site_id, nbytes: float):
+        user = self.users[user_id]
+        user.pass_value += nbytes / self.user_weights.get(user_id, 1)
+        user.children[site_id].pass_value += nbytes / self.site_weights.get(site_id, 1)
+
+    # 配置
+
+    def set_weights(self, user_weights: Dict = None, site_weights: Dict = None):
+        """设置用户/站点权重，权重越大分得的带宽越多"""
+        with self.lock:
+            if user_weights is not None:
+                self.user_weights = {int(k): float(v) for k, v in user_weights.items() if float(v) > 0}
+            if site_weights is not None:
+                self.site_weights = {int(k): float(v) for k, v in site_weights.items() if float(v) > 0}
+
+    def apply_config(self, get_config: Callable):
+        """从系统配置加载权重，get_config 形如 SystemConfig.get_config"""
+        self.set_weights(
+            get_config('scheduler.fair_share.user_weights', {}) or {},
+            get_config('scheduler.fair_share.site_weights', {}) or {}
+        )
+        self.default_task_bytes = get_config('scheduler.fair_share.default_task_bytes',
+                                             self.default_task_bytes)
+
+    def get_status(self) -> Dict:
+        """各活跃流的权重、已服务量和等待任务数"""
+        with self.lock:
+            return {
+                "virtual_time": self.virtual_time,
+                "users": {
+                    str(user_id): {
+                        "weight": self.user_weights.get(user_id, 1),
+                        "pass": self.users[user_id].pass_value,
+                        "sites": {
+                            str(site_id): {
+                                "weight": self.site_weights.get(site_id, 1),
+                                "pass": self.users[user_id].children[site_id].pass_value,
+                                "waiting_tasks": len(self.users[user_id].children[site_id].tasks)
+                            }
+                            for site_id in self.users[user_id].active
+                        }
+                    }
+                    for user_id in self.active
+                }
+            }
@@ -0,0 +1,213 @@
+import threading
+from typing import Dict, List, Optional
+
+from .priority_queue import TaskItem, TaskPriority
+
+class Histogram:
+    """HDR风格的固定桶直方图，记录非负整数
+
+    小于 2^precision_bits 的值每个值一个桶（精确）；更大的值按2的幂分段，每段再线性分为
+    2^(precision_bits-1) 个桶，相对误差不超过 1/2^(precision_bits-1)。桶数固定，记录为 O(1)，
+    超过 2^max_bits 的值计入最后一个桶。
+    """
+
+    def __init__(self, precision_bits: int = 5, max_bits: int = 40):
+        self.precision_bits = precision_bits
+        self.max_bits = max_bits
+        self.linear = 1 << precision_bits  # 精确记录的值的个数
+        self.half = self.linear >> 1  # 每个2的幂分段的桶数
+        self.counts = [0] * (self.linear + (max_bits - precision_bits) * self.half)
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def _index(self, value: int) -> int:
+        if value < self.linear:
+            return value
+        shift = value.bit_length() - self.precision_bits
+        index = self.linear + (shift - 1) * self.half + (value >> shift) - self.half
+        return min(index, len(self.counts) - 1)
+
+    def _bucket_range(self, index: int) -> tuple:
+        """桶覆盖的值范围 [low, high]"""
+        if index < self.linear:
+            return index, index
+        shift = (index - self.linear) // self.half + 1
+        top = (index - self.linear) % self.half + self.half
+        return top << shift, ((top + 1) << shift) - 1
+
+    def record(self, value: float, count: int = 1):
+        value = max(int(value), 0)
+        self.counts[self._index(value)] += count
+        self.count += count
+        self.total += value * count
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def percentile(self, percent: float) -> Optional[float]:
+        """百分位数，返回所在桶的中点（不超出实际记录的最小、最大值）"""
+        return self.percentiles([percent])[0]
+
+    def percentiles(self, percents: List[float]) -> List[Optional[float]]:
+        """一次扫描计算多个百分位数，percents 需从小到大"""
+        if not self.count:
+            return [None] * len(percents)
+        results = []
+        ranks = iter(max(percent / 100 * self.count, 1) for percent in percents)
+        rank = next(ranks)
+        seen = 0
+        for index, bucket_count in enumerate(self.counts):
+            seen += bucket_count
+            while rank is not None and seen >= rank:
+                low, high = self._bucket_range(index)
+                results.append(min(max((low + high) / 2, self.min), self.max))
+                rank = next(ranks, None)
+            if rank is None:
+                break
+        return results + [self.max] * (len(percents) - len(results))
+
+    def mean(self) -> Optional[float]:
+        return self.total / self.count if self.count else None
+
+    def merge(self, other: "Histogram"):
+        for index, bucket_count in enumerate(other.counts):
+            self.counts[index] += bucket_count
+        self.count += other.count
+        self.total += other.total
+        if other.count:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+            self.max = other.max if self.max is None else max(self.max, other.max)
+
+    def summary(self, scale: float = 1.0) -> Dict:
+        """统计摘要，各值除以 scale（如毫秒换算为秒）"""
+        def scaled(value):
+            return value / scale if value is not None else None
+        p50, p90, p99, p999 = self.percentiles([50, 90, 99, 99.9])
+        return {
+            "count": self.count,
+            "mean": scaled(self.mean()),
+            "min": scaled(self.min),
+            "p50": scaled(p50),
+            "p90": scaled(p90),
+            "p99": scaled(p99),
+            "p999": scaled(p999),
+            "max": scaled(self.max)
+        }
+
+    def buckets(self, scale: float = 1.0) -> List[tuple]:
+        """非空桶 (下界, 上界, 计数)，用于导出完整分布"""
+        return [(*(bound / scale for bound in self._bucket_range(index)), bucket_count)
+                for index, bucket_count in enumerate(self.counts) if bucket_count]
+
+class _TaskTimes:
+    """任务在多次执行（让出、抢占、重试）之间累计的时间"""
+    __slots__ = ("queued_at", "wait", "run", "preemptions")
+
+    def __init__(self, queued_at: float):
+        self.queued_at = queued_at
+        self.wait = 0.0
+        self.run = 0.0
+        self.preemptions = 0
+
+class SchedulerMetrics:
+    """调度指标：每个任务结束时把排队等待时间、执行时间、被抢占次数和传输字节数
+    记入全局、按优先级、按站点三组直方图
+
+    等待时间为任务在队列中的总时间（让出或被抢占后重新排队的时间也计入，重试的退避等待不计入），
+    执行时间为各次执行的时间之和。时间以毫秒记录。
+    """
+
+    METRICS = ("wait_seconds", "run_seconds", "preemptions", "bytes")
+    SCALES = {"wait_seconds": 1000, "run_seconds": 1000, "preemptions": 1, "bytes": 1}
+
+    def __init__(self):
+        self.tasks = {}  # task_id -> _TaskTimes，已派发过、尚未结束的任务
+        self.overall = self._new_group()
+        self.by_priority = {}  # priority -> {指标: Histogram}
+        self.by_site = {}  # site_id -> {指标: Histogram}
+        self.lock = threading.Lock()
+
+    def _new_group(self) -> Dict[str, Histogram]:
+        return {metric: Histogram() for metric in self.METRICS}
+
+    def on_dispatch(self, task_item: TaskItem, started_at: float):
+        with self.lock:
+            times = self.tasks.get(task_item.task_id)
+            if times is None:
+                times = self.tasks[task_item.task_id] = _TaskTimes(task_item.created_at)
+            times.wait += max(started_at - times.queued_at, 0.0)
+
+    def on_pause(self, execution, now: float, preempted: bool):
+        """任务让出、被抢占或失败等待重试，重新开始计算排队时间"""
+        with self.lock:
+            times = self.tasks.get(execution.task_item.task_id)
+            if times is None:
+                return
+            times.run += max(now - execution.started_at, 0.0)
+            times.queued_at = now
+            if preempted:
+                times.preemptions += 1
+
+    def on_requeue(self, task_id: str, now: float):
+        """重试任务退避结束、回到队列"""
+        with self.lock:
+            times = self.tasks.get(task_id)
+            if times is not None:
+                times.queued_at = now
+
+    def on_finish(self, execution, now: float):
+        """任务完成或最终失败，记入直方图"""
+        task_item = execution.task_item
+        with self.lock:
+            times = self.tasks.pop(task_item.task_id, None)
+            if times is None:
+                return
+            times.run += max(now - execution.started_at, 0.0)
+            values = {
+                "wait_seconds": times.wait * 1000,
+                "run_seconds": times.run * 1000,
+                "preemptions": times.preemptions,
+                "bytes": task_item.transferred_bytes + execution.transferred_bytes
+            }
+            groups = [self.overall, self.by_priority.get(task_item.priority),
+                      self.by_site.get(task_item.site_id)]
+            if groups[1] is None:
+                groups[1] = self.by_priority[task_item.priority] = self._new_group()
+            if groups[2] is None:
+                groups[2] = self.by_site[task_item.site_id] = self._new_group()
+            for group in groups:
+                for metric, value in values.items():
+                    group[metric].record(value)
+
+    def discard(self, task_id: str):
+        """任务被取消"""
+        with self.lock:
+            self.tasks.pop(task_id, None)
+
+    def mean(self, metric: str) -> float:
+        """全局平均值（时间为秒）"""
+        with self.lock:
+            mean = self.overall[metric].mean()
+        return mean / self.SCALES[metric] if mean is not None else 0
+
+    def _summarize(self, group: Dict[str, Histogram], buckets: bool) -> Dict:
+        summary = {metric: histogram.summary(self.SCALES[metric]) for metric, histogram in group.items()}
+        if buckets:
+            for metric, histogram in group.items():
+                summary[metric]["buckets"] = histogram.buckets(self.SCALES[metric])
+        return summary
+
+    def get_summary(self, buckets: bool = False) -> Dict:
+        """各组直方图的统计摘要，buckets=True 时附带非空桶"""
+        with self.lock:
+            return {
+                "overall": self._summarize(self.overall, buckets),
+                "by_priority": {
+                    TaskPriority.get_priority_name(priority): self._summarize(group, buckets)
+                    for priority, group in sorted(self.by_priority.items())
+                },
+                "by_site": {
+                    str(site_id): self._summarize(group, buckets) for site_id, group in self.by_site.items()
+                }
+            }
@@ -1,9 +1,9 @@
 import heapq
+import math
 import threading
 import time
-from collections import defaultdict
 from dataclasses import dataclass, field
-from typing import Dict, List, Optional
+from typing import Callable, Dict, List, Optional
 from enum import IntEnum
 
 class TaskPriority(IntEnum):
@@ -34,104 +34,421 @@ class TaskItem:
     resource_requirements: Dict = field(default_factory=dict)
     retry_count: int = 0
     max_retries: int = 3
+    task_type: str = "transfer"  # 对应调度器中注册的处理函数
+    payload: Dict = field(default_factory=dict)  # 传给处理函数的参数
+    slices_used: int = 0  # 时间片轮转中已用完的时间片数
+    user_id: Optional[int] = None  # 提交任务的用户，用于公平共享
+    site_id: Optional[int] = None  # 目标FTP站点，用于公平共享
+    total_bytes: int = 0  # 预估传输字节数，0表示未知
+    transferred_bytes: int = 0  # 之前的执行（被抢占或让出前）已传输的字节数
+    deadline: Optional[float] = None  # 截止时间（时间戳），用于最早截止时间优先调度
+    level_since: Optional[float] = None  # 进入当前优先级的时间，用于老化
+    aged_levels: int = 0  # 因等待过久被提升的级数
     
     def __lt__(self, other):
         # 优先级数字越小，优先级越高
         if self.priority != other.priority:
             return self.priority < other.priority
+        # 时间片轮转：让出时间片的任务排到同优先级未运行过的任务之后
+        if self.slices_used != other.slices_used:
+            return self.slices_used < other.slices_used
         # 同优先级按创建时间排序（FIFO）
         return self.created_at < other.created_at
 
+class IndexedHeap:
+    """带位置索引的二叉最小堆
+    
+    维护 key -> 堆中下标 的映射，支持 O(log n) 的删除和调整优先级（上浮/下沉），
+    不需要延迟删除标记。元素之间通过 < 比较。
+    """
+    
+    def __init__(self, key_func=lambda item: item.task_id):
+        self.heap = []
+        self.positions = {}  # key -> 堆中下标
+        self.key_func = key_func
+    
+    def push(self, item):
+        """插入元素，key已存在时先移除旧元素"""
+        key = self.key_func(item)
+        if key in self.positions:
+            self.remove(key)
+        self.heap.append(item)
+        self.positions[key] = len(self.heap) - 1
+        self._sift_up(len(self.heap) - 1)
+    
+    def pop(self):
+        """弹出最小元素"""
+        if not self.heap:
+            return None
+        return self._remove_at(0)
+    
+    def peek(self):
+        """查看最小元素但不移除"""
+        return self.heap[0] if self.heap else None
+    
+    def get(self, key):
+        """按key获取元素"""
+        index = self.positions.get(key)
+        return self.heap[index] if index is not None else None
+    
+    def remove(self, key):
+        """按key删除元素，返回被删除的元素"""
+        index = self.positions.get(key)
+        if index is None:
+            return None
+        return self._remove_at(index)
+    
+    def update(self, key) -> bool:
+        """元素排序字段被修改后调用，恢复堆序"""
+        index = self.positions.get(key)
+        if index is None:
+            return False
+        index = self._sift_up(index)
+        self._sift_down(index)
+        return True
+    
+    def extend(self, items):
+        """批量插入元素，追加后整体重建堆，O(n + k)
+        
+        调用方需保证items中的key不在堆中且互不重复。
+        """
+        self.heap.extend(items)
+        self._heapify()
+    
+    def remove_where(self, predicate) -> list:
+        """删除满足条件的所有元素并整体重建堆，返回被删除的元素"""
+        kept = []
+        removed = []
+        for item in self.heap:
+            (removed if predicate(item) else kept).append(item)
+        if removed:
+            self.heap = kept
+            self._heapify()
+        return removed
+    
+    def clear(self):
+        self.heap.clear()
+        self.positions.clear()
+    
+    def _heapify(self):
+        """整体恢复堆序后重建位置索引"""
+        heapq.heapify(self.heap)
+        self.positions = {self.key_func(item): i for i, item in enumerate(self.heap)}
+    
+    def _remove_at(self, index):
+        last_index = len(self.heap) - 1
+        if index != last_index:
+            self._swap(index, last_index)
+        item = self.heap.pop()
+        del self.positions[self.key_func(item)]
+        if index < len(self.heap):
+            index = self._sift_up(index)
+            self._sift_down(index)
+        return item
+    
+    def _swap(self, i, j):
+        heap = self.heap
+        heap[i], heap[j] = heap[j], heap[i]
+        self.positions[self.key_func(heap[i])] = i
+        self.positions[self.key_func(heap[j])] = j
+    
+    def _sift_up(self, index):
+        heap = self.heap
+        while index > 0:
+            parent = (index - 1) >> 1
+            if heap[index] < heap[parent]:
+                self._swap(index, parent)
+                index = parent
+            else:
+                break
+        return index
+    
+    def _sift_down(self, index):
+        heap = self.heap
+        size = len(heap)
+        while True:
+            smallest = index
+            left = 2 * index + 1
+            right = left + 1
+            if left < size and heap[left] < heap[smallest]:
+                smallest = left
+            if right < size and heap[right] < heap[smallest]:
+                smallest = right
+            if smallest == index:
+                return index
+            self._swap(index, smallest)
+            index = smallest
+    
+    def __len__(self):
+        return len(self.heap)
+    
+    def __bool__(self):
+        return bool(self.heap)
+    
+    def __iter__(self):
+        # 按堆内存储顺序遍历（非排序）
+        return iter(list(self.heap))
+    
+    def __contains__(self, key):
+        return key in self.positions
+
+class _KeyedEntry:
+    """按排序键比较的堆元素"""
+    __slots__ = ("sort_key", "item")
+    
+    def __init__(self, sort_key, item):
+        self.sort_key = sort_key
+        self.item = item
+    
+    def __lt__(self, other):
+        return self.sort_key < other.sort_key
+
+class KeyedTaskIndex:
+    """按自定义排序键维护的任务二级索引（如截止时间、剩余字节数）
+    
+    排序键在任务入队时计算；任务的排序字段在队列中被修改后需调用 refresh。
+    """
+    
+    def __init__(self, sort_key: Callable[[TaskItem], tuple]):
+        self.sort_key = sort_key
+        self.heap = IndexedHeap(key_func=lambda entry: entry.item.task_id)
+        self.lock = threading.Lock()
+    
+    def add(self, task_item: TaskItem):
+        with self.lock:
+            self.heap.push(_KeyedEntry(self.sort_key(task_item), task_item))
+    
+    def discard(self, task_item: TaskItem):
+        with self.lock:
+            self.heap.remove(task_item.task_id)
+    
+    def clear(self):
+        with self.lock:
+            self.heap.clear()
+    
+    def refresh(self, task_item: TaskItem):
+        """重新计算任务的排序键"""
+        with self.lock:
+            if task_item.task_id in self.heap:
+                self.heap.push(_KeyedEntry(self.sort_key(task_item), task_item))
+    
+    def peek(self) -> Optional[TaskItem]:
+        with self.lock:
+            entry = self.heap.peek()
+            return entry.item if entry else None
+    
+    def __len__(self):
+        return len(self.heap)
+
 class PriorityTaskQueue:
     """多级优先级任务队列"""
     
     def __init__(self):
         self.queues = {
-            TaskPriority.CRITICAL: [],
-            TaskPriority.HIGH: [],
-            TaskPriority.NORMAL: [],
-            TaskPriority.LOW: [],
-            TaskPriority.BACKGROUND: []
+            TaskPriority.CRITICAL: IndexedHeap(),
+            TaskPriority.HIGH: IndexedHeap(),
+            TaskPriority.NORMAL: IndexedHeap(),
+            TaskPriority.LOW: IndexedHeap(),
+            TaskPriority.BACKGROUND: IndexedHeap()
         }
         self.lock = threading.RLock()
+        self.not_empty = threading.Condition(self.lock)  # 有新任务时唤醒阻塞的get
         self.task_index = {}  # task_id -> TaskItem 映射
-        self.queue_stats = defaultdict(int)  # 队列统计信息
+        self.listeners = []  # put/update_priority 时调用的回调（如唤醒调度器）
+        self.indexes = []  # 二级索引（如公平共享），随任务入队/出队同步维护
+    
+    def add_listener(self, callback: Callable[[], None]):
+        """注册任务到达通知回调，回调在持锁状态下调用，应尽量轻量"""
+        with self.lock:
+            self.listeners.append(callback)
+    
+    def add_index(self, index):
+        """注册二级索引，索引需实现 add(task_item)、discard(task_item)、clear()
+        
+        回调在持锁状态下调用；注册时用队列中已有的任务初始化索引。
+        """
+        with self.lock:
+            self.indexes.append(index)
+            for task_item in self.task_index.values():
+                index.add(task_item)
+    
+    def _index_add(self, task_item: TaskItem):
+        for index in self.indexes:
+            index.add(task_item)
+    
+    def _index_discard(self, task_item: TaskItem):
+        for index in self.indexes:
+            index.discard(task_item)
+    
+    def _notify_locked(self):
+        """唤醒等待中的消费者和监听者（调用方需持有锁）"""
+        self.not_empty.notify_all()
+        for callback in self.listeners:
+            callback()
         
-    def put(self, task_item: TaskItem):
-        """添加任务到队列"""
+    def put(self, task_item: TaskItem, notify: bool = True):
+        """添加任务到队列（同一task_id重复添加时替换原任务）
+        
+        notify=False 用于调度器把暂时无法启动的任务放回队列，避免唤醒自身造成空转。
+        """
         with self.lock:
-            heapq.heappush(self.queues[task_item.priority], task_item)
+            if task_item.task_id in self.task_index:
+                self._remove_locked(task_item.task_id)
+            self.queues[task_item.priority].push(task_item)
             self.task_index[task_item.task_id] = task_item
-            self.queue_stats[task_item.priority] += 1
+            self._index_add(task_item)
+            if notify:
+                self._notify_locked()
+    
+    def put_many(self, task_items: List[TaskItem], notify: bool = True):
+        """批量添加任务，只获取一次锁
+        
+        新增数量相对堆规模较大时直接追加并整体重建堆（线性时间），否则逐个插入。
+        """
+        with self.lock:
+            # 同一批内重复的task_id以最后一个为准
+            latest = {}
+            for task_item in task_items:
+                latest[task_item.task_id] = task_item
+            
+            by_priority = {}
+            for task_id, task_item in latest.items():
+                if task_id in self.task_index:
+                    self._remove_locked(task_id)
+                self.task_index[task_id] = task_item
+                by_priority.setdefault(task_item.priority, []).append(task_item)
+            
+            for priority, new_items in by_priority.items():
+                heap = self.queues[priority]
+                total = len(heap) + len(new_items)
+                if len(new_items) * math.log2(total + 1) > total:
+                    heap.extend(new_items)
+                else:
+                    for task_item in new_items:
+                        heap.push(task_item)
             
-    def get(self, priority_filter: List[int] = None) -> Optional[TaskItem]:
-        """从队列中获取任务"""
+            for task_item in latest.values():
+                self._index_add(task_item)
+            
+            if task_items and notify:
+                self._notify_locked()
+    
+    def remove_many(self, task_ids: List[str]) -> int:
+        """批量移除任务，只获取一次锁，返回实际移除的数量"""
+        with self.lock:
+            targets = {task_id for task_id in task_ids if task_id in self.task_index}
+            if not targets:
+                return 0
+            
+            # 移除比例较大时整体过滤重建，否则逐个删除
+            if len(targets) * 8 > len(self.task_index):
+                self.remove_where(lambda task_item: task_item.task_id in targets)
+            else:
+                for task_id in targets:
+                    self._remove_locked(task_id)
+            return len(targets)
+    
+    def remove_where(self, predicate: Callable[[TaskItem], bool]) -> List[TaskItem]:
+        """移除所有满足条件的任务（线性时间），返回被移除的任务"""
+        with self.lock:
+            removed = []
+            for heap in self.queues.values():
+                removed.extend(heap.remove_where(predicate))
+            for task_item in removed:
+                del self.task_index[task_item.task_id]
+                self._index_discard(task_item)
+            return removed
+    
+    def _has_task_locked(self, priorities: List[int]) -> bool:
+        return any(self.queues[priority] for priority in priorities)
+    
+    def _pop_locked(self, priorities: List[int]) -> Optional[TaskItem]:
+        for priority in priorities:
+            if self.queues[priority]:
+                task_item = self.queues[priority].pop()
+                del self.task_index[task_item.task_id]
+                self._index_discard(task_item)
+                return task_item
+        return None
+            
+    def get(self, priority_filter: List[int] = None, timeout: float = None) -> Optional[TaskItem]:
+        """从队列中获取任务
+        
+        timeout为None时不等待（队列为空直接返回None）；否则最多阻塞timeout秒等待新任务。
+        """
         with self.lock:
             # 如果指定了优先级过滤器，只从这些队列中获取
             priorities = priority_filter or [1, 2, 3, 4, 5]
             
-            for priority in priorities:
-                if self.queues[priority]:
-                    task_item = heapq.heappop(self.queues[priority])
-                    # 检查是否是已删除的任务
-                    if task_item.task_id.startswith("DELETED_"):
-                        continue
-                    
-                    if task_item.task_id in self.task_index:
-                        del self.task_index[task_item.task_id]
-                        self.queue_stats[priority] -= 1
-                        return task_item
-            return None
+            if timeout is not None:
+                self.not_empty.wait_for(lambda: self._has_task_locked(priorities), timeout)
+            return self._pop_locked(priorities)
+    
+    def get_batch(self, n: int, priority_filter: List[int] = None, timeout: float = None) -> List[TaskItem]:
+        """一次取出最多n个任务（按优先级顺序），timeout含义同get"""
+        with self.lock:
+            priorities = priority_filter or [1, 2, 3, 4, 5]
+            
+            if timeout is not None:
+                self.not_empty.wait_for(lambda: self._has_task_locked(priorities), timeout)
+            
+            batch = []
+            while len(batch) < n:
+                task_item = self._pop_locked(priorities)
+                if task_item is None:
+                    break
+                batch.append(task_item)
+            return batch
     
     def remove(self, task_id: str) -> bool:
         """从队列中移除指定任务"""
         with self.lock:
-            if task_id not in self.task_index:
-                return False
-                
-            task_item = self.task_index[task_id]
-            
-            # 标记为已删除（延迟删除）
-            task_item.task_id = f"DELETED_{task_id}"
-            del self.task_index[task_id]
-            self.queue_stats[task_item.priority] -= 1
-            return True
+            return self._remove_locked(task_id) is not None
+    
+    def _remove_locked(self, task_id: str) -> Optional[TaskItem]:
+        """移除任务（调用方需持有锁）"""
+        task_item = self.task_index.pop(task_id, None)
+        if task_item is None:
+            return None
+        self.queues[task_item.priority].remove(task_id)
+        self._index_discard(task_item)
+        return task_item
     
     def update_priority(self, task_id: str, new_priority: int) -> bool:
         """更新任务优先级"""
         with self.lock:
-            if task_id not in self.task_index:
+            task_item = self.task_index.get(task_id)
+            if task_item is None:
                 return False
-                
-            # 移除旧任务
-            old_task = self.task_index[task_id]
-            old_priority = old_task.priority
-            self.remove(task_id)
+            if task_item.priority == new_priority:
+                return True
             
-            # 添加新优先级任务
-            old_task.priority = new_priority
-            old_task.task_id = task_id  # 恢复原始ID
-            self.put(old_task)
+            # 从旧优先级堆中删除后加入新优先级堆，均为 O(log n)
+            self.queues[task_item.priority].remove(task_id)
+            self._index_discard(task_item)
+            task_item.priority = new_priority
+            task_item.level_since = None  # 在新优先级重新计时
+            self.queues[new_priority].push(task_item)
+            self._index_add(task_item)
+            self._notify_locked()
             return True
     
     def peek(self, priority: int = None) -> Optional[TaskItem]:
         """查看队列顶部任务但不移除"""
         with self.lock:
             if priority is not None:
-                if self.queues[priority]:
-                    return self.queues[priority][0]
-            else:
-                for p in [1, 2, 3, 4, 5]:
-                    if self.queues[p]:
-                        return self.queues[p][0]
+                return self.queues[priority].peek()
+            for p in [1, 2, 3, 4, 5]:
+                if self.queues[p]:
+                    return self.queues[p].peek()
             return None
     
     def size(self, priority: int = None) -> int:
         """获取队列大小"""
         with self.lock:
             if priority is not None:
-                return self.queue_stats[priority]
-            return sum(self.queue_stats.values())
+                return len(self.queues[priority])
+            return len(self.task_index)
     
     def is_empty(self, priority: int = None) -> bool:
         """检查队列是否为空"""
@@ -140,16 +457,17 @@ class PriorityTaskQueue:
     def get_queue_status(self) -> Dict:
         """获取队列状态"""
         with self.lock:
-            total_tasks = sum(self.queue_stats.values())
+            queue_lengths = {priority: len(heap) for priority, heap in self.queues.items()}
+            total_tasks = len(self.task_index)
             return {
-                "queue_lengths": dict(self.queue_stats),
+                "queue_lengths": queue_lengths,
                 "total_tasks": total_tasks,
                 "priority_distribution": {
                     priority: {
                         "count": count,
                         "percentage": count / max(total_tasks, 1) * 100
                     }
-                    for priority, count in self.queue_stats.items()
+                    for priority, count in queue_lengths.items()
                 }
             }
     
@@ -157,42 +475,44 @@ class PriorityTaskQueue:
         """获取等待中的任务列表"""
         with self.lock:
             if priority is not None:
-                return [task for task in self.queues[priority] 
-                       if not task.task_id.startswith("DELETED_")]
+                return list(self.queues[priority])
             
             all_tasks = []
             for p in [1, 2, 3, 4, 5]:
-                all_tasks.extend([task for task in self.queues[p] 
-                                if not task.task_id.startswith("DELETED_")])
+                all_tasks.extend(self.queues[p])
             return sorted(all_tasks)
     
+    def get_task(self, task_id: str) -> Optional[TaskItem]:
+        """按task_id获取等待中的任务"""
+        with self.lock:
+            return self.task_index.get(task_id)
+    
+    def contains(self, task_id: str) -> bool:
+        """检查任务是否在队列中"""
+        with self.lock:
+            return task_id in self.task_index
+    
     def clear(self, priority: int = None):
         """清空队列"""
         with self.lock:
             if priority is not None:
+                for task_item in self.queues[priority]:
+                    del self.task_index[task_item.task_id]
+                    self._index_discard(task_item)
                 self.queues[priority].clear()
-                self.queue_stats[priority] = 0
-                # 清理task_index中对应的任务
-                to_remove = [task_id for task_id, task in self.task_index.items() 
-                           if task.priority == priority]
-                for task_id in to_remove:
-                    del self.task_index[task_id]
             else:
                 for p in [1, 2, 3, 4, 5]:
                     self.queues[p].clear()
-                    self.queue_stats[p] = 0
                 self.task_index.clear()
+                for index in self.indexes:
+                    index.clear()
     
     def cleanup_deleted_tasks(self):
-        """清理已标记删除的任务"""
-        with self.lock:
-            for priority in [1, 2, 3, 4, 5]:
-                # 重建队列，过滤掉已删除的任务
-                valid_tasks = [task for task in self.queues[priority] 
-                             if not task.task_id.startswith("DELETED_")]
-                self.queues[priority] = valid_tasks
-                heapq.heapify(self.queues[priority])
-                self.queue_stats[priority] = len(valid_tasks)
+        """清理已标记删除的任务
+        
+        索引堆直接删除元素，不再产生删除标记，保留此方法仅为兼容旧调用。
+        """
+        pass
     
     def __len__(self):
         return self.size()
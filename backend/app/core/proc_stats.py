@@ -0,0 +1,206 @@
+import os
+import threading
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+SECTOR_SIZE = 512  # /proc/diskstats 中的扇区固定为512字节
+
+class HostStatsSampler:
+    """从 /proc 采样主机资源使用情况（仅Linux，其他平台返回None）
+
+    包括CPU使用率、内存、磁盘繁忙度和吞吐量、网络吞吐量以及本进程（含子进程）的RSS。
+    速率类指标取两次 sample() 之间的差值，第一次调用只建立基线。
+    """
+
+    def __init__(self, proc_root: str = "/proc", sys_root: str = "/sys", pid: int = None):
+        self.proc_root = proc_root
+        self.sys_root = sys_root
+        self.pid = pid or os.getpid()
+        self._last_cpu = None  # (busy, total)
+        self._last_disk = None  # (时间, {磁盘: (io_ticks, 读写扇区数)})
+        self._last_net = None  # (时间, 收发字节数)
+
+    def sample(self) -> Dict[str, Optional[float]]:
+        now = time.time()
+        disk = self._disk_stats(now)
+        memory = self._memory()
+        return {
+            "cpu_percent": self._cpu_percent(),
+            "disk_busy_percent": disk[0],
+            "disk_io_mbps": disk[1],
+            "net_kbps": self._net_kbps(now),
+            "memory_total_mb": memory[0],
+            "memory_available_mb": memory[1],
+            "process_rss_mb": self._process_rss_mb()
+        }
+
+    def _read(self, *path) -> Optional[str]:
+        try:
+            with open(os.path.join(self.proc_root, *path)) as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _read_cpu(self) -> Optional[Tuple[int, int]]:
+        try:
+            with open(os.path.join(self.proc_root, "stat")) as f:
+                fields = f.readline().split()
+        except OSError:
+            return None
+        if not fields or fields[0] != "cpu":
+            return None
+        values = [int(value) for value in fields[1:]]
+        # user nice system idle iowait irq softirq steal ...，idle和iowait视为空闲
+        total = sum(values[:8])
+        idle = values[3] + (values[4] if len(values) > 4 else 0)
+        return total - idle, total
+
+    def _cpu_percent(self) -> Optional[float]:
+        current = self._read_cpu()
+        last, self._last_cpu = self._last_cpu, current
+        if current is None or last is None or current[1] <= last[1]:
+            return None
+        return (current[0] - last[0]) / (current[1] - last[1]) * 100
+
+    def _read_disks(self) -> Optional[Dict[str, Tuple[int, int]]]:
+        content = self._read("diskstats")
+        if content is None:
+            return None
+        disks = {}
+        for line in content.splitlines():
+            fields = line.split()
+            if len(fields) < 13:
+                continue
+            name = fields[2]
+            # 只统计整块磁盘，跳过分区和loop/ram设备
+            if name.startswith(("loop", "ram")) or not os.path.exists(
+                    os.path.join(self.sys_root, "block", name)):
+                continue
+            # io_ticks: 有I/O进行的毫秒数；第6、10列为读、写扇区数
+            disks[name] = (int(fields[12]), int(fields[5]) + int(fields[9]))
+        return disks
+
+    def _disk_stats(self, now: float) -> Tuple[Optional[float], Optional[float]]:
+        """返回 (最繁忙磁盘的繁忙百分比, 所有磁盘合计读写 MB/s)"""
+        current = self._read_disks()
+        last, self._last_disk = self._last_disk, (now, current) if current is not None else None
+        if current is None or last is None or now <= last[0]:
+            return None, None
+        elapsed = now - last[0]
+        common = [name for name in current if name in last[1]]
+        if not common:
+            return None, None
+        busy = max(current[name][0] - last[1][name][0] for name in common)
+        sectors = sum(current[name][1] - last[1][name][1] for name in common)
+        return (min(busy / (elapsed * 1000) * 100, 100.0),
+                sectors * SECTOR_SIZE / elapsed / (1024 * 1024))
+
+    def _net_kbps(self, now: float) -> Optional[float]:
+        """除回环接口外所有网卡的收发合计 KB/s"""
+        content = self._read("net", "dev")
+        current = None
+        if content is not None:
+            current = 0
+            for line in content.splitlines()[2:]:
+                name, _, data = line.partition(":")
+                fields = data.split()
+                if name.strip() == "lo" or len(fields) < 9:
+                    continue
+                current += int(fields[0]) + int(fields[8])  # 接收字节数、发送字节数
+        last, self._last_net = self._last_net, (now, current) if current is not None else None
+        if current is None or last is None or now <= last[0]:
+            return None
+        return max(current - last[1], 0) / (now - last[0]) / 1024
+
+    def _memory(self) -> Tuple[Optional[float], Optional[float]]:
+        """返回 (总内存 MB, 可用内存 MB)"""
+        content = self._read("meminfo")
+        if content is None:
+            return None, None
+        values = {}
+        for line in content.splitlines():
+            key, _, value = line.partition(":")
+            fields = value.split()
+            if fields:
+                values[key] = int(fields[0])  # 单位 kB
+        total = values.get("MemTotal")
+        available = values.get("MemAvailable", values.get("MemFree"))
+        return (total / 1024 if total is not None else None,
+                available / 1024 if available is not None else None)
+
+    def _rss_kb(self, pid: int) -> Optional[int]:
+        content = self._read(str(pid), "status")
+        for line in (content or "").splitlines():
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+        return None
+
+    def _process_rss_mb(self) -> Optional[float]:
+        """本进程及其直接子进程（如进程池工作进程）的RSS合计 MB"""
+        rss = self._rss_kb(self.pid)
+        if rss is None:
+            return None
+        children = self._read(str(self.pid), "task", str(self.pid), "children") or ""
+        for child in children.split():
+            rss += self._rss_kb(int(child)) or 0
+        return rss / 1024
+
+class Ewma:
+    """指数加权移动平均，alpha越大越跟随最新值"""
+
+    def __init__(self, alpha: float = 0.3):
+        self.alpha = alpha
+        self.value = None
+
+    def update(self, sample: Optional[float]) -> Optional[float]:
+        """加入一个采样值，None（本次未采到）保持原值"""
+        if sample is not None:
+            self.value = sample if self.value is None else self.alpha * sample + (1 - self.alpha) * self.value
+        return self.value
+
+class ResourceUsageSampler:
+    """后台定时采样主机资源，平滑后通过 callback(measured) 上报
+
+    measured 与 HostStatsSampler.sample() 的键相同，值为EWMA平滑后的结果（尚无数据时为None）。
+    """
+
+    def __init__(self, callback: Callable[[Dict], None], interval: float = 2.0, alpha: float = 0.3,
+                 host_sampler: HostStatsSampler = None):
+        self.callback = callback
+        self.interval = interval
+        self.host_sampler = host_sampler or HostStatsSampler()
+        self.alpha = alpha
+        self.averages = {}  # 指标名 -> Ewma
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self.host_sampler.sample()  # 建立基线
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=self.interval + 1)
+            self._thread = None
+
+    def sample_once(self) -> Dict[str, Optional[float]]:
+        measured = {}
+        for name, value in self.host_sampler.sample().items():
+            average = self.averages.get(name)
+            if average is None:
+                average = self.averages[name] = Ewma(self.alpha)
+            measured[name] = average.update(value)
+        self.callback(measured)
+        return measured
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.sample_once()
+            except Exception as e:
+                print(f"资源采样错误: {e}")
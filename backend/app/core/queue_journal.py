@@ -0,0 +1,339 @@
+import json
+import os
+import threading
+from dataclasses import MISSING, fields
+from datetime import datetime, timezone
+from typing import List
+
+from .priority_queue import TaskItem
+
+def _field_defaults() -> dict:
+    defaults = {}
+    for field in fields(TaskItem):
+        if field.default is not MISSING:
+            defaults[field.name] = field.default
+        elif field.default_factory is not MISSING:
+            defaults[field.name] = field.default_factory()
+    return defaults
+
+TASK_FIELDS = {field.name for field in fields(TaskItem)}
+TASK_DEFAULTS = _field_defaults()
+
+def task_to_record(task_item: TaskItem) -> dict:
+    """任务项转为可JSON序列化的字典，省略取默认值的字段"""
+    return {name: value for name, value in vars(task_item).items()
+            if name in TASK_FIELDS and (name not in TASK_DEFAULTS or value != TASK_DEFAULTS[name])}
+
+def task_from_record(record: dict) -> TaskItem:
+    return TaskItem(**{name: value for name, value in record.items() if name in TASK_FIELDS})
+
+class QueueJournal:
+    """调度队列日志接口：记录任务入队、派发和结束事件，进程重启后据此恢复队列
+
+    默认实现不做任何记录。事件在调度线程中产生，实现应只做内存操作，
+    由后台线程批量落盘，避免拖慢调度。
+    """
+
+    def record_enqueue(self, task_items: List[TaskItem]):
+        """任务进入队列（新任务，或让出时间片、被抢占后重新排队）"""
+        pass
+
+    def record_dispatch(self, task_id: str):
+        """任务开始执行"""
+        pass
+
+    def record_complete(self, task_id: str, status: str):
+        """任务结束，status 为 completed / failed / cancelled"""
+        pass
+
+    def recover(self) -> List[TaskItem]:
+        """返回重启前尚未结束的任务（包括当时正在执行的任务），用于重建队列"""
+        return []
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+class BatchedQueueJournal(QueueJournal):
+    """先写入内存缓冲区，由后台线程每隔 flush_interval 秒或攒满 batch_size 条后批量写出"""
+
+    def __init__(self, flush_interval: float = 0.2, batch_size: int = 1000):
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.buffer = []
+        self.lock = threading.Lock()
+        self.write_lock = threading.Lock()  # 保证批次按顺序写出
+        self._wakeup = threading.Event()
+        self._running = True
+        self._flusher = threading.Thread(target=self._flush_loop, daemon=True)
+        self._flusher.start()
+
+    def _append(self, records: List):
+        with self.lock:
+            self.buffer.extend(records)
+            full = len(self.buffer) >= self.batch_size
+        if full:
+            self._wakeup.set()
+
+    def record_enqueue(self, task_items: List[TaskItem]):
+        self._append([("enqueue", task_item) for task_item in task_items])
+
+    def record_dispatch(self, task_id: str):
+        self._append([("dispatch", task_id)])
+
+    def record_complete(self, task_id: str, status: str):
+        self._append([("complete", (task_id, status))])
+
+    def flush(self):
+        with self.write_lock:
+            with self.lock:
+                batch, self.buffer = self.buffer, []
+            if batch:
+                try:
+                    self._write(batch)
+                except Exception:
+                    # 写入失败时整批放回缓冲区队首，下次按原顺序重写
+                    with self.lock:
+                        self.buffer[:0] = batch
+                    raise
+
+    def _write(self, batch: List):
+        """写出一批 (事件, 数据) 记录，由子类实现；失败时抛出异常，该批记录会被重写，写入应是幂等的"""
+        raise NotImplementedError
+
+    def _flush_loop(self):
+        while self._running:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"队列日志写入错误: {e}")
+
+    def close(self):
+        self._running = False
+        self._wakeup.set()
+        self._flusher.join(timeout=5)
+        try:
+            self.flush()
+        except Exception as e:
+            print(f"队列日志写入错误: {e}")
+
+class FileQueueJournal(BatchedQueueJournal):
+    """追加写的JSON Lines日志文件
+
+    每行一个事件：入队记录完整的任务项，派发和结束只记录task_id。恢复时顺序重放，
+    未结束的任务即为需要恢复的任务。日志中失效记录超过存活任务数的 compact_ratio 倍时，
+    重写为只包含存活任务的入队记录（写入临时文件后原子替换）。
+    创建时即读取已有日志，recover() 返回其中未结束的任务。
+    无法序列化的记录（如载荷中有非JSON对象）单独丢弃；写入文件失败时撤销对 live 的修改，
+    该批记录留待下次重写。
+    """
+
+    def __init__(self, path: str, fsync: bool = False, compact_ratio: int = 4,
+                 flush_interval: float = 0.2, batch_size: int = 1000):
+        self.path = path
+        self.fsync = fsync
+        self.compact_ratio = compact_ratio
+        self.live = {}  # task_id -> 最后一次入队时的记录
+        self.records = 0  # 日志文件中的记录数
+        self._torn = False  # 上次追加写入失败，文件末尾可能有写了一半的行
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._load()
+        super().__init__(flush_interval, batch_size)
+
+    def _write(self, batch: List):
+        # 先序列化整批记录，再修改 live
+        lines = []
+        changes = []  # (task_id, 入队记录)，记录为None表示任务结束
+        for event, data in batch:
+            try:
+                if event == "enqueue":
+                    record = task_to_record(data)
+                    line = json.dumps({"op": event, "task": record}, ensure_ascii=False)
+                    changes.append((data.task_id, record))
+                elif event == "dispatch":
+                    line = json.dumps({"op": event, "id": data})
+                else:
+                    task_id, status = data
+                    line = json.dumps({"op": event, "id": task_id, "status": status})
+                    changes.append((task_id, None))
+            except (TypeError, ValueError) as e:
+                print(f"队列日志记录无法序列化，已丢弃: {event} {e}")
+                continue
+            lines.append(line)
+        if not lines:
+            return
+
+        undo = []
+        for task_id, record in changes:
+            undo.append((task_id, self.live.get(task_id, MISSING)))
+            if record is None:
+                self.live.pop(task_id, None)
+            else:
+                self.live[task_id] = record
+        try:
+            if self.records + len(lines) > self.compact_ratio * max(len(self.live), 256):
+                self._compact()
+                return
+            with open(self.path, "a", encoding="utf-8") as f:
+                # 上次写了一半的行单独成行，重放时跳过
+                f.write(("\n" if self._torn else "") + "\n".join(lines) + "\n")
+                self._sync(f)
+        except Exception:
+            self._torn = True
+            for task_id, previous in reversed(undo):
+                if previous is MISSING:
+                    self.live.pop(task_id, None)
+                else:
+                    self.live[task_id] = previous
+            raise
+        self._torn = False
+        self.records += len(lines)
+
+    def _sync(self, f):
+        if self.fsync:
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _compact(self):
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            for record in self.live.values():
+                f.write(json.dumps({"op": "enqueue", "task": record}, ensure_ascii=False) + "\n")
+            self._sync(f)
+        os.replace(temp_path, self.path)
+        self.records = len(self.live)
+        self._torn = False
+
+    def _load(self):
+        """重放已有日志，得到未结束的任务"""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                self.records += 1
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # 崩溃时写了一半的最后一行
+                if record["op"] == "enqueue":
+                    self.live[record["task"]["task_id"]] = record["task"]
+                elif record["op"] == "complete":
+                    self.live.pop(record["id"], None)
+
+    def recover(self) -> List[TaskItem]:
+        """日志在创建时已读取，这里只构造任务项；失效记录留到之后的写入时压缩"""
+        with self.write_lock:
+            return [task_from_record(record) for record in self.live.values()]
+
+class DatabaseQueueJournal(BatchedQueueJournal):
+    """把事件批量写回 transfer_tasks 表的 status 字段，重启时从表中重建队列
+
+    task_id 为 TransferTask.id 的字符串形式，其他任务不落库。同一批次中同一任务只保留最后的状态，
+    按状态分组，每组一条 UPDATE。pending / running 不会覆盖已写入的结束状态（结束状态可能已由
+    TaskLeaseManager 释放租约时写入）。需要传入Flask应用以便在后台线程中使用数据库。
+
+    与 TaskLeaseManager 一起使用时传入相同的 node_id，恢复时不会接管其他节点持有有效租约的任务。
+    """
+
+    IN_CLAUSE_SIZE = 500  # 每条UPDATE的IN列表长度上限（SQLite对参数个数有限制）
+    FINISHED_STATUSES = ("completed", "failed", "cancelled")
+
+    def __init__(self, app, task_type: str = "transfer", node_id: str = None,
+                 flush_interval: float = 0.2, batch_size: int = 1000):
+        self.app = app
+        self.task_type = task_type  # 恢复的任务项使用的处理函数类型
+        self.node_id = node_id  # 本调度节点ID（租约持有者）
+        super().__init__(flush_interval, batch_size)
+
+    def _write(self, batch: List):
+        from app import db
+        from app.models import TransferTask
+
+        latest = {}  # TransferTask.id -> 状态
+        for event, data in batch:
+            if event == "enqueue":
+                task_id, status = data.task_id, "pending"
+            elif event == "dispatch":
+                task_id, status = data, "running"
+            else:
+                task_id, status = data
+            if str(task_id).isdigit():
+                latest[int(task_id)] = status
+
+        by_status = {}
+        for row_id, status in latest.items():
+            by_status.setdefault(status, []).append(row_id)
+
+        now = datetime.utcnow()
+        with self.app.app_context():
+            for status, row_ids in by_status.items():
+                values = {"status": status}
+                if status == "running":
+                    values["started_at"] = now
+                elif status != "pending":
+                    values["completed_at"] = now
+                for start in range(0, len(row_ids), self.IN_CLAUSE_SIZE):
+                    query = TransferTask.query.filter(
+                        TransferTask.id.in_(row_ids[start:start + self.IN_CLAUSE_SIZE]))
+                    if status in ("pending", "running"):
+                        query = query.filter(TransferTask.status.notin_(self.FINISHED_STATUSES))
+                    query.update(values, synchronize_session=False)
+            db.session.commit()
+
+    def recover(self) -> List[TaskItem]:
+        """把停留在 running 的任务重置为 pending，然后一次查询取出所有 pending 任务
+
+        只处理没有租约、由本节点持有或租约已过期的任务，其他节点正在执行的任务不受影响。
+        """
+        from app import db
+        from app.models import TransferTask
+
+        with self.app.app_context():
+            available = db.or_(TransferTask.lease_owner.is_(None),
+                               TransferTask.lease_expires_at < datetime.utcnow())
+            if self.node_id is not None:
+                available = db.or_(available, TransferTask.lease_owner == self.node_id)
+            reset = TransferTask.query.filter(TransferTask.status == "running", available).update(
+                {"status": "pending", "lease_owner": None, "lease_expires_at": None},
+                synchronize_session=False)
+            db.session.commit()
+            if reset:
+                print(f"{reset} 个中断的任务已重置为等待状态")
+
+            rows = db.session.query(*transfer_task_columns()).filter(
+                TransferTask.status == "pending", available).all()
+        return [task_item_from_row(row, self.task_type) for row in rows]
+
+def transfer_task_columns() -> tuple:
+    """构造任务项所需的 transfer_tasks 列，只查询这些列以加快批量读取"""
+    from app.models import TransferTask
+
+    return (TransferTask.id, TransferTask.priority, TransferTask.created_at,
+            TransferTask.retry_count, TransferTask.max_retries, TransferTask.task_type,
+            TransferTask.user_id, TransferTask.site_id, TransferTask.total_size,
+            TransferTask.transferred_size, TransferTask.deadline)
+
+def task_item_from_row(row, task_type: str = "transfer") -> TaskItem:
+    """由 transfer_task_columns() 查询出的行构造任务项，task_id 为 TransferTask.id 的字符串形式"""
+    return TaskItem(
+        task_id=str(row.id),
+        priority=row.priority,
+        created_at=_timestamp(row.created_at),
+        retry_count=row.retry_count or 0,
+        max_retries=row.max_retries if row.max_retries is not None else 3,
+        task_type=task_type,
+        payload={"transfer_task_id": row.id, "task_type": row.task_type},
+        user_id=row.user_id,
+        site_id=row.site_id,
+        total_bytes=row.total_size or 0,
+        transferred_bytes=row.transferred_size or 0,
+        deadline=_timestamp(row.deadline) if row.deadline else None
+    )
+
+def _timestamp(value: datetime) -> float:
+    """数据库中的时间为UTC的naive datetime"""
+    return value.replace(tzinfo=timezone.utc).timestamp()
@@ -1,8 +1,10 @@
 import threading
+import time
 from collections import defaultdict
 from dataclasses import dataclass
-from typing import Dict
+from typing import Callable, Dict, Iterable, List
 from .priority_queue import TaskPriority
+from .proc_stats import ResourceUsageSampler
 
 @dataclass
 class SystemResources:
@@ -32,11 +34,83 @@ class ResourceAllocation:
             "memory_mb": self.memory_mb
         }
 
+# 资源字段 -> (SystemResources 中的容量字段, 分配策略中的百分比键)
+RESOURCE_FIELDS = {
+    "ftp_connections": ("max_ftp_connections", "ftp_connections_percent"),
+    "bandwidth_kbps": ("max_bandwidth_kbps", "bandwidth_percent"),
+    "concurrent_tasks": ("max_concurrent_tasks", "concurrent_tasks_percent"),
+    "disk_io_mbps": ("max_disk_io_mbps", "disk_io_percent"),
+    "memory_mb": ("max_memory_mb", "memory_percent")
+}
+
+# 资源字段 -> 状态中 usage_percentage 使用的键
+USAGE_PERCENTAGE_KEYS = {
+    "ftp_connections": "ftp_connections",
+    "bandwidth_kbps": "bandwidth",
+    "concurrent_tasks": "concurrent_tasks",
+    "disk_io_mbps": "disk_io",
+    "memory_mb": "memory"
+}
+
+class TokenBucket:
+    """令牌桶限速器
+
+    令牌按 rate（字节/秒）补充，最多积累 burst_seconds 秒的量。consume 允许令牌透支，
+    透支部分按当前速率折算为等待时间，因此速率调整后下一次 consume 立即按新速率限速。
+    rate <= 0 表示不限速。
+    """
+
+    def __init__(self, rate: float, burst_seconds: float = 1.0):
+        self.burst_seconds = burst_seconds
+        self.rate = rate
+        self.tokens = self.capacity
+        self.timestamp = time.monotonic()
+        self.lock = threading.Lock()
+
+    @property
+    def capacity(self) -> float:
+        return max(self.rate * self.burst_seconds, 64 * 1024)
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.timestamp) * self.rate)
+        self.timestamp = now
+
+    def set_rate(self, rate: float):
+        with self.lock:
+            self._refill(time.monotonic())
+            self.rate = rate
+
+    def consume(self, nbytes: int) -> float:
+        """消耗 nbytes 个令牌，不足时阻塞等待，返回等待的秒数"""
+        with self.lock:
+            if self.rate <= 0:
+                return 0.0
+            self._refill(time.monotonic())
+            self.tokens -= nbytes
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
 class ResourceManager:
-    """系统资源管理器"""
+    """系统资源管理器
+
+    按层次令牌桶（HTB）模型在优先级之间分配资源：allocation_strategy 中的百分比是各优先级的
+    保证份额，ceil_percent 是上限。某一级超出保证份额时可以借用其他级别空闲的资源，直到上限；
+    被借用的级别有任务等待时，借用方不能再继续借，并通过 find_reclaimable 找出需要让出的任务。
+    带宽按活跃级别实时重新分配：各级先得到保证速率，剩余带宽按优先级从高到低借给活跃级别，
+    使链路在任何优先级组合下都保持满载，通过 throttle 对任务限速。
+
+    start_sampling 启动后台采样，用 /proc 中平滑后的实际用量修正准入判断：磁盘I/O和内存取
+    预留量与实测值中的较大者，主机可用内存不足或磁盘过于繁忙时暂缓启动新任务。
+
+    各级的保证、上限和系统容量向量只在策略或系统资源变化时重新计算；用量按增量维护。
+    每次变化后发布新的状态快照，get_resource_status / get_total_usage 直接返回快照而不加锁。
+    """
     
-    def __init__(self, system_resources: SystemResources = None):
+    def __init__(self, system_resources: SystemResources = None, clock: Callable[[], float] = time.time):
         self.system_resources = system_resources or SystemResources()
+        self.clock = clock
         self.lock = threading.RLock()
         
         # 资源分配策略配置
@@ -46,35 +120,40 @@ class ResourceManager:
                 "bandwidth_percent": 50,          # 50%的带宽
                 "concurrent_tasks_percent": 50,   # 50%的并发任务
                 "disk_io_percent": 40,           # 40%的磁盘I/O
-                "memory_percent": 40             # 40%的内存
+                "memory_percent": 40,            # 40%的内存
+                "ceil_percent": 100              # 借用上限：100%的系统资源
             },
             TaskPriority.HIGH: {
                 "ftp_connections_percent": 30,
                 "bandwidth_percent": 30,
                 "concurrent_tasks_percent": 30,
                 "disk_io_percent": 30,
-                "memory_percent": 30
+                "memory_percent": 30,
+                "ceil_percent": 100
             },
             TaskPriority.NORMAL: {
                 "ftp_connections_percent": 20,
                 "bandwidth_percent": 15,
                 "concurrent_tasks_percent": 15,
                 "disk_io_percent": 20,
-                "memory_percent": 20
+                "memory_percent": 20,
+                "ceil_percent": 100
             },
             TaskPriority.LOW: {
                 "ftp_connections_percent": 8,
                 "bandwidth_percent": 4,
                 "concurrent_tasks_percent": 4,
                 "disk_io_percent": 8,
-                "memory_percent": 8
+                "memory_percent": 8,
+                "ceil_percent": 100
             },
             TaskPriority.BACKGROUND: {
                 "ftp_connections_percent": 2,
                 "bandwidth_percent": 1,
                 "concurrent_tasks_percent": 1,
                 "disk_io_percent": 2,
-                "memory_percent": 2
+                "memory_percent": 2,
+                "ceil_percent": 100
             }
         }
         
@@ -84,12 +163,38 @@ class ResourceManager:
             for priority in [1, 2, 3, 4, 5]
         }
         
+        self.total_usage = ResourceAllocation(0)
+        
         # 活跃任务追踪
-        self.active_tasks = defaultdict(list)  # priority -> [task_ids]
+        self.active_tasks = defaultdict(dict)  # priority -> {task_id: None}，保持启动顺序
         self.task_allocations = {}  # task_id -> ResourceAllocation
         
+        # 借用与回收
+        self.reclaim_timeout = 30  # 回收请求的有效期（秒），期间借用方不能占用该级别的保证份额
+        self.reclaiming = {}  # priority -> 发起回收的时间
+        
+        # 带宽整形：每个优先级一个令牌桶，速率随活跃级别变化
+        self.bandwidth_rates = {}  # priority -> 当前速率 KB/s
+        self.buckets = {priority: TokenBucket(0) for priority in TaskPriority}
+        
+        # 实测资源使用（ResourceUsageSampler 上报的平滑值）
+        self.measured_usage = {}
+        self.pressure_limits = {
+            "min_available_memory_mb": 256,  # 启动任务后主机至少保留的可用内存
+            "max_disk_busy_percent": 90      # 磁盘繁忙度达到该值时不再启动需要磁盘I/O的任务
+        }
+        self.usage_sampler = None
+        
+        # 缓存的限额向量和状态快照
+        self.capacity = ResourceAllocation(0)  # 系统容量
+        self.guaranteed_limits = {}  # priority -> 保证分配
+        self.ceil_limits = {}  # priority -> 借用上限
+        self._status_snapshot = {}
+        self._total_snapshot = {}
+        self._recompute_limits()
+        
     def calculate_max_allocation(self, priority: int) -> ResourceAllocation:
-        """计算指定优先级的最大资源分配"""
+        """计算指定优先级的保证资源分配"""
         strategy = self.allocation_strategy[priority]
         
         return ResourceAllocation(
@@ -106,19 +211,159 @@ class ResourceManager:
                         strategy["memory_percent"] / 100)
         )
     
+    def calculate_ceil_allocation(self, priority: int) -> ResourceAllocation:
+        """计算指定优先级借用后可达到的资源上限"""
+        ceil_percent = self.allocation_strategy[priority].get("ceil_percent", 100)
+        ceil = ResourceAllocation(priority)
+        for field, (capacity_field, _) in RESOURCE_FIELDS.items():
+            setattr(ceil, field, int(getattr(self.system_resources, capacity_field) * ceil_percent / 100))
+        return ceil
+    
+    def _recompute_limits(self):
+        """策略或系统资源变化后重新计算缓存的限额向量，并重新分配带宽、发布状态"""
+        for field, (capacity_field, _) in RESOURCE_FIELDS.items():
+            setattr(self.capacity, field, getattr(self.system_resources, capacity_field))
+        self.guaranteed_limits = {priority: self.calculate_max_allocation(priority) for priority in TaskPriority}
+        self.ceil_limits = {priority: self.calculate_ceil_allocation(priority) for priority in TaskPriority}
+        self._static_status = {
+            priority: (TaskPriority.get_priority_name(priority),
+                       self.guaranteed_limits[priority].to_dict(), self.ceil_limits[priority].to_dict())
+            for priority in TaskPriority
+        }
+        self._rebalance_bandwidth()
+        self._publish_status()
+    
+    def _measured_total(self, total: ResourceAllocation) -> ResourceAllocation:
+        """用实测值修正预留总量：磁盘I/O和内存取两者中的较大者"""
+        measured = ResourceAllocation(0, **total.to_dict())
+        disk_io = self.measured_usage.get("disk_io_mbps")
+        if disk_io is not None:
+            measured.disk_io_mbps = max(measured.disk_io_mbps, int(disk_io))
+        rss = self.measured_usage.get("process_rss_mb")
+        if rss is not None:
+            measured.memory_mb = max(measured.memory_mb, int(rss))
+        return measured
+    
+    def _host_pressure_ok(self, required: ResourceAllocation) -> bool:
+        """主机实际压力是否允许再启动一个任务"""
+        available = self.measured_usage.get("memory_available_mb")
+        if (available is not None and required.memory_mb and
+                available - required.memory_mb < self.pressure_limits["min_available_memory_mb"]):
+            return False
+        busy = self.measured_usage.get("disk_busy_percent")
+        if busy is not None and required.disk_io_mbps and busy >= self.pressure_limits["max_disk_busy_percent"]:
+            return False
+        return True
+    
+    def _active_reclaims(self, exclude_priority: int) -> List[int]:
+        """仍在有效期内的回收请求（不含 exclude_priority 自身）"""
+        if not self.reclaiming:
+            return []
+        now = self.clock()
+        expired = [priority for priority, since in self.reclaiming.items() if now - since > self.reclaim_timeout]
+        for priority in expired:
+            del self.reclaiming[priority]
+        if expired:
+            self._publish_status()
+        return [priority for priority in self.reclaiming if priority != exclude_priority]
+    
     def can_allocate_resources(self, priority: int, required: ResourceAllocation) -> bool:
-        """检查是否可以分配指定资源"""
+        """检查是否可以分配指定资源
+        
+        每项资源都要满足：不超过本级上限、不超过系统总量；超出本级保证份额（借用）时，
+        还要给正在等待回收的级别留出其保证份额中未使用的部分。
+        已有任务运行时，还要按实测用量和主机压力检查，保证至少有一个任务能运行。
+        """
+        with self.lock:
+            guaranteed = self.guaranteed_limits[priority]
+            ceil = self.ceil_limits[priority]
+            current = self.current_usage[priority]
+            total = self.total_usage
+            if self.task_allocations and self.measured_usage:
+                if not self._host_pressure_ok(required):
+                    return False
+                total = self._measured_total(total)
+            reclaims = self._active_reclaims(priority)
+            reserved_allocations = [
+                (self.guaranteed_limits[other], self.current_usage[other]) for other in reclaims
+            ]
+            
+            for field in RESOURCE_FIELDS:
+                need = getattr(current, field) + getattr(required, field)
+                total_need = getattr(total, field) + getattr(required, field)
+                capacity = getattr(self.capacity, field)
+                if need > getattr(ceil, field) or total_need > capacity:
+                    return False
+                if need > getattr(guaranteed, field):
+                    reserved = sum(max(0, getattr(other_guaranteed, field) - getattr(other_usage, field))
+                                   for other_guaranteed, other_usage in reserved_allocations)
+                    if total_need + reserved > capacity:
+                        return False
+            return True
+    
+    def _release_deficit(self, required: ResourceAllocation, releasing: Iterable[str]) -> Dict[str, float]:
+        """releasing 中的任务释放后，分配 required 时系统总量还缺少的各项资源（<=0 表示足够），调用方需持有锁"""
+        deficit = {}
+        for field in RESOURCE_FIELDS:
+            freed = sum(getattr(self.task_allocations[task_id], field)
+                        for task_id in releasing if task_id in self.task_allocations)
+            deficit[field] = (getattr(self.total_usage, field) + getattr(required, field) - freed -
+                              getattr(self.capacity, field))
+        return deficit
+    
+    def covered_by_releasing(self, required: ResourceAllocation, releasing: Iterable[str]) -> bool:
+        """停止中的任务（releasing）释放资源后，系统总量是否足够分配 required"""
+        releasing = set(releasing)
+        if not releasing:
+            return False
+        with self.lock:
+            return all(value <= 0 for value in self._release_deficit(required, releasing).values())
+    
+    def find_reclaimable(self, priority: int, required: ResourceAllocation,
+                         releasing: Iterable[str] = ()) -> List[str]:
+        """本级在保证份额内却因其他级别借用而无法分配时，找出需要让出资源的借用任务
+        
+        releasing 是已在停止中的任务，其资源视为即将释放。优先回收最低优先级、最后启动的任务，
+        每个级别最多回收到其保证份额为止。调用后借用方在 reclaim_timeout 内不能再占用本级的保证份额，
+        本级成功分配后解除。返回需要抢占的任务ID列表，无需回收时为空。
+        """
         with self.lock:
-            max_allocation = self.calculate_max_allocation(priority)
+            guaranteed = self.guaranteed_limits[priority]
             current = self.current_usage[priority]
+            if any(getattr(current, field) + getattr(required, field) > getattr(guaranteed, field)
+                   for field in RESOURCE_FIELDS):
+                return []  # 超出保证份额的部分只能借用，不能回收
             
-            return (
-                current.ftp_connections + required.ftp_connections <= max_allocation.ftp_connections and
-                current.bandwidth_kbps + required.bandwidth_kbps <= max_allocation.bandwidth_kbps and
-                current.concurrent_tasks + required.concurrent_tasks <= max_allocation.concurrent_tasks and
-                current.disk_io_mbps + required.disk_io_mbps <= max_allocation.disk_io_mbps and
-                current.memory_mb + required.memory_mb <= max_allocation.memory_mb
-            )
+            releasing = set(releasing)
+            deficit = self._release_deficit(required, releasing)
+            if all(value <= 0 for value in deficit.values()):
+                return []
+            
+            if priority not in self.reclaiming:
+                self.reclaiming[priority] = self.clock()
+                self._publish_status()
+            victims = []
+            for other in sorted(self.active_tasks, reverse=True):
+                if other == priority:
+                    continue
+                other_guaranteed = self.guaranteed_limits[other]
+                usage = {field: getattr(self.current_usage[other], field) for field in RESOURCE_FIELDS}
+                for task_id in reversed(self.active_tasks[other]):
+                    if all(value <= 0 for value in deficit.values()):
+                        return victims
+                    allocation = self.task_allocations[task_id]
+                    if task_id in releasing:
+                        for field in RESOURCE_FIELDS:
+                            usage[field] -= getattr(allocation, field)
+                        continue
+                    if not any(deficit[field] > 0 and usage[field] > getattr(other_guaranteed, field)
+                               for field in RESOURCE_FIELDS):
+                        continue
+                    victims.append(task_id)
+                    for field in RESOURCE_FIELDS:
+                        usage[field] -= getattr(allocation, field)
+                        deficit[field] -= getattr(allocation, field)
+            return victims
     
     def allocate_resources(self, task_id: str, priority: int, required: ResourceAllocation) -> bool:
         """分配资源给任务"""
@@ -128,15 +373,18 @@ class ResourceManager:
             
             # 分配资源
             current = self.current_usage[priority]
-            current.ftp_connections += required.ftp_connections
-            current.bandwidth_kbps += required.bandwidth_kbps
-            current.concurrent_tasks += required.concurrent_tasks
-            current.disk_io_mbps += required.disk_io_mbps
-            current.memory_mb += required.memory_mb
+            for field in RESOURCE_FIELDS:
+                amount = getattr(required, field)
+                setattr(current, field, getattr(current, field) + amount)
+                setattr(self.total_usage, field, getattr(self.total_usage, field) + amount)
             
             # 记录任务分配
-            self.active_tasks[priority].append(task_id)
+            self.active_tasks[priority][task_id] = None
             self.task_allocations[task_id] = required
+            self.reclaiming.pop(priority, None)
+            if len(self.active_tasks[priority]) == 1:
+                self._rebalance_bandwidth()
+            self._publish_status()
             return True
     
     def release_resources(self, task_id: str, priority: int, allocated: ResourceAllocation = None):
@@ -149,67 +397,139 @@ class ResourceManager:
                     return  # 没有找到分配记录
             
             current = self.current_usage[priority]
-            current.ftp_connections = max(0, current.ftp_connections - allocated.ftp_connections)
-            current.bandwidth_kbps = max(0, current.bandwidth_kbps - allocated.bandwidth_kbps)
-            current.concurrent_tasks = max(0, current.concurrent_tasks - allocated.concurrent_tasks)
-            current.disk_io_mbps = max(0, current.disk_io_mbps - allocated.disk_io_mbps)
-            current.memory_mb = max(0, current.memory_mb - allocated.memory_mb)
+            for field in RESOURCE_FIELDS:
+                used = getattr(current, field)
+                released = min(used, getattr(allocated, field))
+                setattr(current, field, used - released)
+                setattr(self.total_usage, field, getattr(self.total_usage, field) - released)
             
             # 移除任务记录
-            if task_id in self.active_tasks[priority]:
-                self.active_tasks[priority].remove(task_id)
-            if task_id in self.task_allocations:
-                del self.task_allocations[task_id]
+            tasks = self.active_tasks[priority]
+            if task_id in tasks:
+                del tasks[task_id]
+                if not tasks:
+                    self._rebalance_bandwidth()
+            self.task_allocations.pop(task_id, None)
+            self._publish_status()
+    
+    def _rebalance_bandwidth(self):
+        """按活跃级别重新计算各级带宽速率
+        
+        活跃级别先得到保证速率，剩余带宽按优先级从高到低借给活跃级别，直到各自的上限；
+        没有活跃级别时各级保持保证速率。级别变为活跃时，借用方的速率立即下降，即回收。
+        """
+        capacity = self.system_resources.max_bandwidth_kbps
+        active = [priority for priority in TaskPriority if self.active_tasks.get(priority)]
+        rates = {priority: self.guaranteed_limits[priority].bandwidth_kbps for priority in TaskPriority}
+        
+        spare = capacity - sum(rates[priority] for priority in active)
+        for priority in active:
+            if spare <= 0:
+                break
+            borrow = min(spare, self.ceil_limits[priority].bandwidth_kbps - rates[priority])
+            if borrow > 0:
+                rates[priority] += borrow
+                spare -= borrow
+        
+        self.bandwidth_rates = rates
+        for priority, rate in rates.items():
+            self.buckets[priority].set_rate(rate * 1024)
+    
+    def update_measured_usage(self, measured: Dict):
+        """接收采样得到的实际用量（键同 HostStatsSampler.sample()）"""
+        with self.lock:
+            self.measured_usage = dict(measured)
+            self._publish_status()
+    
+    def start_sampling(self, interval: float = 2.0, alpha: float = 0.3):
+        """启动后台资源采样"""
+        with self.lock:
+            if self.usage_sampler is None:
+                self.usage_sampler = ResourceUsageSampler(self.update_measured_usage, interval, alpha)
+            self.usage_sampler.start()
+    
+    def stop_sampling(self):
+        """停止后台资源采样，保留最后一次的实测值"""
+        if self.usage_sampler:
+            self.usage_sampler.stop()
+    
+    def throttle(self, priority: int, nbytes: int) -> float:
+        """按本级当前带宽速率限速，传输 nbytes 字节前调用，返回等待的秒数"""
+        return self.buckets[priority].consume(nbytes)
     
     def get_available_resources(self, priority: int) -> ResourceAllocation:
-        """获取指定优先级的可用资源"""
+        """获取指定优先级的可用资源（含可借用的部分）"""
         with self.lock:
-            max_allocation = self.calculate_max_allocation(priority)
+            ceil = self.ceil_limits[priority]
             current = self.current_usage[priority]
             
-            return ResourceAllocation(
-                priority=priority,
-                ftp_connections=max_allocation.ftp_connections - current.ftp_connections,
-                bandwidth_kbps=max_allocation.bandwidth_kbps - current.bandwidth_kbps,
-                concurrent_tasks=max_allocation.concurrent_tasks - current.concurrent_tasks,
-                disk_io_mbps=max_allocation.disk_io_mbps - current.disk_io_mbps,
-                memory_mb=max_allocation.memory_mb - current.memory_mb
-            )
+            available = ResourceAllocation(priority)
+            for field in RESOURCE_FIELDS:
+                setattr(available, field, max(0, min(
+                    getattr(ceil, field) - getattr(current, field),
+                    getattr(self.capacity, field) - getattr(self.total_usage, field)
+                )))
+            return available
     
     def get_resource_status(self) -> Dict:
-        """获取资源使用状态"""
-        with self.lock:
-            status = {}
-            for priority in [1, 2, 3, 4, 5]:
-                max_alloc = self.calculate_max_allocation(priority)
-                current = self.current_usage[priority]
-                
-                status[priority] = {
-                    "priority_name": TaskPriority.get_priority_name(priority),
-                    "max_allocation": max_alloc.to_dict(),
-                    "current_usage": current.to_dict(),
-                    "usage_percentage": {
-                        "ftp_connections": (current.ftp_connections / max(max_alloc.ftp_connections, 1)) * 100,
-                        "bandwidth": (current.bandwidth_kbps / max(max_alloc.bandwidth_kbps, 1)) * 100,
-                        "concurrent_tasks": (current.concurrent_tasks / max(max_alloc.concurrent_tasks, 1)) * 100,
-                        "disk_io": (current.disk_io_mbps / max(max_alloc.disk_io_mbps, 1)) * 100,
-                        "memory": (current.memory_mb / max(max_alloc.memory_mb, 1)) * 100
-                    },
-                    "active_tasks": len(self.active_tasks[priority]),
-                    "available_resources": self.get_available_resources(priority).to_dict()
-                }
+        """获取资源使用状态（只读快照，不加锁）"""
+        return self._status_snapshot
+    
+    def _publish_status(self):
+        """在锁内生成新的状态快照并整体替换，读取方拿到的快照不会再被修改"""
+        total = self.total_usage.to_dict()
+        free = {field: value - total[field] for field, value in self.capacity.to_dict().items()}
+        status = {}
+        for priority in [1, 2, 3, 4, 5]:
+            name, guaranteed, ceil = self._static_status[priority]
+            current = self.current_usage[priority].to_dict()
             
-            return status
+            status[priority] = {
+                "priority_name": name,
+                "max_allocation": guaranteed,
+                "ceil_allocation": ceil,
+                "current_usage": current,
+                "borrowed": {field: max(0, current[field] - guaranteed[field]) for field in current},
+                "bandwidth_rate_kbps": self.bandwidth_rates.get(priority, 0),
+                "reclaiming": priority in self.reclaiming,
+                "usage_percentage": {
+                    name: current[field] / max(guaranteed[field], 1) * 100
+                    for field, name in USAGE_PERCENTAGE_KEYS.items()
+                },
+                "active_tasks": len(self.active_tasks[priority]),
+                "available_resources": {
+                    field: max(0, min(ceil[field] - current[field], free[field])) for field in current
+                }
+            }
+        
+        self._status_snapshot = status
+        self._total_snapshot = {
+            "total_usage": total,
+            "system_resources": {
+                "max_ftp_connections": self.system_resources.max_ftp_connections,
+                "max_bandwidth_kbps": self.system_resources.max_bandwidth_kbps,
+                "max_concurrent_tasks": self.system_resources.max_concurrent_tasks,
+                "max_disk_io_mbps": self.system_resources.max_disk_io_mbps,
+                "max_memory_mb": self.system_resources.max_memory_mb
+            },
+            "usage_percentage": {
+                name: total[field] / max(getattr(self.capacity, field), 1) * 100
+                for field, name in USAGE_PERCENTAGE_KEYS.items()
+            },
+            "measured_usage": dict(self.measured_usage)
+        }
     
     def update_allocation_strategy(self, new_strategy: Dict):
         """更新资源分配策略"""
         with self.lock:
             self.allocation_strategy.update(new_strategy)
+            self._recompute_limits()
     
     def update_system_resources(self, new_resources: SystemResources):
         """更新系统资源配置"""
         with self.lock:
             self.system_resources = new_resources
+            self._recompute_limits()
     
     def get_task_allocation(self, task_id: str) -> ResourceAllocation:
         """获取任务的资源分配"""
@@ -217,30 +537,5 @@ class ResourceManager:
             return self.task_allocations.get(task_id)
     
     def get_total_usage(self) -> Dict:
-        """获取总体资源使用情况"""
-        with self.lock:
-            total_usage = ResourceAllocation(0)
-            for priority_usage in self.current_usage.values():
-                total_usage.ftp_connections += priority_usage.ftp_connections
-                total_usage.bandwidth_kbps += priority_usage.bandwidth_kbps
-                total_usage.concurrent_tasks += priority_usage.concurrent_tasks
-                total_usage.disk_io_mbps += priority_usage.disk_io_mbps
-                total_usage.memory_mb += priority_usage.memory_mb
-            
-            return {
-                "total_usage": total_usage.to_dict(),
-                "system_resources": {
-                    "max_ftp_connections": self.system_resources.max_ftp_connections,
-                    "max_bandwidth_kbps": self.system_resources.max_bandwidth_kbps,
-                    "max_concurrent_tasks": self.system_resources.max_concurrent_tasks,
-                    "max_disk_io_mbps": self.system_resources.max_disk_io_mbps,
-                    "max_memory_mb": self.system_resources.max_memory_mb
-                },
-                "usage_percentage": {
-                    "ftp_connections": (total_usage.ftp_connections / max(self.system_resources.max_ftp_connections, 1)) * 100,
-                    "bandwidth": (total_usage.bandwidth_kbps / max(self.system_resources.max_bandwidth_kbps, 1)) * 100,
-                    "concurrent_tasks": (total_usage.concurrent_tasks / max(self.system_resources.max_concurrent_tasks, 1)) * 100,
-                    "disk_io": (total_usage.disk_io_mbps / max(self.system_resources.max_disk_io_mbps, 1)) * 100,
-                    "memory": (total_usage.memory_mb / max(self.system_resources.max_memory_mb, 1)) * 100
-                }
-            }
+        """获取总体资源使用情况（只读快照，不加锁）"""
+        return self._total_snapshot
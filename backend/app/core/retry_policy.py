@@ -0,0 +1,212 @@
+import random
+import re
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+from .priority_queue import IndexedHeap, TaskItem
+
+PERMANENT_FTP_ERROR = re.compile(r"^\s*5\d\d\b")
+
+class PermanentError(Exception):
+    """不应重试的失败（如配置错误），处理函数可抛出该异常跳过重试"""
+    pass
+
+def is_retryable(error) -> bool:
+    """失败是否值得重试：FTP永久性错误（5xx，如文件不存在、权限不足）重试也不会成功"""
+    if error is None or isinstance(error, PermanentError):
+        return False
+    return not PERMANENT_FTP_ERROR.match(str(error))
+
+class RetryPolicy:
+    """指数退避：第 n 次重试的延迟上限为 base_delay × multiplier^(n-1)（不超过 max_delay）
+
+    实际延迟在 [上限 × (1 - jitter), 上限] 内随机取值，使同时失败的任务错开重试。
+    """
+
+    def __init__(self, base_delay: float = 5, max_delay: float = 300, multiplier: float = 2,
+                 jitter: float = 0.5, seed: int = None):
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.multiplier = multiplier
+        self.jitter = jitter
+        self.random = random.Random(seed)
+
+    def delay(self, attempt: int) -> float:
+        """第 attempt 次重试（从1开始）前的等待秒数"""
+        cap = min(self.max_delay, self.base_delay * self.multiplier ** max(attempt - 1, 0))
+        return cap * (1 - self.jitter * self.random.random())
+
+class _DelayedEntry:
+    __slots__ = ("eligible_at", "item")
+
+    def __init__(self, eligible_at: float, item: TaskItem):
+        self.eligible_at = eligible_at
+        self.item = item
+
+    def __lt__(self, other):
+        return self.eligible_at < other.eligible_at
+
+class DelayedTaskQueue:
+    """等待重试的任务，按可重新派发的时间排序的堆"""
+
+    def __init__(self):
+        self.heap = IndexedHeap(key_func=lambda entry: entry.item.task_id)
+        self.lock = threading.Lock()
+
+    def push(self, task_item: TaskItem, eligible_at: float):
+        with self.lock:
+            self.heap.push(_DelayedEntry(eligible_at, task_item))
+
+    def pop_due(self, now: float) -> List[TaskItem]:
+        """取出所有已到重试时间的任务"""
+        due = []
+        with self.lock:
+            while self.heap and self.heap.peek().eligible_at <= now:
+                due.append(self.heap.pop().item)
+        return due
+
+    def next_due(self, now: float) -> Optional[float]:
+        """距下一个任务可重试的秒数，没有等待重试的任务时返回None"""
+        with self.lock:
+            entry = self.heap.peek()
+        return max(entry.eligible_at - now, 0.0) if entry else None
+
+    def remove(self, task_id: str) -> Optional[TaskItem]:
+        with self.lock:
+            entry = self.heap.remove(task_id)
+        return entry.item if entry else None
+
+    def contains(self, task_id: str) -> bool:
+        return task_id in self.heap
+
+    def __len__(self):
+        return len(self.heap)
+
+class _Circuit:
+    def __init__(self):
+        self.state = "closed"  # closed / open / half_open
+        self.failures = 0  # 连续失败次数
+        self.opened_at = 0.0
+        self.cooldown = 0.0
+        self.probing = False  # 半开状态下是否已有试探任务在执行
+        self.trips = 0  # 累计熔断次数
+
+class CircuitBreaker:
+    """按站点熔断
+
+    站点连续失败 failure_threshold 次后熔断（open），cooldown 秒内不再派发该站点的任务；
+    冷却结束后进入半开（half_open），只派发一个试探任务：成功则恢复（closed），失败则再次熔断，
+    冷却时间加倍（不超过 max_cooldown）。
+    """
+
+    def __init__(self, failure_threshold: int = 5, cooldown: float = 30, max_cooldown: float = 600,
+                 clock: Callable[[], float] = time.time):
+        self.failure_threshold = failure_threshold
+        self.base_cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.clock = clock
+        self.circuits = {}  # site_id -> _Circuit
+        self.open_count = 0  # 处于 open / half_open 状态的站点数
+        self.lock = threading.Lock()
+
+    def _refresh(self, circuit: _Circuit, now: float):
+        if circuit.state == "open" and now >= circuit.opened_at + circuit.cooldown:
+            circuit.state = "half_open"
+            circuit.probing = False
+
+    def allow(self, site_id) -> bool:
+        """是否可以派发该站点的任务"""
+        if site_id is None or not self.open_count:
+            return True
+        with self.lock:
+            circuit = self.circuits.get(site_id)
+            if circuit is None or circuit.state == "closed":
+                return True
+            self._refresh(circuit, self.clock())
+            return circuit.state == "half_open" and not circuit.probing
+
+    def on_dispatch(self, site_id):
+        """任务开始执行；半开状态下即为试探任务"""
+        if site_id is None or not self.open_count:
+            return
+        with self.lock:
+            circuit = self.circuits.get(site_id)
+            if circuit is not None and circuit.state == "half_open":
+                circuit.probing = True
+
+    def record_success(self, site_id):
+        if site_id is None:
+            return
+        with self.lock:
+            circuit = self.circuits.get(site_id)
+            if circuit is None:
+                return
+            if circuit.state != "closed":
+                self.open_count -= 1
+                print(f"站点 {site_id} 恢复正常")
+            circuit.state = "closed"
+            circuit.failures = 0
+            circuit.cooldown = 0.0
+            circuit.probing = False
+
+    def record_failure(self, site_id):
+        if site_id is None:
+            return
+        with self.lock:
+            circuit = self.circuits.get(site_id)
+            if circuit is None:
+                circuit = self.circuits[site_id] = _Circuit()
+            circuit.failures += 1
+            now = self.clock()
+            self._refresh(circuit, now)
+            if circuit.state == "half_open" or (circuit.state == "closed" and
+                                                 circuit.failures >= self.failure_threshold):
+                if circuit.state == "closed":
+                    self.open_count += 1
+                circuit.cooldown = min(max(circuit.cooldown * 2, self.base_cooldown), self.max_cooldown)
+                circuit.state = "open"
+                circuit.opened_at = now
+                circuit.probing = False
+                circuit.trips += 1
+                print(f"站点 {site_id} 连续失败 {circuit.failures} 次，暂停派发 {circuit.cooldown:.0f} 秒")
+
+    def record_abandoned(self, site_id):
+        """任务未得出结果就结束（让出、被抢占或取消），半开状态下允许派发新的试探任务"""
+        if site_id is None or not self.open_count:
+            return
+        with self.lock:
+            circuit = self.circuits.get(site_id)
+            if circuit is not None:
+                circuit.probing = False
+
+    def cooldown_remaining(self, site_id, now: float) -> float:
+        """站点熔断剩余的秒数"""
+        with self.lock:
+            circuit = self.circuits.get(site_id)
+            if circuit is None or circuit.state != "open":
+                return 0.0
+            return max(circuit.opened_at + circuit.cooldown - now, 0.0)
+
+    def next_change(self, now: float) -> Optional[float]:
+        """距最近一个熔断站点进入半开状态的秒数"""
+        if not self.open_count:
+            return None
+        with self.lock:
+            pending = [circuit.opened_at + circuit.cooldown - now for circuit in self.circuits.values()
+                       if circuit.state == "open"]
+        return max(min(pending), 0.0) if pending else None
+
+    def get_status(self) -> Dict:
+        with self.lock:
+            now = self.clock()
+            status = {}
+            for site_id, circuit in self.circuits.items():
+                self._refresh(circuit, now)
+                status[str(site_id)] = {
+                    "state": circuit.state,
+                    "consecutive_failures": circuit.failures,
+                    "cooldown": circuit.cooldown,
+                    "trips": circuit.trips
+                }
+            return status
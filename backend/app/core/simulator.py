@@ -0,0 +1,370 @@
+import argparse
+import contextlib
+import csv
+import json
+import math
+import os
+import random
+from dataclasses import replace
+from typing import Dict, List, Optional
+
+from .priority_queue import PriorityTaskQueue, TaskItem, TaskPriority
+from .resource_manager import ResourceManager, SystemResources
+from .task_executor import TaskContext, TaskExecutor, YIELDED
+from .task_scheduler import SchedulingPolicy, TaskScheduler
+
+class VirtualClock:
+    """虚拟时钟，由模拟器推进"""
+
+    def __init__(self, start: float = 0.0):
+        self.now = start
+
+    def __call__(self) -> float:
+        return self.now
+
+class _IdleHostSampler:
+    """模拟中主机负载不参与自适应调整"""
+
+    def sample(self) -> Dict[str, Optional[float]]:
+        return {"cpu_percent": None, "disk_busy_percent": None}
+
+class SimulatedExecutor(TaskExecutor):
+    """不执行处理函数，只记录正在“执行”的任务，由模拟器按虚拟时间推进传输进度"""
+
+    def __init__(self):
+        self.running = {}  # task_id -> (execution, context, on_done)
+        self.first_started = {}  # task_id -> 第一次开始执行的虚拟时间
+
+    def submit(self, execution, handler, context: TaskContext, on_done):
+        task_id = execution.task_item.task_id
+        self.running[task_id] = (execution, context, on_done)
+        self.first_started.setdefault(task_id, execution.started_at)
+
+    def cancel(self, execution) -> bool:
+        return self.running.pop(execution.task_item.task_id, None) is not None
+
+class SchedulerSimulator:
+    """离散事件模拟：用虚拟时钟驱动 TaskScheduler、PriorityTaskQueue 和 ResourceManager
+
+    事件包括任务到达、任务传输完成、时间片到期、被抢占任务在块边界暂停，以及调度器的定时检查
+    （老化、自适应评估）。两个事件之间各任务按处理器共享模型传输：同一优先级的运行任务平分
+    ResourceManager 为该级分配的带宽，同一站点的任务平分站点带宽（site_bandwidth_kbps）。
+    任务的 total_bytes 为传输量，created_at 为到达时间。
+    """
+
+    def __init__(self, policy: SchedulingPolicy, system_resources: SystemResources = None,
+                 site_bandwidth_kbps: Dict = None, config: Dict = None, max_events: int = 10_000_000):
+        self.policy = policy
+        self.system_resources = system_resources or SystemResources()
+        self.site_bandwidth_kbps = site_bandwidth_kbps or {}  # site_id -> 站点带宽上限 KB/s
+        self.config = config or {}  # 覆盖调度器配置
+        self.max_events = max_events
+
+    def run(self, workload: List[TaskItem]) -> Dict:
+        """模拟一次完整运行，返回指标（见 summarize）"""
+        clock = VirtualClock()
+        executor = SimulatedExecutor()
+        resource_manager = ResourceManager(replace(self.system_resources), clock=clock)
+        scheduler = TaskScheduler(resource_manager, PriorityTaskQueue(),
+                                  executors={"thread": executor}, clock=clock)
+        scheduler.config.update(self.config)
+        scheduler.scheduling_policy = self.policy
+        scheduler.adaptive.host_sampler = _IdleHostSampler()
+        scheduler.admission.max_queued_tasks = None  # 负载中的任务全部接收
+        scheduler.admission.max_queued_per_user = None
+        scheduler.admission.max_queue_memory_mb = None
+
+        arrivals = sorted((replace(task_item, payload=dict(task_item.payload)) for task_item in workload),
+                          key=lambda task_item: task_item.created_at)
+        for task_type in {task_item.task_type for task_item in arrivals}:
+            scheduler.register_handler(task_type, None)
+
+        completed_at = {}
+        scheduler.add_task_listener(
+            lambda event, execution: completed_at.__setitem__(execution.task_item.task_id, clock.now)
+            if event in ("completed", "failed") else None)
+
+        next_arrival = 0
+        clock.now = arrivals[0].created_at if arrivals else 0.0
+        for _ in range(self.max_events):
+            # 1. 到达的任务入队
+            batch = []
+            while next_arrival < len(arrivals) and arrivals[next_arrival].created_at <= clock.now:
+                batch.append(arrivals[next_arrival])
+                next_arrival += 1
+            if batch:
+                scheduler.add_tasks(batch)
+
+            # 2. 传输完成的任务结束，被抢占或时间片到期的任务在块边界让出
+            for task_id, (execution, context, on_done) in list(executor.running.items()):
+                if self._remaining(execution) <= 0:
+                    del executor.running[task_id]
+                    on_done(execution, "ok", None)
+                elif context.should_yield():
+                    del executor.running[task_id]
+                    on_done(execution, YIELDED, None)
+
+            # 3. 调度到没有新任务可以启动为止
+            while True:
+                scheduled = scheduler.stats["total_scheduled"]
+                scheduler.schedule_once()
+                if scheduler.stats["total_scheduled"] == scheduled:
+                    break
+
+            # 4. 下一个事件
+            rates = self._rates(resource_manager, executor)
+            if any(execution.status == "preempting" for execution, _, _ in executor.running.values()):
+                next_time = clock.now
+            else:
+                next_time = self._next_event_time(scheduler, executor, rates, arrivals, next_arrival, clock.now)
+            if next_time is None:
+                break
+
+            elapsed = next_time - clock.now
+            for task_id, (execution, context, _) in executor.running.items():
+                total = execution.task_item.total_bytes
+                done = min(execution.transferred_bytes + rates[task_id] * elapsed,
+                           total - execution.task_item.transferred_bytes)
+                context.report_progress((execution.task_item.transferred_bytes + done) / max(total, 1), done)
+            clock.now = next_time
+        else:
+            raise RuntimeError(f"模拟超过 {self.max_events} 个事件仍未结束")
+
+        return self.summarize(arrivals, executor.first_started, completed_at, scheduler)
+
+    @staticmethod
+    def _remaining(execution) -> float:
+        """剩余字节数；不足1字节视为已完成，避免浮点误差产生极小的事件间隔"""
+        task_item = execution.task_item
+        remaining = task_item.total_bytes - task_item.transferred_bytes - execution.transferred_bytes
+        return remaining if remaining >= 1 else 0
+
+    def _rates(self, resource_manager: ResourceManager, executor: SimulatedExecutor) -> Dict[str, float]:
+        """各运行任务当前的传输速率（字节/秒）"""
+        by_priority, by_site = {}, {}
+        for execution, _, _ in executor.running.values():
+            task_item = execution.task_item
+            by_priority[task_item.priority] = by_priority.get(task_item.priority, 0) + 1
+            by_site[task_item.site_id] = by_site.get(task_item.site_id, 0) + 1
+
+        rates = {}
+        for task_id, (execution, _, _) in executor.running.items():
+            task_item = execution.task_item
+            rate = resource_manager.bandwidth_rates[task_item.priority] / by_priority[task_item.priority]
+            site_bandwidth = self.site_bandwidth_kbps.get(task_item.site_id)
+            if site_bandwidth:
+                rate = min(rate, site_bandwidth / by_site[task_item.site_id])
+            rates[task_id] = rate * 1024
+        return rates
+
+    def _next_event_time(self, scheduler: TaskScheduler, executor: SimulatedExecutor, rates: Dict,
+                         arrivals: List[TaskItem], next_arrival: int, now: float) -> Optional[float]:
+        candidates = []
+        if next_arrival < len(arrivals):
+            candidates.append(arrivals[next_arrival].created_at)
+        waiting = not scheduler.task_queue.is_empty()
+        for task_id, (execution, _, _) in executor.running.items():
+            if rates[task_id] > 0:
+                candidates.append(now + self._remaining(execution) / rates[task_id])
+            if waiting and execution.slice_deadline is not None:
+                candidates.append(max(execution.slice_deadline, now))
+        if waiting or executor.running:
+            # 老化、自适应评估等定时检查；没有其他事件时不再推进，避免空转
+            timeout = scheduler._next_wakeup_timeout()
+            if timeout is not None and (candidates or timeout > 0):
+                candidates.append(now + timeout)
+        return min(candidates) if candidates else None
+
+    def summarize(self, arrivals: List[TaskItem], first_started: Dict, completed_at: Dict,
+                  scheduler: TaskScheduler) -> Dict:
+        """统计指标
+
+        等待时间为到达到第一次开始执行的时间，响应时间为到达到完成的时间。
+        公平性为各用户服务速率（传输字节数 / 响应时间之和）的 Jain 指数，1 表示完全公平。
+        """
+        finished = [task_item for task_item in arrivals if task_item.task_id in completed_at]
+        waits = [first_started[task_item.task_id] - task_item.created_at for task_item in finished]
+        responses = [completed_at[task_item.task_id] - task_item.created_at for task_item in finished]
+
+        user_bytes, user_time = {}, {}
+        wait_by_priority = {}
+        for task_item, wait, response in zip(finished, waits, responses):
+            user_bytes[task_item.user_id] = user_bytes.get(task_item.user_id, 0) + task_item.total_bytes
+            user_time[task_item.user_id] = user_time.get(task_item.user_id, 0) + response
+            wait_by_priority.setdefault(task_item.priority, []).append(wait)
+        service_rates = [user_bytes[user_id] / user_time[user_id]
+                         for user_id in user_bytes if user_time[user_id] > 0]
+
+        stats = scheduler.stats
+        return {
+            "policy": self.policy.value,
+            "tasks": len(arrivals),
+            "completed": len(finished),
+            "makespan": (max(completed_at.values()) - arrivals[0].created_at) if finished else 0.0,
+            "mean_wait": _mean(waits),
+            "p99_wait": _percentile(waits, 99),
+            "mean_response": _mean(responses),
+            "p99_response": _percentile(responses, 99),
+            "fairness_index": jain_index(service_rates),
+            "preemptions": stats["total_preempted"] + stats["total_reclaimed"],
+            "yields": stats["total_yielded"],
+            "aged": stats["total_aged"],
+            "deadline_missed": stats["deadline_missed"],
+            "mean_wait_by_priority": {
+                TaskPriority.get_priority_name(priority): _mean(values)
+                for priority, values in sorted(wait_by_priority.items())
+            }
+        }
+
+def jain_index(values: List[float]) -> float:
+    """Jain 公平性指数：(Σx)² / (n·Σx²)"""
+    square_sum = sum(value * value for value in values)
+    return sum(values) ** 2 / (len(values) * square_sum) if square_sum else 1.0
+
+def _mean(values: List[float]) -> float:
+    return sum(values) / len(values) if values else 0.0
+
+def _percentile(values: List[float], percent: float) -> float:
+    """最近秩法百分位数"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(math.ceil(percent / 100 * len(ordered)) - 1, 0)]
+
+# 负载生成与读取
+
+DEFAULT_PRIORITY_WEIGHTS = {
+    TaskPriority.CRITICAL: 0.05,
+    TaskPriority.HIGH: 0.15,
+    TaskPriority.NORMAL: 0.5,
+    TaskPriority.LOW: 0.2,
+    TaskPriority.BACKGROUND: 0.1
+}
+
+def synthetic_workload(num_tasks: int = 1000, arrival_rate: float = 1.0, users: int = 5, sites: int = 3,
+                       mean_bytes: float = 8 * 1024 * 1024, size_sigma: float = 1.5,
+                       priority_weights: Dict = None, deadline_factor: float = None,
+                       seed: int = None) -> List[TaskItem]:
+    """生成合成负载：泊松到达，对数正态分布的任务大小（长尾），按权重随机的优先级
+
+    用户按 Zipf 分布提交任务（少数用户提交大部分任务），以便观察公平性。
+    deadline_factor 不为空时，截止时间 = 到达时间 + deadline_factor × 任务在满带宽下的传输时间。
+    """
+    rng = random.Random(seed)
+    weights = priority_weights or DEFAULT_PRIORITY_WEIGHTS
+    priorities, priority_weights_list = list(weights), list(weights.values())
+    user_weights = [1 / (rank + 1) for rank in range(users)]
+    mu = math.log(mean_bytes) - size_sigma ** 2 / 2
+    link_bytes_per_second = SystemResources().max_bandwidth_kbps * 1024
+
+    workload, now = [], 0.0
+    for index in range(num_tasks):
+        now += rng.expovariate(arrival_rate)
+        size = max(int(rng.lognormvariate(mu, size_sigma)), 1)
+        deadline = None
+        if deadline_factor is not None:
+            deadline = now + deadline_factor * size / link_bytes_per_second
+        workload.append(TaskItem(
+            task_id=f"sim-{index}",
+            priority=rng.choices(priorities, priority_weights_list)[0],
+            created_at=now,
+            user_id=rng.choices(range(users), user_weights)[0],
+            site_id=rng.randrange(sites),
+            total_bytes=size,
+            deadline=deadline
+        ))
+    return workload
+
+TRACE_FIELDS = ("arrival", "priority", "bytes", "user_id", "site_id", "deadline")
+
+def load_trace(path: str) -> List[TaskItem]:
+    """读取记录的负载：CSV（表头含 TRACE_FIELDS 中的列）或 JSON Lines（每行一个同名字段的对象）
+
+    arrival 和 deadline 为秒（可为相对时间或时间戳），deadline 可省略。
+    """
+    with open(path, encoding="utf-8") as f:
+        if path.endswith((".jsonl", ".json")):
+            records = [json.loads(line) for line in f if line.strip()]
+        else:
+            records = list(csv.DictReader(f))
+
+    workload = []
+    for index, record in enumerate(records):
+        deadline = record.get("deadline")
+        workload.append(TaskItem(
+            task_id=str(record.get("task_id") or f"trace-{index}"),
+            priority=int(record["priority"]),
+            created_at=float(record["arrival"]),
+            user_id=_optional_int(record.get("user_id")),
+            site_id=_optional_int(record.get("site_id")),
+            total_bytes=int(float(record["bytes"])),
+            deadline=float(deadline) if deadline not in (None, "") else None
+        ))
+    return workload
+
+def _optional_int(value):
+    return int(value) if value not in (None, "") else None
+
+# 策略对比
+
+def compare_policies(workload: List[TaskItem], policies: List[SchedulingPolicy] = None, **kwargs) -> Dict[str, Dict]:
+    """用同一负载分别模拟各调度策略，kwargs 传给 SchedulerSimulator"""
+    policies = policies or [SchedulingPolicy.PRIORITY_PREEMPTIVE, SchedulingPolicy.ROUND_ROBIN,
+                            SchedulingPolicy.FAIR_SHARE, SchedulingPolicy.ADAPTIVE]
+    return {policy.value: SchedulerSimulator(policy, **kwargs).run(workload) for policy in policies}
+
+REPORT_COLUMNS = (
+    ("makespan", "makespan(s)"),
+    ("mean_wait", "平均等待(s)"),
+    ("p99_wait", "P99等待(s)"),
+    ("mean_response", "平均响应(s)"),
+    ("fairness_index", "公平性"),
+    ("preemptions", "抢占"),
+    ("yields", "让出"),
+    ("deadline_missed", "超期"),
+    ("completed", "完成")
+)
+
+def format_report(results: Dict[str, Dict]) -> str:
+    """把 compare_policies 的结果格式化为表格"""
+    header = ["策略"] + [title for _, title in REPORT_COLUMNS]
+    rows = [header]
+    for policy, metrics in results.items():
+        rows.append([policy] + [
+            f"{metrics[key]:.3f}" if isinstance(metrics[key], float) else str(metrics[key])
+            for key, _ in REPORT_COLUMNS
+        ])
+    widths = [max(len(row[column]) for row in rows) for column in range(len(header))]
+    return "\n".join("  ".join(cell.ljust(width) for cell, width in zip(row, widths)) for row in rows)
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description="调度策略离散事件模拟")
+    parser.add_argument("--trace", help="负载记录文件（CSV 或 JSON Lines），不指定时生成合成负载")
+    parser.add_argument("--tasks", type=int, default=1000, help="合成负载的任务数")
+    parser.add_argument("--rate", type=float, default=1.0, help="合成负载每秒到达的任务数")
+    parser.add_argument("--users", type=int, default=5)
+    parser.add_argument("--sites", type=int, default=3)
+    parser.add_argument("--mean-mb", type=float, default=8.0, help="合成负载的平均任务大小（MB）")
+    parser.add_argument("--deadline-factor", type=float, help="截止时间为满带宽传输时间的倍数")
+    parser.add_argument("--site-kbps", type=int, help="每个站点的带宽上限 KB/s")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--policies", nargs="*", choices=[policy.value for policy in SchedulingPolicy],
+                        help="要对比的策略，默认为抢占式优先级、时间片轮转、公平共享和自适应")
+    args = parser.parse_args(argv)
+
+    if args.trace:
+        workload = load_trace(args.trace)
+    else:
+        workload = synthetic_workload(args.tasks, args.rate, args.users, args.sites,
+                                      args.mean_mb * 1024 * 1024, deadline_factor=args.deadline_factor,
+                                      seed=args.seed)
+    sites = {task_item.site_id for task_item in workload}
+    site_bandwidth = {site_id: args.site_kbps for site_id in sites} if args.site_kbps else None
+    policies = [SchedulingPolicy(value) for value in args.policies] if args.policies else None
+
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):  # 不输出调度器的运行日志
+        results = compare_policies(workload, policies, site_bandwidth_kbps=site_bandwidth)
+    print(format_report(results))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,280 @@
+import threading
+import time
+from typing import Callable, Dict, Iterable, Optional
+
+from .priority_queue import IndexedHeap, TaskItem
+
+def is_connection_refused(error) -> bool:
+    """是否为FTP服务器因连接数过多拒绝服务（421，如 ftplib.error_temp('421 Too many connections')）"""
+    return str(error).lstrip().startswith("421")
+
+class _SiteState:
+    """单个站点的连接状态"""
+
+    def __init__(self):
+        self.configured = None  # 站点配置的最大连接数（FtpSite.max_connections）
+        self.learned = None  # 服务器返回421后得到的上限
+        self.learned_at = 0.0
+        self.in_use = 0  # 运行中任务占用的连接数
+        self.refused = 0  # 累计被拒绝次数
+        self.blocked_until = 0.0  # 被拒绝后在此之前不再派发该站点的任务
+
+class SiteConnectionLimits:
+    """按FTP站点限制并发连接数
+
+    上限取站点配置的 max_connections 与学习到的上限中较小者。服务器返回421时，把上限降到
+    当前连接数减一，并暂停派发该站点的任务 retry_delay 秒；此后每隔 probe_interval 秒
+    上限加一，试探服务器是否已放宽限制，恢复到配置值后不再记录学习到的上限。
+    站点没有任何连接时总是允许派发，避免单个任务需要的连接数超过上限时永远无法执行。
+    """
+
+    def __init__(self, default_limit: int = None, probe_interval: float = 300, retry_delay: float = 5,
+                 clock: Callable[[], float] = time.time):
+        self.default_limit = default_limit  # 未配置站点的上限，None表示不限制
+        self.probe_interval = probe_interval
+        self.retry_delay = retry_delay
+        self.clock = clock
+        self.sites = {}  # site_id -> _SiteState
+        self.limited = default_limit is not None  # 是否配置或学习过任何上限，否则不必按站点过滤
+        self.lock = threading.Lock()
+
+    def _site(self, site_id) -> _SiteState:
+        state = self.sites.get(site_id)
+        if state is None:
+            state = self.sites[site_id] = _SiteState()
+        return state
+
+    def _limit(self, state: _SiteState, now: float) -> Optional[int]:
+        limit = state.configured if state.configured is not None else self.default_limit
+        if state.learned is not None:
+            probed = state.learned + int((now - state.learned_at) // self.probe_interval)
+            if limit is not None and probed >= limit:
+                state.learned = None
+            else:
+                limit = probed if limit is None else min(limit, probed)
+        return limit
+
+    def set_limit(self, site_id, max_connections: Optional[int]):
+        """设置站点的最大连接数，None表示使用默认值"""
+        with self.lock:
+            self._site(site_id).configured = max(int(max_connections), 1) if max_connections else None
+            self.limited = self.limited or bool(max_connections)
+
+    def apply_sites(self, sites: Iterable):
+        """从站点配置加载上限，sites 为具有 id 和 max_connections 属性的对象（如 FtpSite.query.all()）"""
+        for site in sites:
+            self.set_limit(site.id, site.max_connections)
+
+    def limit(self, site_id) -> Optional[int]:
+        """站点当前的连接上限，None表示不限制"""
+        with self.lock:
+            return self._limit(self._site(site_id), self.clock())
+
+    def in_use(self, site_id) -> int:
+        state = self.sites.get(site_id)
+        return state.in_use if state else 0
+
+    def has_capacity(self, site_id, connections: int = 1) -> bool:
+        """站点是否还能再打开 connections 个连接"""
+        if site_id is None or not self.limited:
+            return True
+        with self.lock:
+            state = self.sites.get(site_id)
+            if state is None:
+                return self.default_limit is None or connections <= self.default_limit
+            now = self.clock()
+            if now < state.blocked_until:
+                return False
+            if state.in_use == 0:
+                return True
+            limit = self._limit(state, now)
+            return limit is None or state.in_use + connections <= limit
+
+    def acquire(self, site_id, connections: int = 1):
+        """任务开始执行时占用连接"""
+        if site_id is not None:
+            with self.lock:
+                self._site(site_id).in_use += connections
+
+    def release(self, site_id, connections: int = 1):
+        if site_id is not None:
+            with self.lock:
+                state = self._site(site_id)
+                state.in_use = max(state.in_use - connections, 0)
+
+    def record_refused(self, site_id) -> Optional[int]:
+        """服务器因连接数过多拒绝服务，返回新的上限
+
+        被拒绝的任务此时仍占用连接，已计入 in_use，服务器实际接受的连接数为 in_use - 1。
+        """
+        if site_id is None:
+            return None
+        with self.lock:
+            state = self._site(site_id)
+            now = self.clock()
+            learned = max(state.in_use - 1, 1)
+            current = self._limit(state, now)
+            state.learned = min(learned, current) if current is not None else learned
+            state.learned_at = now
+            state.refused += 1
+            state.blocked_until = now + self.retry_delay
+            self.limited = True
+        print(f"站点 {site_id} 拒绝连接（421），连接上限调整为 {state.learned}")
+        return state.learned
+
+    def next_retry(self, now: float) -> Optional[float]:
+        """距最近一个暂停派发的站点恢复的秒数，没有暂停的站点时返回None"""
+        with self.lock:
+            pending = [state.blocked_until - now for state in self.sites.values() if state.blocked_until > now]
+        return min(pending) if pending else None
+
+    def get_status(self) -> Dict:
+        with self.lock:
+            now = self.clock()
+            return {
+                str(site_id): {
+                    "limit": self._limit(state, now),
+                    "configured": state.configured,
+                    "learned": state.learned,
+                    "in_use": state.in_use,
+                    "refused": state.refused
+                }
+                for site_id, state in self.sites.items()
+            }
+
+class SiteSessionPool:
+    """按站点复用已登录的FTP会话，避免每个任务都重新连接和登录
+
+    connect(site_id) 创建并登录一个会话，close(session) 关闭会话。任务结束后会话放回空闲列表，
+    同一站点的下一个任务直接复用（后进先出，优先使用最近活跃、最不可能已被服务器断开的会话）。
+    空闲会话同样占用服务器连接：站点的会话总数（使用中 + 空闲）达到连接上限时，归还的会话直接关闭。
+    空闲超过 idle_timeout 秒的会话在下次取用时关闭。
+    """
+
+    def __init__(self, connect: Callable, close: Callable = None, limits: SiteConnectionLimits = None,
+                 max_idle_per_site: int = 4, idle_timeout: float = 60, clock: Callable[[], float] = time.time):
+        self.connect = connect
+        self.close = close
+        self.limits = limits
+        self.max_idle_per_site = max_idle_per_site
+        self.idle_timeout = idle_timeout
+        self.clock = clock
+        self.idle = {}  # site_id -> [(归还时间, session)]
+        self.active = {}  # site_id -> 使用中的会话数
+        self.stats = {"created": 0, "reused": 0, "closed": 0}
+        self.lock = threading.Lock()
+
+    def acquire(self, site_id):
+        """取得站点的会话，没有可用的空闲会话时新建（在锁外连接，可能抛出连接错误）"""
+        expired = []
+        session = None
+        with self.lock:
+            idle = self.idle.get(site_id, [])
+            cutoff = self.clock() - self.idle_timeout
+            while idle and idle[0][0] < cutoff:
+                expired.append(idle.pop(0)[1])
+            if idle:
+                session = idle.pop()[1]
+                self.stats["reused"] += 1
+            self.active[site_id] = self.active.get(site_id, 0) + 1
+        self._close_all(expired)
+        if session is not None:
+            return session
+
+        try:
+            session = self.connect(site_id)
+        except Exception:
+            with self.lock:
+                self.active[site_id] -= 1
+            raise
+        with self.lock:
+            self.stats["created"] += 1
+        return session
+
+    def release(self, site_id, session, reusable: bool = True):
+        """归还会话；会话出错或状态未知时 reusable=False，直接关闭"""
+        with self.lock:
+            self.active[site_id] = max(self.active.get(site_id, 0) - 1, 0)
+            idle = self.idle.setdefault(site_id, [])
+            limit = self.limits.limit(site_id) if self.limits else None
+            if (reusable and len(idle) < self.max_idle_per_site and
+                    (limit is None or self.active[site_id] + len(idle) < limit)):
+                idle.append((self.clock(), session))
+                return
+        self._close_all([session])
+
+    def idle_count(self, site_id) -> int:
+        return len(self.idle.get(site_id, ()))
+
+    def close_idle(self, site_id=None):
+        """关闭空闲会话（site_id 为None时关闭所有站点的）"""
+        with self.lock:
+            site_ids = list(self.idle) if site_id is None else [site_id]
+            sessions = [session for key in site_ids for _, session in self.idle.pop(key, [])]
+        self._close_all(sessions)
+
+    def _close_all(self, sessions):
+        for session in sessions:
+            self.stats["closed"] += 1
+            if self.close:
+                try:
+                    self.close(session)
+                except Exception:
+                    pass  # 服务器可能已断开连接
+
+    def get_status(self) -> Dict:
+        with self.lock:
+            return {
+                "idle": {str(site_id): len(idle) for site_id, idle in self.idle.items() if idle},
+                "active": {str(site_id): count for site_id, count in self.active.items() if count},
+                **self.stats
+            }
+
+class SiteTaskIndex:
+    """按站点分组的任务二级索引，每个站点一个按队列顺序排列的堆
+
+    目标站点连接已满时，调度器据此在 O(站点数) 内找到其他站点中排在最前的任务。
+    作为 PriorityTaskQueue 的二级索引使用，add/discard 在队列锁内调用。
+    """
+
+    def __init__(self):
+        self.sites = {}  # site_id -> IndexedHeap
+        self.lock = threading.Lock()
+
+    def add(self, task_item: TaskItem):
+        with self.lock:
+            heap = self.sites.get(task_item.site_id)
+            if heap is None:
+                heap = self.sites[task_item.site_id] = IndexedHeap()
+            heap.push(task_item)
+
+    def discard(self, task_item: TaskItem):
+        with self.lock:
+            heap = self.sites.get(task_item.site_id)
+            if heap is not None and heap.remove(task_item.task_id) is not None and not heap:
+                del self.sites[task_item.site_id]
+
+    def clear(self):
+        with self.lock:
+            self.sites.clear()
+
+    def select(self, site_filter: Callable = None, site_rank: Callable = None) -> Optional[TaskItem]:
+        """各站点队首任务中优先级最高的一个（不移除）
+
+        site_filter(site_id) 返回False的站点跳过；优先级相同时按 site_rank(site_id) 从小到大选择站点，
+        再按队列顺序。
+        """
+        with self.lock:
+            best_key, best = None, None
+            for site_id, heap in self.sites.items():
+                if site_filter is not None and not site_filter(site_id):
+                    continue
+                head = heap.peek()
+                key = (head.priority, site_rank(site_id) if site_rank else 0)
+                if best is None or key < best_key or (key == best_key and head < best):
+                    best_key, best = key, head
+            return best
+
+    def get_status(self) -> Dict:
+        with self.lock:
+            return {str(site_id): len(heap) for site_id, heap in self.sites.items()}
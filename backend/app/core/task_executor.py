@@ -0,0 +1,221 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Callable, Iterator, Set, Tuple
+
+from .checkpoint import CheckpointStore
+
+# 处理函数在时间片用完时返回该值，表示任务让出执行权、稍后从断点继续
+YIELDED = object()
+
+class TaskContext:
+    """任务执行上下文，传递给线程池中的任务处理函数
+
+    长任务应按块传输：每完成一块调用 checkpoint()，然后检查 should_yield()，
+    为True时返回 yield_task()；再次调度时通过 pending_chunks() 跳过已完成的块。
+    时间片用完和被抢占都通过这一方式在块边界暂停，已传输的数据不会丢失。
+    """
+
+    def __init__(self, execution, on_progress: Callable = None,
+                 checkpoint_store: CheckpointStore = None, yield_check: Callable = None,
+                 throttle: Callable = None, sessions=None, on_refused: Callable = None):
+        self.execution = execution
+        self.task_id = execution.task_item.task_id
+        self.payload = execution.task_item.payload
+        self._on_progress = on_progress
+        self._checkpoint_store = checkpoint_store
+        self._yield_check = yield_check
+        self._throttle = throttle
+        self._sessions = sessions  # SiteSessionPool
+        self._on_refused = on_refused
+
+    def report_progress(self, progress: float, transferred_bytes: int = None):
+        """报告进度（0.0 - 1.0）及已传输字节数"""
+        self.execution.progress = max(0.0, min(progress, 1.0))
+        if transferred_bytes is not None:
+            self.execution.transferred_bytes = transferred_bytes
+        if self._on_progress:
+            self._on_progress(self.execution)
+
+    def throttle(self, nbytes: int):
+        """传输 nbytes 字节前调用，按任务所属优先级当前分得的带宽限速（可能阻塞）"""
+        if self._throttle:
+            self._throttle(nbytes)
+
+    def acquire_session(self):
+        """取得目标站点已登录的会话（优先复用空闲会话），用完后调用 release_session 归还"""
+        if self._sessions is None:
+            raise RuntimeError("调度器未配置会话池")
+        return self._sessions.acquire(self.execution.task_item.site_id)
+
+    def release_session(self, session, reusable: bool = True):
+        """归还会话；传输出错、会话状态未知时 reusable=False"""
+        if self._sessions is not None:
+            self._sessions.release(self.execution.task_item.site_id, session, reusable)
+
+    def connection_refused(self):
+        """服务器因连接数过多拒绝服务（421）时调用，然后返回 yield_task()，稍后重试
+
+        处理函数直接抛出以421开头的异常（如 ftplib.error_temp）时，调度器会自动按此处理。
+        """
+        if self._on_refused:
+            self._on_refused()
+
+    def should_stop(self) -> bool:
+        """任务是否已被取消，处理函数应在合适的位置检查并尽快返回"""
+        return self.execution.status == "cancelled"
+
+    def should_yield(self) -> bool:
+        """是否应在当前块边界暂停（被取消、抢占或时间片已用完）"""
+        if self.execution.status in ("cancelled", "preempting"):
+            return True
+        return bool(self._yield_check and self._yield_check())
+
+    def yield_task(self):
+        """让出执行权，处理函数应直接返回该值"""
+        return YIELDED
+
+    def checkpoint(self, task_file_id: int, chunk_index: int, start_offset: int,
+                   end_offset: int, checksum: str = None):
+        """记录一个已完成的块"""
+        if self._checkpoint_store:
+            self._checkpoint_store.save_chunk(self.task_id, task_file_id, chunk_index,
+                                              start_offset, end_offset, checksum)
+
+    def completed_chunks(self, task_file_id: int) -> Set[int]:
+        """获取任务文件已完成的块序号"""
+        if self._checkpoint_store:
+            return self._checkpoint_store.completed_chunks(self.task_id, task_file_id)
+        return set()
+
+    def pending_chunks(self, task_file_id: int, file_size: int,
+                       chunk_size: int) -> Iterator[Tuple[int, int, int]]:
+        """按块遍历文件中尚未完成的部分，生成 (chunk_index, start_offset, end_offset)"""
+        done = self.completed_chunks(task_file_id)
+        for chunk_index, start_offset in enumerate(range(0, file_size, chunk_size)):
+            if chunk_index not in done:
+                yield chunk_index, start_offset, min(start_offset + chunk_size, file_size)
+
+class TaskExecutor:
+    """任务执行器基类
+
+    submit 提交任务后立即返回；任务结束时调用 on_done(execution, result, error)，
+    error 为 None 表示成功。
+    """
+
+    def submit(self, execution, handler, context: TaskContext, on_done: Callable):
+        raise NotImplementedError
+
+    def cancel(self, execution) -> bool:
+        """尝试取消尚未开始的任务"""
+        return False
+
+    def shutdown(self, wait: bool = True):
+        pass
+
+class ThreadPoolTaskExecutor(TaskExecutor):
+    """进程内线程池执行器，适合I/O密集的传输任务
+
+    处理函数签名: handler(context: TaskContext) -> Any，返回 YIELDED 表示让出时间片
+    """
+
+    def __init__(self, max_workers: int = 10):
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="task-worker")
+        self.futures = {}  # task_id -> Future
+        self.lock = threading.Lock()
+
+    def submit(self, execution, handler, context: TaskContext, on_done: Callable):
+        task_id = execution.task_item.task_id
+        future = self.pool.submit(handler, context)
+        with self.lock:
+            self.futures[task_id] = future
+        future.add_done_callback(lambda f: self._finish(task_id, execution, f, on_done))
+
+    def _finish(self, task_id, execution, future, on_done):
+        with self.lock:
+            self.futures.pop(task_id, None)
+        if future.cancelled():
+            on_done(execution, None, "cancelled")
+            return
+        error = future.exception()
+        on_done(execution, None if error else future.result(), error)
+
+    def cancel(self, execution) -> bool:
+        with self.lock:
+            future = self.futures.get(execution.task_item.task_id)
+        return future.cancel() if future else False
+
+    def shutdown(self, wait: bool = True):
+        self.pool.shutdown(wait=wait)
+
+class ProcessPoolTaskExecutor(ThreadPoolTaskExecutor):
+    """进程池执行器，适合校验和计算、压缩等CPU密集任务
+
+    处理函数必须是可pickle的模块级函数，签名: handler(task_id: str, payload: dict) -> Any。
+    子进程中无法实时报告进度或让出时间片，任务结束后进度置为1.0。
+    """
+
+    def __init__(self, max_workers: int = None):
+        self.pool = ProcessPoolExecutor(max_workers=max_workers)
+        self.futures = {}
+        self.lock = threading.Lock()
+
+    def submit(self, execution, handler, context: TaskContext, on_done: Callable):
+        task_id = execution.task_item.task_id
+        future = self.pool.submit(handler, task_id, context.payload)
+        with self.lock:
+            self.futures[task_id] = future
+        future.add_done_callback(lambda f: self._finish(task_id, execution, f, on_done))
+
+class CeleryTaskExecutor(TaskExecutor):
+    """Celery适配器，把任务发送到Celery worker执行
+
+    handler 为Celery任务名（如 'app.core.tasks.transfer_file'），以 (task_id, payload) 调用；
+    后台线程定期轮询结果并回调。
+    """
+
+    def __init__(self, celery_app, poll_interval: float = 1.0):
+        self.celery_app = celery_app
+        self.poll_interval = poll_interval
+        self.pending = {}  # task_id -> (AsyncResult, execution, on_done)
+        self.lock = threading.Lock()
+        self._running = True
+        self._poller = threading.Thread(target=self._poll_loop, daemon=True)
+        self._poller.start()
+
+    def submit(self, execution, handler, context: TaskContext, on_done: Callable):
+        task_id = execution.task_item.task_id
+        async_result = self.celery_app.send_task(handler, args=[task_id, context.payload])
+        with self.lock:
+            self.pending[task_id] = (async_result, execution, on_done)
+
+    def cancel(self, execution) -> bool:
+        with self.lock:
+            entry = self.pending.pop(execution.task_item.task_id, None)
+        if entry is None:
+            return False
+        entry[0].revoke()
+        return True
+
+    def _poll_loop(self):
+        while self._running:
+            with self.lock:
+                entries = list(self.pending.items())
+            for task_id, (async_result, execution, on_done) in entries:
+                try:
+                    if not async_result.ready():
+                        continue
+                    with self.lock:
+                        self.pending.pop(task_id, None)
+                    if async_result.successful():
+                        on_done(execution, async_result.result, None)
+                    else:
+                        on_done(execution, None, async_result.result)
+                except Exception as e:
+                    print(f"Celery任务 {task_id} 状态查询失败: {e}")
+            time.sleep(self.poll_interval)
+
+    def shutdown(self, wait: bool = True):
+        self._running = False
+        if wait:
+            self._poller.join(timeout=self.poll_interval * 2)
@@ -0,0 +1,257 @@
+import os
+import socket
+import threading
+from datetime import datetime, timedelta
+from typing import List, Set
+
+from .admission import AdmissionRejected
+from .priority_queue import TaskItem
+from .queue_journal import task_item_from_row, transfer_task_columns
+
+class TaskLeaseManager:
+    """分布式调度：多个调度节点通过数据库租约共享 transfer_tasks 中的等待任务
+
+    每个节点按优先级批量认领 status 为 pending 且未被持有（或租约已过期）的任务，写入
+    lease_owner / lease_expires_at 后放入本地调度器；后台线程定期续租，并把租约过期的
+    running 任务重置为 pending，使宕机节点的任务被其他节点接管。续租时发现任务已被其他节点
+    接管（本节点曾长时间失联），则从本地调度器中移除，避免同一任务在两个节点上执行。
+    任务结束时，结束状态和清除租约在同一条UPDATE中写入，其他节点不会在两者之间重新认领该任务。
+
+    支持 SKIP LOCKED 的数据库（PostgreSQL、MySQL 8）用 SELECT ... FOR UPDATE SKIP LOCKED 认领，
+    各节点互不阻塞；SQLite 等不支持的数据库用带条件的 UPDATE 认领，再查询实际认领到的行。
+    需要传入Flask应用以便在后台线程中使用数据库。
+    """
+
+    SKIP_LOCKED_DIALECTS = ("postgresql", "mysql", "mariadb", "oracle")
+    IN_CLAUSE_SIZE = 500
+
+    def __init__(self, app, node_id: str = None, lease_seconds: float = 60, batch_size: int = 20,
+                 heartbeat_interval: float = None, task_type: str = "transfer"):
+        self.app = app
+        self.node_id = node_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.lease_seconds = lease_seconds
+        self.batch_size = batch_size  # 本地队列低于该数量时认领新任务
+        self.heartbeat_interval = heartbeat_interval or lease_seconds / 3
+        self.task_type = task_type  # 认领的任务项使用的处理函数类型
+        self.scheduler = None
+        self.held = set()  # 本节点持有租约的 TransferTask.id
+        self.released = {}  # 等待释放租约的 TransferTask.id -> 结束状态（completed / failed），None表示只释放租约
+        self.lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._running = False
+        self._thread = None
+
+    def attach(self, scheduler):
+        """把认领的任务交给调度器执行，任务结束时释放租约"""
+        self.scheduler = scheduler
+        scheduler.add_task_listener(self._on_task_event)
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self, release: bool = True):
+        """停止后台线程，应在调度器停止之后调用
+
+        release=True 时释放本节点持有的所有租约，未完成的 running 任务重置为 pending，
+        供其他节点立即接管；否则等租约过期后由其他节点接管。
+        """
+        self._running = False
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join(timeout=10)
+            self._thread = None
+        self._release_pending()
+        if release:
+            with self.lock:
+                for row_id in self.held:
+                    self.released.setdefault(row_id, None)
+                self.held = set()
+            self._release_pending(reset_running=True)
+
+    def _on_task_event(self, event: str, execution):
+        if event in ("completed", "failed"):
+            row_id = _row_id(execution.task_item.task_id)
+            if row_id is not None:
+                with self.lock:
+                    self.released[row_id] = event
+                self._wakeup.set()
+
+    def _run(self):
+        while self._running:
+            try:
+                self.heartbeat()
+            except Exception as e:
+                print(f"任务租约维护错误: {e}")
+            self._wakeup.wait(self.heartbeat_interval)
+            self._wakeup.clear()
+
+    def heartbeat(self):
+        """一次维护：释放已结束任务的租约、续租、接管过期任务，本地任务不足时认领新任务"""
+        self._release_pending()
+        lost = self.renew()
+        if lost and self.scheduler:
+            for row_id in lost:
+                self.scheduler.remove_task(str(row_id), record=False)
+            print(f"{len(lost)} 个任务的租约已被其他节点接管，已从本节点移除")
+        self.reclaim_expired()
+
+        if self.scheduler:
+            missing = self.batch_size - len(self.scheduler.task_queue)
+            if missing > 0:
+                task_items = self.claim_batch(missing)
+                if task_items:
+                    try:
+                        self.scheduler.add_tasks(task_items)
+                    except AdmissionRejected as e:
+                        # 本节点队列已满，立即释放租约，交给其他节点
+                        with self.lock:
+                            for task_item in task_items:
+                                self.released[_row_id(task_item.task_id)] = None
+                        print(f"本节点拒绝认领的任务: {e.message}")
+
+    def claim_batch(self, limit: int) -> List[TaskItem]:
+        """按优先级和创建时间认领最多 limit 个等待中的任务"""
+        from app import db
+        from app.models import TransferTask
+
+        now = datetime.utcnow()
+        expires = now + timedelta(seconds=self.lease_seconds)
+        claimable = db.and_(
+            TransferTask.status == "pending",
+            db.or_(TransferTask.lease_owner.is_(None), TransferTask.lease_expires_at < now)
+        )
+        lease = {"lease_owner": self.node_id, "lease_expires_at": expires}
+        order = (TransferTask.priority, TransferTask.created_at)
+
+        with self.app.app_context():
+            if db.engine.dialect.name in self.SKIP_LOCKED_DIALECTS:
+                rows = db.session.query(*transfer_task_columns()).filter(claimable).order_by(*order) \
+                    .limit(limit).with_for_update(skip_locked=True, of=TransferTask).all()
+                if rows:
+                    TransferTask.query.filter(TransferTask.id.in_([row.id for row in rows])).update(
+                        lease, synchronize_session=False)
+                db.session.commit()
+            else:
+                # 条件UPDATE在单条语句内原子执行，被其他节点抢先认领的行不满足条件，不会被覆盖
+                candidates = [row.id for row in db.session.query(TransferTask.id)
+                              .filter(claimable).order_by(*order).limit(limit).all()]
+                rows = []
+                if candidates:
+                    TransferTask.query.filter(TransferTask.id.in_(candidates), claimable).update(
+                        lease, synchronize_session=False)
+                    db.session.commit()
+                    rows = db.session.query(*transfer_task_columns()).filter(
+                        TransferTask.id.in_(candidates),
+                        TransferTask.lease_owner == self.node_id,
+                        TransferTask.lease_expires_at == expires
+                    ).order_by(*order).all()
+
+        with self.lock:
+            self.held.update(row.id for row in rows)
+        return [task_item_from_row(row, self.task_type) for row in rows]
+
+    def renew(self) -> Set[int]:
+        """延长本节点所有租约，返回已不再由本节点持有的任务"""
+        from app import db
+        from app.models import TransferTask
+
+        with self.lock:
+            held = list(self.held)
+        if not held:
+            return set()
+
+        expires = datetime.utcnow() + timedelta(seconds=self.lease_seconds)
+        renewed = 0
+        with self.app.app_context():
+            for chunk in self._chunks(held):
+                renewed += TransferTask.query.filter(
+                    TransferTask.id.in_(chunk), TransferTask.lease_owner == self.node_id
+                ).update({"lease_expires_at": expires}, synchronize_session=False)
+            db.session.commit()
+            if renewed == len(held):
+                return set()
+
+            still_held = set()
+            for chunk in self._chunks(held):
+                still_held.update(row.id for row in db.session.query(TransferTask.id).filter(
+                    TransferTask.id.in_(chunk), TransferTask.lease_owner == self.node_id))
+
+        lost = set(held) - still_held
+        with self.lock:
+            self.held -= lost
+        return lost
+
+    def reclaim_expired(self) -> int:
+        """把租约过期的 running 任务重置为 pending 并清除租约，返回接管的数量"""
+        from app import db
+        from app.models import TransferTask
+
+        with self.app.app_context():
+            reclaimed = TransferTask.query.filter(
+                TransferTask.status == "running",
+                TransferTask.lease_expires_at < datetime.utcnow()
+            ).update({"status": "pending", "lease_owner": None, "lease_expires_at": None},
+                     synchronize_session=False)
+            db.session.commit()
+        if reclaimed:
+            print(f"接管 {reclaimed} 个租约过期的任务")
+        return reclaimed
+
+    def _release_pending(self, reset_running: bool = False):
+        """写入已结束任务的状态并清除租约；reset_running=True 时把只释放租约的 running 任务重置为 pending
+
+        写入失败时保留待释放的记录，下次维护时重试。
+        """
+        from app import db
+        from app.models import TransferTask
+
+        with self.lock:
+            released, self.released = self.released, {}
+            self.held.difference_update(released)
+        if not released:
+            return
+
+        by_status = {}
+        for row_id, status in released.items():
+            by_status.setdefault(status, []).append(row_id)
+        now = datetime.utcnow()
+        with self.app.app_context():
+            try:
+                for status, row_ids in by_status.items():
+                    values = {"lease_owner": None, "lease_expires_at": None}
+                    if status is not None:
+                        values.update({"status": status, "completed_at": now})
+                    for chunk in self._chunks(row_ids):
+                        TransferTask.query.filter(
+                            TransferTask.id.in_(chunk), TransferTask.lease_owner == self.node_id
+                        ).update(values, synchronize_session=False)
+                        if reset_running and status is None:
+                            TransferTask.query.filter(
+                                TransferTask.id.in_(chunk), TransferTask.status == "running"
+                            ).update({"status": "pending"}, synchronize_session=False)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                with self.lock:
+                    for row_id, status in released.items():
+                        self.released.setdefault(row_id, status)
+                raise
+
+    def _chunks(self, row_ids: List[int]):
+        for start in range(0, len(row_ids), self.IN_CLAUSE_SIZE):
+            yield row_ids[start:start + self.IN_CLAUSE_SIZE]
+
+    def get_status(self) -> dict:
+        with self.lock:
+            return {
+                "node_id": self.node_id,
+                "lease_seconds": self.lease_seconds,
+                "held_tasks": len(self.held)
+            }
+
+def _row_id(task_id: str):
+    return int(task_id) if str(task_id).isdigit() else None
@@ -1,11 +1,22 @@
 import asyncio
 import time
 import threading
+from collections import Counter
 from enum import Enum
-from typing import Dict, List, Optional
+from typing import Any, Callable, Dict, List, Optional
 from dataclasses import dataclass
-from .priority_queue import PriorityTaskQueue, TaskItem, TaskPriority
+from .priority_queue import PriorityTaskQueue, TaskItem, TaskPriority, KeyedTaskIndex
 from .resource_manager import ResourceManager, ResourceAllocation
+from .task_executor import TaskContext, TaskExecutor, ThreadPoolTaskExecutor, YIELDED
+from .checkpoint import CheckpointStore, MemoryCheckpointStore
+from .fair_share import FairShareIndex
+from .adaptive import AdaptiveController
+from .aging import AgingIndex
+from .queue_journal import QueueJournal
+from .site_connections import SiteConnectionLimits, SiteSessionPool, SiteTaskIndex, is_connection_refused
+from .admission import AdmissionController, AdmissionRejected
+from .metrics import SchedulerMetrics
+from .retry_policy import CircuitBreaker, DelayedTaskQueue, PermanentError, RetryPolicy, is_retryable
 
 class SchedulingPolicy(Enum):
     """调度策略枚举"""
@@ -13,6 +24,8 @@ class SchedulingPolicy(Enum):
     ROUND_ROBIN = "round_robin"                    # 时间片轮转
     FAIR_SHARE = "fair_share"                      # 公平共享
     ADAPTIVE = "adaptive"                          # 自适应调度
+    EARLIEST_DEADLINE_FIRST = "earliest_deadline_first"    # 最早截止时间优先
+    SHORTEST_REMAINING_BYTES = "shortest_remaining_bytes"  # 剩余字节数最少优先
 
 @dataclass
 class TaskExecution:
@@ -23,44 +36,150 @@ class TaskExecution:
     completed_at: Optional[float] = None
     preempted_at: Optional[float] = None
     progress: float = 0.0
-    status: str = "running"  # running, completed, failed, preempted
+    status: str = "running"  # running, preempting, preempted, yielded, retrying, completed, failed, cancelled
     error: Optional[str] = None
     is_preempted: bool = False
+    transferred_bytes: int = 0  # 本次执行已传输的字节数
+    result: Any = None
+    executor: Optional[str] = None  # 执行该任务的执行器名称
+    slice_deadline: Optional[float] = None  # 时间片轮转时本次时间片的结束时间
+    transient_error: bool = False  # 失败是否为临时性错误（可重试，计入站点熔断）
+    refused: bool = False  # 本次执行是否已记录过站点拒绝连接（421）
 
 class TaskScheduler:
     """动态任务调度器"""
     
-    def __init__(self, resource_manager: ResourceManager, task_queue: PriorityTaskQueue):
+    # 系统配置键 -> self.config 中对应的调度参数
+    SYSTEM_CONFIG_KEYS = {
+        "scheduler.time_slice_seconds": "time_slice_seconds",
+        "scheduler.preemption_enabled": "preemption_enabled",
+        "scheduler.starvation_threshold": "starvation_threshold",
+        "scheduler.retry_base_delay": "retry_base_delay",
+        "scheduler.retry_max_delay": "retry_max_delay",
+        "scheduler.circuit_failure_threshold": "circuit_failure_threshold",
+        "scheduler.circuit_cooldown": "circuit_cooldown",
+        "scheduler.max_queued_tasks": "max_queued_tasks",
+        "scheduler.max_queued_tasks_per_user": "max_queued_tasks_per_user",
+        "scheduler.max_queue_memory_mb": "max_queue_memory_mb",
+        "scheduler.admission_min_available_memory_mb": "admission_min_available_memory_mb"
+    }
+    
+    def __init__(self, resource_manager: ResourceManager, task_queue: PriorityTaskQueue,
+                 executors: Dict[str, TaskExecutor] = None,
+                 checkpoint_store: CheckpointStore = None, journal: QueueJournal = None,
+                 get_config: Callable = None, get_sites: Callable = None,
+                 clock: Callable[[], float] = time.time):
         self.resource_manager = resource_manager
         self.task_queue = task_queue
+        self.clock = clock  # 时间来源，模拟时替换为虚拟时钟
         self.running_tasks = {}  # task_id -> TaskExecution
+        # 调度器锁：running_tasks 和执行状态由调度线程、执行器回调线程和API线程（remove_task）共同修改
+        self.lock = threading.RLock()
+        
+        # 任务执行器：默认使用线程池，并发上限由ResourceManager的资源分配控制
+        self.executors = executors or {
+            "thread": ThreadPoolTaskExecutor(
+                max_workers=resource_manager.system_resources.max_concurrent_tasks)
+        }
+        self.handlers = {}  # task_type -> (handler, executor_name)
+        self.task_listeners = []  # callback(event, execution)，event: progress/completed/failed
+        self.checkpoint_store = checkpoint_store or MemoryCheckpointStore()
+        self.journal = journal or QueueJournal()  # 队列持久化，默认不记录
+        self.get_config = get_config  # 系统配置来源 get_config(key, default)，形如 SystemConfig.get_config
+        self.get_sites = get_sites  # 站点配置来源，返回具有 id 和 max_connections 属性的站点（如 FtpSite）
         self.scheduling_policy = SchedulingPolicy.PRIORITY_PREEMPTIVE
         self.is_running = False
         self.scheduler_thread = None
         
+        # 公平共享：按 用户/站点 维护的二级索引，随队列同步更新
+        self.fair_share = FairShareIndex()
+        self.task_queue.add_index(self.fair_share)
+        
+        # 截止时间 / 剩余字节数排序的二级索引，关键任务始终排在最前
+        self.deadline_index = KeyedTaskIndex(self._deadline_key)
+        self.remaining_bytes_index = KeyedTaskIndex(self._remaining_bytes_key)
+        self.task_queue.add_index(self.deadline_index)
+        self.task_queue.add_index(self.remaining_bytes_index)
+        
+        # 按站点限制并发连接：目标站点连接已满时改派其他站点的任务；会话池由 set_session_factory 配置
+        self.site_limits = SiteConnectionLimits(clock=clock)
+        self.site_index = SiteTaskIndex()
+        self.task_queue.add_index(self.site_index)
+        self.sessions = None
+        
+        # 事件驱动：新任务到达、任务结束或停止时唤醒调度线程
+        self._wakeup = threading.Event()
+        self.task_queue.add_listener(self.notify)
+        
         # 调度配置
         self.config = {
             "time_slice_seconds": 30,           # 时间片长度
             "preemption_enabled": True,         # 是否启用抢占
-            "starvation_threshold": 300,        # 饥饿阈值（秒）
+            "starvation_threshold": 300,        # 饥饿阈值（秒），任务在同一优先级等待超过该时间后提升一级（最高到NORMAL）
             "load_balance_interval": 60,        # 负载均衡间隔
             "max_preemptions_per_minute": 5,    # 每分钟最大抢占次数
-            "scheduler_interval": 1             # 调度器运行间隔（秒）
+            "scheduler_interval": 1,            # 有等待或运行中任务时的最长检查间隔（秒）
+            "adaptive_interval": 10,            # 自适应调度的评估间隔（秒）
+            "adaptive_max_site_connections": 8, # 自适应调度中单个站点的最大并发
+            "resource_sampling_interval": 2,    # 主机资源采样间隔（秒），0表示不采样
+            "retry_base_delay": 5,              # 首次重试前的等待时间（秒），之后按指数增长
+            "retry_max_delay": 300,             # 重试等待时间上限（秒）
+            "circuit_failure_threshold": 5,     # 站点连续失败多少次后熔断
+            "circuit_cooldown": 30,             # 熔断后暂停派发的时间（秒），再次熔断时加倍
+            "max_queued_tasks": 100000,         # 排队任务总数上限，超过时拒绝新提交
+            "max_queued_tasks_per_user": 20000, # 每个用户的排队任务数上限
+            "max_queue_memory_mb": 256,         # 排队任务估计占用内存的上限（MB）
+            "admission_min_available_memory_mb": 128  # 主机可用内存低于该值时拒绝新提交
         }
         
+        # 准入控制：限制排队任务数量和内存，超限时 add_task 抛出 AdmissionRejected
+        self.admission = AdmissionController(
+            max_queued_tasks=self.config["max_queued_tasks"],
+            max_queued_per_user=self.config["max_queued_tasks_per_user"],
+            max_queue_memory_mb=self.config["max_queue_memory_mb"],
+            min_available_memory_mb=self.config["admission_min_available_memory_mb"],
+            available_memory=lambda: self.resource_manager.measured_usage.get("memory_available_mb"),
+            clock=clock
+        )
+        self.task_queue.add_index(self.admission)
+        
+        # 失败重试：按可重试时间排序的延迟队列，站点连续失败时熔断，冷却期间不派发该站点的任务
+        self.retry_policy = RetryPolicy(self.config["retry_base_delay"], self.config["retry_max_delay"])
+        self.retry_queue = DelayedTaskQueue()
+        self.circuit_breaker = CircuitBreaker(self.config["circuit_failure_threshold"],
+                                              self.config["circuit_cooldown"], clock=clock)
+        
+        # 自适应调度：按站点测量吞吐量和错误率，AIMD调整站点并发，不超过站点的连接上限
+        self.adaptive = AdaptiveController(
+            max_limit=self.config["adaptive_max_site_connections"],
+            interval=self.config["adaptive_interval"],
+            site_cap=self.site_limits.limit,
+            clock=clock
+        )
+        
         # 统计信息
         self.stats = {
             "total_scheduled": 0,
             "total_completed": 0,
             "total_preempted": 0,
             "total_failed": 0,
+            "total_yielded": 0,
+            "total_reclaimed": 0,
+            "total_retried": 0,
+            "total_rejected": 0,
+            "total_aged": 0,
+            "deadline_missed": 0,
             "average_wait_time": 0,
             "average_execution_time": 0,
             "last_schedule_time": None
         }
         
-        # 饥饿检测
-        self.starvation_tracker = {}  # task_id -> first_queued_time
+        # 等待时间、执行时间等按优先级和站点统计的直方图
+        self.metrics = SchedulerMetrics()
+        
+        # 饥饿检测：按优先级维护等待时间FIFO，逐级提升等待过久的任务，最多提升到NORMAL，不与HIGH争抢
+        self.aging = AgingIndex(max_priority=TaskPriority.NORMAL, clock=clock)
+        self.task_queue.add_index(self.aging)
         
         # 抢占限制
         self.preemption_history = []  # 记录最近的抢占时间
@@ -68,48 +187,185 @@ class TaskScheduler:
     def start(self):
         """启动调度器"""
         if not self.is_running:
+            self.load_config()
+            self.load_site_limits()
             self.is_running = True
             self.scheduler_thread = threading.Thread(target=self._scheduler_loop, daemon=True)
             self.scheduler_thread.start()
+            if self.config["resource_sampling_interval"]:
+                self.resource_manager.start_sampling(self.config["resource_sampling_interval"])
     
     def stop(self):
         """停止调度器"""
         self.is_running = False
+        self.notify()
         if self.scheduler_thread:
             self.scheduler_thread.join(timeout=5)
+        self.resource_manager.stop_sampling()
+    
+    def shutdown(self, wait: bool = True):
+        """停止调度器并关闭所有执行器"""
+        self.stop()
+        for executor in self.executors.values():
+            executor.shutdown(wait=wait)
+        if self.sessions:
+            self.sessions.close_idle()
+        self.journal.close()
+    
+    def load_config(self):
+        """从系统配置加载调度参数和公平共享权重，调度器启动和调度配置修改后调用"""
+        if self.get_config is None:
+            return
+        for key, name in self.SYSTEM_CONFIG_KEYS.items():
+            value = self.get_config(key, None)
+            if value is not None:
+                self.config[name] = value
+        self._apply_config()
+        self.fair_share.apply_config(self.get_config)
+        self.notify()
+    
+    def _apply_config(self):
+        """把 self.config 中的参数应用到创建时复制了这些参数的组件"""
+        self.retry_policy.base_delay = self.config["retry_base_delay"]
+        self.retry_policy.max_delay = self.config["retry_max_delay"]
+        self.circuit_breaker.failure_threshold = self.config["circuit_failure_threshold"]
+        self.circuit_breaker.base_cooldown = self.config["circuit_cooldown"]
+        self.admission.max_queued_tasks = self.config["max_queued_tasks"]
+        self.admission.max_queued_per_user = self.config["max_queued_tasks_per_user"]
+        self.admission.max_queue_memory_mb = self.config["max_queue_memory_mb"]
+        self.admission.min_available_memory_mb = self.config["admission_min_available_memory_mb"]
+    
+    def recover_queue(self) -> int:
+        """从队列日志恢复重启前未结束的任务（含当时正在执行的任务），应在 start() 之前调用"""
+        task_items = self.journal.recover()
+        if task_items:
+            self.task_queue.put_many(task_items, notify=False)
+            print(f"从队列日志恢复 {len(task_items)} 个任务")
+        return len(task_items)
+    
+    def register_executor(self, name: str, executor: TaskExecutor):
+        """注册执行器，如 'process' -> ProcessPoolTaskExecutor、'celery' -> CeleryTaskExecutor"""
+        self.executors[name] = executor
+    
+    def register_handler(self, task_type: str, handler, executor: str = "thread"):
+        """注册任务处理函数
+        
+        线程池执行器: handler(context: TaskContext)
+        进程池执行器: handler(task_id, payload)，必须是模块级函数
+        Celery执行器: handler 为Celery任务名
+        """
+        if executor not in self.executors:
+            raise ValueError(f"未注册的执行器: {executor}")
+        self.handlers[task_type] = (handler, executor)
+    
+    def set_session_factory(self, connect: Callable, close: Callable = None, **kwargs):
+        """配置FTP会话池：connect(site_id) 创建并登录会话，close(session) 关闭会话
+
+        处理函数通过 context.acquire_session() / release_session() 复用同一站点已登录的会话。
+        """
+        self.sessions = SiteSessionPool(connect, close, limits=self.site_limits, clock=self.clock, **kwargs)
+    
+    def load_site_limits(self, sites=None):
+        """从站点配置加载各站点的最大连接数，sites 为空时从 get_sites 读取；调度器启动时调用"""
+        if sites is None:
+            if self.get_sites is None:
+                return
+            sites = self.get_sites()
+        sites = list(sites)
+        self.site_limits.apply_sites(sites)
+        for site in sites:
+            self._sync_adaptive_limit(site.id)
+        self.notify()
+    
+    def set_site_connection_limit(self, site_id, max_connections: Optional[int]):
+        """设置站点的最大并发连接数（FtpSite.max_connections），None表示不限制"""
+        self.site_limits.set_limit(site_id, max_connections)
+        self._sync_adaptive_limit(site_id)
+        self.notify()
+    
+    def _sync_adaptive_limit(self, site_id):
+        """站点连接上限变化（加载、修改或421后学到）时，同步为自适应并发的上界"""
+        if site_id is not None:
+            self.adaptive.set_site_max_limit(site_id, self.site_limits.limit(site_id))
+    
+    def add_task_listener(self, callback: Callable):
+        """添加任务事件监听器 callback(event, execution)，在工作线程中调用"""
+        self.task_listeners.append(callback)
+    
+    def notify(self):
+        """唤醒调度线程（任务入队、优先级变化、任务结束时调用）"""
+        self._wakeup.set()
     
     def _scheduler_loop(self):
-        """调度器主循环"""
+        """调度器主循环
+        
+        事件驱动：每轮调度后，只要还能派发任务就继续；否则阻塞等待唤醒。
+        队列和运行中任务都为空时无限期等待，不占用CPU。
+        """
         while self.is_running:
             try:
-                # 1. 检查并处理饥饿任务
-                self._handle_starvation()
-                
-                # 2. 根据调度策略调度新任务
-                if self.scheduling_policy == SchedulingPolicy.PRIORITY_PREEMPTIVE:
-                    self._priority_preemptive_schedule()
-                elif self.scheduling_policy == SchedulingPolicy.ROUND_ROBIN:
-                    self._round_robin_schedule()
-                elif self.scheduling_policy == SchedulingPolicy.FAIR_SHARE:
-                    self._fair_share_schedule()
-                elif self.scheduling_policy == SchedulingPolicy.ADAPTIVE:
-                    self._adaptive_schedule()
-                
-                # 3. 检查任务完成情况
-                self._check_completed_tasks()
+                self._wakeup.clear()
                 
-                # 4. 清理过期的抢占记录
-                self._cleanup_preemption_history()
+                scheduled = self.stats["total_scheduled"]
+                self.schedule_once()
+                if self.stats["total_scheduled"] != scheduled:
+                    continue
                 
-                # 5. 更新统计信息
-                self.stats["last_schedule_time"] = time.time()
-                
-                time.sleep(self.config["scheduler_interval"])
+                self._wakeup.wait(self._next_wakeup_timeout())
                 
             except Exception as e:
                 print(f"调度器错误: {e}")
                 time.sleep(5)
     
+    def schedule_once(self):
+        """执行一轮调度（持有调度器锁）"""
+        with self.lock:
+            # 1. 回收已结束任务的资源，使本轮即可派发等待中的任务；到期的重试任务放回队列
+            self._check_completed_tasks()
+            self._release_due_retries()
+            
+            # 2. 检查并处理饥饿任务
+            self._handle_starvation()
+            
+            # 3. 根据调度策略调度新任务
+            if self.scheduling_policy == SchedulingPolicy.PRIORITY_PREEMPTIVE:
+                self._priority_preemptive_schedule()
+            elif self.scheduling_policy == SchedulingPolicy.ROUND_ROBIN:
+                self._round_robin_schedule()
+            elif self.scheduling_policy == SchedulingPolicy.FAIR_SHARE:
+                self._fair_share_schedule()
+            elif self.scheduling_policy == SchedulingPolicy.ADAPTIVE:
+                self._adaptive_schedule()
+            elif self.scheduling_policy == SchedulingPolicy.EARLIEST_DEADLINE_FIRST:
+                self._indexed_schedule(self.deadline_index)
+            elif self.scheduling_policy == SchedulingPolicy.SHORTEST_REMAINING_BYTES:
+                self._indexed_schedule(self.remaining_bytes_index)
+            
+            # 4. 清理过期的抢占记录
+            self._cleanup_preemption_history()
+            
+            # 5. 更新统计信息
+            self.stats["last_schedule_time"] = self.clock()
+    
+    def _next_wakeup_timeout(self) -> Optional[float]:
+        """计算下次无事件时的唤醒间隔，None表示一直等待
+        
+        任务结束由执行器回调唤醒，只有饥饿检测和自适应评估需要定时检查。
+        """
+        timeout = self.aging.next_due(self.clock(), self.config["starvation_threshold"])
+        
+        if self.scheduling_policy == SchedulingPolicy.ADAPTIVE and self.running_tasks:
+            adaptive_timeout = max(self.adaptive.last_update + self.adaptive.interval - self.clock(), 0.1)
+            timeout = adaptive_timeout if timeout is None else min(timeout, adaptive_timeout)
+        
+        now = self.clock()
+        timeouts = [timeout, self.retry_queue.next_due(now)]
+        if not self.task_queue.is_empty():
+            # 因421或熔断暂停派发的站点恢复时重新调度
+            timeouts += [self.site_limits.next_retry(now), self.circuit_breaker.next_change(now)]
+        timeouts = [value for value in timeouts if value is not None]
+        return min(timeouts) if timeouts else None
+    
     def _priority_preemptive_schedule(self):
         """抢占式优先级调度"""
         # 获取下一个高优先级任务
@@ -122,20 +378,33 @@ class TaskScheduler:
                 next_task = self.task_queue.get([TaskPriority.LOW, TaskPriority.BACKGROUND])
         
         if next_task:
-            # 检查是否需要抢占
+            # 资源不足时才考虑抢占
+            required_resources = self._calculate_required_resources(next_task)
             if (next_task.priority <= TaskPriority.HIGH and 
                 self.config["preemption_enabled"] and 
+                self._site_available(next_task.site_id, required_resources.ftp_connections) and
+                not self.resource_manager.can_allocate_resources(next_task.priority, required_resources) and
                 self._can_preempt()):
                 self._try_preemption(next_task)
             else:
-                self._try_start_task(next_task)
+                self._try_start_task(next_task, other_sites=True)
     
     def _try_preemption(self, high_priority_task: TaskItem):
-        """尝试抢占低优先级任务"""
+        """尝试抢占低优先级任务
+        
+        被抢占的任务要到下一个块边界才释放资源，期间高优先级任务仍在等待；
+        已在停止中的任务释放后足够启动时不再抢占新的任务，每个被抢占的任务只计一次。
+        """
+        required_resources = self._calculate_required_resources(high_priority_task)
+        if self.resource_manager.covered_by_releasing(required_resources, self._releasing_tasks()):
+            self._try_start_task(high_priority_task)
+            return
+        
         # 查找可以被抢占的任务
         preemptable_tasks = [
             (task_id, execution) for task_id, execution in self.running_tasks.items()
-            if execution.task_item.priority > high_priority_task.priority
+            if execution.status == "running" and
+            execution.task_item.priority > high_priority_task.priority
         ]
         
         if preemptable_tasks:
@@ -144,19 +413,28 @@ class TaskScheduler:
             task_id, execution = task_to_preempt
             
             # 执行抢占
-            self._preempt_task(task_id)
+            if self._preempt_task(task_id):
+                self.stats["total_preempted"] += 1
+                self._record_preemption()
             
             # 启动高优先级任务
             self._try_start_task(high_priority_task)
-            
-            self.stats["total_preempted"] += 1
-            self._record_preemption()
+        else:
+            # 没有可抢占的任务，按正常流程尝试启动（资源不足时会放回队列）
+            self._try_start_task(high_priority_task)
     
-    def _try_start_task(self, task_item: TaskItem):
-        """尝试启动任务"""
+    def _try_start_task(self, task_item: TaskItem, other_sites: bool = False) -> bool:
+        """尝试启动任务，资源不足时放回队列并返回False
+        
+        目标站点连接已满或处于熔断冷却时同样放回队列；other_sites=True 时改为派发其他站点中排在最前的任务。
+        """
         # 计算所需资源
         required_resources = self._calculate_required_resources(task_item)
         
+        if not self._site_available(task_item.site_id, required_resources.ftp_connections):
+            self.task_queue.put(task_item, notify=False)
+            return other_sites and self._start_other_site_task(task_item.site_id)
+        
         # 检查资源是否可用
         if self.resource_manager.can_allocate_resources(task_item.priority, required_resources):
             # 分配资源并启动任务
@@ -164,61 +442,105 @@ class TaskScheduler:
                 task_item.task_id, task_item.priority, required_resources
             ):
                 execution = TaskExecution(task_item, required_resources)
-                execution.started_at = time.time()
+                execution.started_at = self.clock()
+                if self.scheduling_policy == SchedulingPolicy.ROUND_ROBIN:
+                    execution.slice_deadline = execution.started_at + self.config["time_slice_seconds"]
                 self.running_tasks[task_item.task_id] = execution
+                self.site_limits.acquire(task_item.site_id, required_resources.ftp_connections)
+                self.circuit_breaker.on_dispatch(task_item.site_id)
                 
                 # 启动任务执行（这里应该调用实际的任务执行函数）
                 self._start_task_execution(execution)
                 
                 self.stats["total_scheduled"] += 1
-                
-                # 移除饥饿追踪
-                if task_item.task_id in self.starvation_tracker:
-                    del self.starvation_tracker[task_item.task_id]
+                self.metrics.on_dispatch(task_item, execution.started_at)
+                self.admission.on_dispatch()
+                self.journal.record_dispatch(task_item.task_id)
+                self.adaptive.record_start(task_item.site_id, execution.started_at - task_item.created_at,
+                                           task_item.retry_count > 0)
+                return True
         else:
-            # 资源不足，重新放回队列
-            self.task_queue.put(task_item)
-            
-            # 添加到饥饿追踪
-            if task_item.task_id not in self.starvation_tracker:
-                self.starvation_tracker[task_item.task_id] = time.time()
+            # 资源不足：本级保证份额被其他级别借用时回收，然后重新放回队列（不唤醒调度器，等资源释放后再调度）
+            self._reclaim_resources(task_item, required_resources)
+            self.task_queue.put(task_item, notify=False)
+        return False
     
-    def _handle_starvation(self):
-        """处理饥饿任务"""
-        current_time = time.time()
-        starved_tasks = []
-        
-        for task_id, queued_time in self.starvation_tracker.items():
-            if current_time - queued_time > self.config["starvation_threshold"]:
-                starved_tasks.append(task_id)
-        
-        # 为饥饿任务临时提升优先级
-        for task_id in starved_tasks:
-            if self.task_queue.update_priority(task_id, TaskPriority.HIGH):
-                print(f"任务 {task_id} 因饥饿被提升为高优先级")
-    
-    def _preempt_task(self, task_id: str):
-        """抢占任务"""
-        if task_id in self.running_tasks:
-            execution = self.running_tasks[task_id]
-            
-            # 暂停任务
-            execution.is_preempted = True
-            execution.preempted_at = time.time()
-            execution.status = "preempted"
-            
-            # 释放资源
-            self.resource_manager.release_resources(
-                task_id, execution.task_item.priority, execution.allocated_resources
+    def _start_other_site_task(self, blocked_site_id) -> bool:
+        """目标站点不可用时，派发其他可用站点中排在最前的任务
+        
+        优先级相同时优先选择有空闲会话可复用、当前连接数较少的站点，使任务分散到各站点。
+        """
+        with self.task_queue.lock:
+            next_task = self.site_index.select(
+                site_filter=lambda site_id: site_id != blocked_site_id and self._site_available(site_id),
+                site_rank=self._site_rank
             )
-            
-            # 将任务重新放回队列
-            self.task_queue.put(execution.task_item)
-            
-            # 从运行任务中移除
-            del self.running_tasks[task_id]
-            
-            print(f"任务 {task_id} 被抢占")
+            if next_task is None:
+                return False
+            self.task_queue.remove(next_task.task_id)
+        return self._try_start_task(next_task)
+    
+    def _site_available(self, site_id, connections: int = 1) -> bool:
+        """站点未熔断且还能再打开 connections 个连接"""
+        return (self.circuit_breaker.allow(site_id) and
+                self.site_limits.has_capacity(site_id, connections))
+    
+    def _site_filter(self) -> Optional[Callable]:
+        """公平共享选择任务时的站点过滤条件，没有任何站点受限时返回None以走快速路径"""
+        if self.site_limits.limited or self.circuit_breaker.open_count:
+            return self._site_available
+        return None
+    
+    def _site_rank(self, site_id) -> tuple:
+        has_idle_session = self.sessions is not None and self.sessions.idle_count(site_id) > 0
+        return (not has_idle_session, self.site_limits.in_use(site_id))
+    
+    def _reclaim_resources(self, task_item: TaskItem, required_resources: ResourceAllocation):
+        """让借用了本级保证份额的任务在块边界暂停，资源释放后本级任务即可启动"""
+        victims = self.resource_manager.find_reclaimable(task_item.priority, required_resources,
+                                                         self._releasing_tasks())
+        victims = [task_id for task_id in victims if self._preempt_task(task_id)]
+        if victims:
+            self.stats["total_reclaimed"] += len(victims)
+            print(f"为 {TaskPriority.get_priority_name(task_item.priority)} 任务 {task_item.task_id} "
+                  f"回收 {len(victims)} 个借用资源的任务")
+    
+    def _releasing_tasks(self) -> List[str]:
+        """已被抢占、正在等待块边界停止的任务，其资源即将释放"""
+        return [task_id for task_id, execution in self.running_tasks.items()
+                if execution.status == "preempting"]
+    
+    def _handle_starvation(self):
+        """处理饥饿任务：在同一优先级等待超过阈值的任务提升一级，每次只检查各级FIFO队首"""
+        with self.task_queue.lock:
+            due = self.aging.pop_due(self.clock(), self.config["starvation_threshold"])
+            for task_id, new_priority in due:
+                task_item = self.task_queue.get_task(task_id)
+                if task_item is not None:
+                    task_item.aged_levels += 1
+                    self.task_queue.update_priority(task_id, new_priority)
+        
+        if due:
+            self.stats["total_aged"] += len(due)
+            print(f"{len(due)} 个任务因等待过久提升一级优先级")
+    
+    def _preempt_task(self, task_id: str) -> bool:
+        """抢占任务，返回是否新抢占了该任务
+        
+        只通知任务在下一个块边界暂停（should_yield() 返回True），已完成的块保存在断点中。
+        任务实际停止前继续占用资源，避免同一任务被重复启动；停止后由 _check_completed_tasks
+        释放资源并放回队列，恢复时跳过已完成的块。
+        """
+        execution = self.running_tasks.get(task_id)
+        if execution is None or execution.status != "running":
+            return False
+        
+        execution.is_preempted = True
+        execution.preempted_at = self.clock()
+        execution.status = "preempting"
+        
+        print(f"任务 {task_id} 被抢占，将在块边界暂停")
+        return True
     
     def _calculate_required_resources(self, task_item: TaskItem) -> ResourceAllocation:
         """计算任务所需资源"""
@@ -250,16 +572,117 @@ class TaskScheduler:
         return base_resources
     
     def _start_task_execution(self, execution: TaskExecution):
-        """启动任务执行"""
-        # 这里应该调用实际的任务执行逻辑
-        # 例如：启动Celery任务或直接执行
-        pass
+        """把任务交给对应的执行器，结束时通过 _on_task_done 回调"""
+        task_item = execution.task_item
+        handler_info = self.handlers.get(task_item.task_type)
+        if handler_info is None:
+            self._on_task_done(execution, None, PermanentError(f"未注册的任务类型: {task_item.task_type}"))
+            return
+        
+        handler, executor_name = handler_info
+        execution.executor = executor_name
+        context = TaskContext(execution, on_progress=self._on_task_progress,
+                              checkpoint_store=self.checkpoint_store,
+                              yield_check=lambda: self._slice_expired(execution),
+                              throttle=lambda nbytes: self.resource_manager.throttle(task_item.priority, nbytes),
+                              sessions=self.sessions,
+                              on_refused=lambda: self._record_refused(execution))
+        try:
+            self.executors[executor_name].submit(execution, handler, context, self._on_task_done)
+        except Exception as e:
+            self._on_task_done(execution, None, e)
+    
+    def _slice_expired(self, execution: TaskExecution) -> bool:
+        """时间片是否已用完；没有其他任务等待时不必让出"""
+        if execution.slice_deadline is None or self.clock() < execution.slice_deadline:
+            return False
+        return not self.task_queue.is_empty()
+    
+    def _on_task_progress(self, execution: TaskExecution):
+        """执行器进度回调"""
+        self.adaptive.record_progress(execution.task_item.task_id, execution.task_item.site_id,
+                                      execution.transferred_bytes)
+        self._emit_task_event("progress", execution)
+    
+    def _record_refused(self, execution: TaskExecution):
+        """站点拒绝连接（421）；处理函数调用 connection_refused() 后又抛出421异常时只记录一次"""
+        with self.lock:
+            if execution.refused:
+                return
+            execution.refused = True
+        self.site_limits.record_refused(execution.task_item.site_id)
+        self._sync_adaptive_limit(execution.task_item.site_id)
+    
+    def _on_task_done(self, execution: TaskExecution, result, error):
+        """执行器完成回调（在工作线程中调用）
+        
+        只更新执行状态并唤醒调度线程，资源释放和统计由 _check_completed_tasks 完成。
+        已被取消的执行忽略其结果；被抢占的任务若未让出而是直接完成，按完成处理。
+        状态在调度器锁内修改，事件在锁外通知。
+        """
+        if error is not None and is_connection_refused(error):
+            # 站点连接数已满，不计为失败：降低该站点的连接上限，任务放回队列稍后重试
+            self._record_refused(execution)
+            result, error = YIELDED, None
+        
+        with self.lock:
+            if execution.status not in ("running", "preempting"):
+                return
+            
+            if error is None and result is YIELDED:
+                execution.status = "preempted" if execution.status == "preempting" else "yielded"
+            elif error is None:
+                execution.completed_at = self.clock()
+                execution.result = result
+                execution.progress = 1.0
+                execution.status = "completed"
+            else:
+                execution.completed_at = self.clock()
+                execution.error = str(error)
+                task_item = execution.task_item
+                execution.transient_error = is_retryable(error)
+                retry = execution.transient_error and task_item.retry_count < task_item.max_retries
+                execution.status = "retrying" if retry else "failed"
+            status = execution.status
+        
+        self._emit_task_event(status, execution)
+        self.notify()
+    
+    def _schedule_retry(self, execution: TaskExecution):
+        """失败的任务按指数退避放入延迟队列，站点熔断时至少等到冷却结束，重试时从断点继续"""
+        task_item = execution.task_item
+        task_item.retry_count += 1
+        now = self.clock()
+        delay = max(self.retry_policy.delay(task_item.retry_count),
+                    self.circuit_breaker.cooldown_remaining(task_item.site_id, now))
+        self.retry_queue.push(task_item, now + delay)
+        self.journal.record_enqueue([task_item])
+        self.stats["total_retried"] += 1
+        print(f"任务 {task_item.task_id} 执行失败（{execution.error}），{delay:.1f} 秒后第 "
+              f"{task_item.retry_count} 次重试")
+    
+    def _release_due_retries(self):
+        """把已到重试时间的任务放回队列，在新的优先级等待中重新计时"""
+        now = self.clock()
+        due = self.retry_queue.pop_due(now)
+        for task_item in due:
+            task_item.level_since = None
+            self.metrics.on_requeue(task_item.task_id, now)
+        if due:
+            self.task_queue.put_many(due, notify=False)
+    
+    def _emit_task_event(self, event: str, execution: TaskExecution):
+        for callback in self.task_listeners:
+            try:
+                callback(event, execution)
+            except Exception as e:
+                print(f"任务事件回调错误: {e}")
     
     def _check_completed_tasks(self):
-        """检查已完成的任务"""
+        """检查已完成、让出时间片或已暂停的被抢占任务"""
         completed_tasks = []
         for task_id, execution in self.running_tasks.items():
-            if execution.status in ['completed', 'failed']:
+            if execution.status in ['completed', 'failed', 'yielded', 'preempted', 'retrying']:
                 completed_tasks.append(task_id)
         
         for task_id in completed_tasks:
@@ -268,15 +691,58 @@ class TaskScheduler:
                 task_id, execution.task_item.priority, execution.allocated_resources
             )
             del self.running_tasks[task_id]
+            self.site_limits.release(execution.task_item.site_id, execution.allocated_resources.ftp_connections)
+            self.fair_share.settle(task_id, execution.transferred_bytes)
+            self.adaptive.record_finish(
+                task_id, execution.task_item.site_id, execution.transferred_bytes,
+                execution.status == 'completed' if execution.status in ['completed', 'failed', 'retrying'] else None
+            )
+            if execution.status == 'completed':
+                self.circuit_breaker.record_success(execution.task_item.site_id)
+            elif execution.transient_error:
+                self.circuit_breaker.record_failure(execution.task_item.site_id)
+            else:
+                self.circuit_breaker.record_abandoned(execution.task_item.site_id)
+            
+            now = self.clock()
+            if execution.status in ['yielded', 'preempted', 'retrying']:
+                self.metrics.on_pause(execution, now, preempted=execution.status == 'preempted')
+                execution.task_item.transferred_bytes += execution.transferred_bytes
+            elif (execution.task_item.deadline is not None and
+                  execution.completed_at and execution.completed_at > execution.task_item.deadline):
+                self.stats["deadline_missed"] += 1
             
+            if execution.status == 'yielded':
+                # 时间片用完，排到同优先级队尾，下次从断点继续
+                execution.task_item.slices_used += 1
+                self.task_queue.put(execution.task_item, notify=False)
+                self.journal.record_enqueue([execution.task_item])
+                self.stats["total_yielded"] += 1
+                continue
+            if execution.status == 'preempted':
+                # 被抢占的任务已在块边界停止，放回队列，下次从断点继续
+                self.task_queue.put(execution.task_item, notify=False)
+                self.journal.record_enqueue([execution.task_item])
+                continue
+            if execution.status == 'retrying':
+                self._schedule_retry(execution)
+                continue
+            
+            self.checkpoint_store.clear(task_id)
+            self.journal.record_complete(task_id, execution.status)
+            self.metrics.on_finish(execution, execution.completed_at or now)
             if execution.status == 'completed':
                 self.stats["total_completed"] += 1
             else:
                 self.stats["total_failed"] += 1
+        
+        if completed_tasks:
+            self.stats["average_wait_time"] = self.metrics.mean("wait_seconds")
+            self.stats["average_execution_time"] = self.metrics.mean("run_seconds")
     
     def _can_preempt(self) -> bool:
         """检查是否可以执行抢占"""
-        current_time = time.time()
+        current_time = self.clock()
         # 清理一分钟前的抢占记录
         self.preemption_history = [
             t for t in self.preemption_history 
@@ -287,64 +753,176 @@ class TaskScheduler:
     
     def _record_preemption(self):
         """记录抢占操作"""
-        self.preemption_history.append(time.time())
+        self.preemption_history.append(self.clock())
     
     def _cleanup_preemption_history(self):
         """清理过期的抢占记录"""
-        current_time = time.time()
+        current_time = self.clock()
         self.preemption_history = [
             t for t in self.preemption_history 
             if current_time - t < 60
         ]
     
     def _round_robin_schedule(self):
-        """时间片轮转调度"""
-        # 简化实现，实际应该更复杂
+        """时间片轮转调度
+        
+        任务启动时设置时间片截止时间，处理函数在块边界通过 should_yield() 检查，
+        到期后保存断点并让出，由 _check_completed_tasks 放回队尾。
+        """
         next_task = self.task_queue.get()
         if next_task:
-            self._try_start_task(next_task)
+            self._try_start_task(next_task, other_sites=True)
     
     def _fair_share_schedule(self):
-        """公平共享调度"""
-        # 简化实现
-        next_task = self.task_queue.get()
-        if next_task:
-            self._try_start_task(next_task)
+        """公平共享调度
+        
+        按 用户 -> 站点 两级加权分配传输字节数，避免单个用户的大量任务独占执行资源。
+        """
+        with self.task_queue.lock:
+            next_task = self.fair_share.select(site_filter=self._site_filter())
+            if next_task is None:
+                return
+            self.fair_share.charge(next_task)
+            self.task_queue.remove(next_task.task_id)
+        
+        if not self._try_start_task(next_task):
+            # 未能启动（已放回队列），退还预扣额
+            self.fair_share.settle(next_task.task_id, 0)
     
     def _adaptive_schedule(self):
-        """自适应调度"""
-        # 根据系统负载动态调整调度策略
-        total_usage = self.resource_manager.get_total_usage()
-        cpu_usage = total_usage["usage_percentage"]["concurrent_tasks"]
-        
-        if cpu_usage > 80:
-            # 高负载时使用抢占式调度
-            self._priority_preemptive_schedule()
-        else:
-            # 低负载时使用公平调度
-            self._fair_share_schedule()
+        """自适应调度
+        
+        按公平共享顺序派发，但每个站点的并发数不超过自适应控制器根据实测吞吐量、
+        错误率和主机负载调整的上限。
+        """
+        self.adaptive.maybe_update()
+        running_by_site = Counter(
+            execution.task_item.site_id for execution in self.running_tasks.values()
+        )
+        
+        with self.task_queue.lock:
+            next_task = self.fair_share.select(
+                site_filter=lambda site_id: self._site_available(site_id) and self.adaptive.has_capacity(
+                    site_id, running_by_site.get(site_id, 0))
+            )
+            if next_task is None:
+                return
+            self.fair_share.charge(next_task)
+            self.task_queue.remove(next_task.task_id)
+        
+        if not self._try_start_task(next_task):
+            self.fair_share.settle(next_task.task_id, 0)
+    
+    @staticmethod
+    def _deadline_key(task_item: TaskItem) -> tuple:
+        """最早截止时间优先：有截止时间的按截止时间，其余按优先级和创建时间"""
+        return (task_item.priority != TaskPriority.CRITICAL,
+                task_item.deadline is None,
+                task_item.deadline or 0.0,
+                task_item.priority,
+                task_item.created_at)
+    
+    @staticmethod
+    def _remaining_bytes_key(task_item: TaskItem) -> tuple:
+        """剩余字节数最少优先：大小未知的任务排在最后"""
+        return (task_item.priority != TaskPriority.CRITICAL,
+                task_item.total_bytes <= 0,
+                max(task_item.total_bytes - task_item.transferred_bytes, 0),
+                task_item.priority,
+                task_item.created_at)
+    
+    def _indexed_schedule(self, index: KeyedTaskIndex):
+        """按二级索引的顺序派发队首任务（EDF / 剩余字节数最少优先）"""
+        with self.task_queue.lock:
+            next_task = index.peek()
+            if next_task is None:
+                return
+            self.task_queue.remove(next_task.task_id)
+        self._try_start_task(next_task, other_sites=True)
     
     def add_task(self, task_item: TaskItem):
-        """添加任务到调度队列"""
+        """添加任务到调度队列
+        
+        队列已满时抛出 AdmissionRejected（retry_after 为建议的重试等待秒数），调用方应稍后重试，
+        API中对应返回 429 和 Retry-After。
+        """
+        self._admit([task_item])
+        self.journal.record_enqueue([task_item])
         self.task_queue.put(task_item)
     
-    def remove_task(self, task_id: str) -> bool:
-        """移除任务"""
-        # 先尝试从队列中移除
-        if self.task_queue.remove(task_id):
-            return True
+    def add_tasks(self, task_items: List[TaskItem]):
+        """批量添加任务（如文件夹任务展开的大量文件任务），整批准入或整批被拒绝"""
+        task_items = list(task_items)
+        self._admit(task_items)
+        self.journal.record_enqueue(task_items)
+        self.task_queue.put_many(task_items)
+    
+    def _admit(self, task_items: List[TaskItem]):
+        try:
+            self.admission.admit(task_items)
+        except AdmissionRejected:
+            self.stats["total_rejected"] += len(task_items)
+            raise
+    
+    def remove_task(self, task_id: str, record: bool = True) -> bool:
+        """移除任务
         
-        # 如果任务正在运行，则停止它
-        if task_id in self.running_tasks:
-            execution = self.running_tasks[task_id]
+        record=False 时不写入队列日志，用于任务已转交其他调度节点的情况。
+        在调度器锁内检查队列和运行中任务，调度线程取出任务后、启动或放回前不会漏掉该任务。
+        """
+        with self.lock:
+            # 先尝试从队列中移除（可能是让出时间片后等待继续或等待重试的任务）
+            if self.task_queue.remove(task_id) or self.retry_queue.remove(task_id):
+                self.checkpoint_store.clear(task_id)
+                self.metrics.discard(task_id)
+                if record:
+                    self.journal.record_complete(task_id, "cancelled")
+                return True
+            
+            # 如果任务正在运行，则停止它；执行器随后回调的结果因状态为 cancelled 被忽略
+            execution = self.running_tasks.pop(task_id, None)
+            if execution is None:
+                return False
             execution.status = "cancelled"
+            self.checkpoint_store.clear(task_id)
+            self.metrics.discard(task_id)
+            if record:
+                self.journal.record_complete(task_id, "cancelled")
+            self.fair_share.settle(task_id, execution.transferred_bytes)
+            self.adaptive.record_finish(task_id, execution.task_item.site_id,
+                                        execution.transferred_bytes, None)
+            self.circuit_breaker.record_abandoned(execution.task_item.site_id)
             self.resource_manager.release_resources(
                 task_id, execution.task_item.priority, execution.allocated_resources
             )
-            del self.running_tasks[task_id]
-            return True
+            self.site_limits.release(execution.task_item.site_id, execution.allocated_resources.ftp_connections)
         
-        return False
+        executor = self.executors.get(execution.executor)
+        if executor:
+            executor.cancel(execution)
+        # 资源已释放，唤醒调度器派发等待中的任务
+        self.notify()
+        return True
+    
+    def remove_tasks(self, task_ids: List[str]) -> int:
+        """批量移除任务，返回移除数量"""
+        task_ids = list(task_ids)
+        with self.lock:
+            queued = [task_id for task_id in task_ids if self.task_queue.contains(task_id)]
+            removed = self.task_queue.remove_many(queued)
+            delayed = [task_id for task_id in task_ids if self.retry_queue.remove(task_id)]
+            removed += len(delayed)
+            for task_id in queued + delayed:
+                self.journal.record_complete(task_id, "cancelled")
+                self.checkpoint_store.clear(task_id)
+                self.metrics.discard(task_id)
+        
+        # 队列中没有的任务可能正在运行
+        handled = set(queued + delayed)
+        for task_id in task_ids:
+            if task_id not in handled and self.remove_task(task_id):
+                removed += 1
+        return removed
     
     def get_scheduler_status(self) -> Dict:
         """获取调度器状态"""
@@ -355,6 +933,15 @@ class TaskScheduler:
             "stats": self.stats,
             "queue_status": self.task_queue.get_queue_status(),
             "running_tasks_count": len(self.running_tasks),
-            "starvation_tasks_count": len(self.starvation_tracker),
-            "recent_preemptions": len(self.preemption_history)
+            "starvation_tasks_count": len(self.aging.aged),
+            "aging": self.aging.get_status(),
+            "fair_share": self.fair_share.get_status(),
+            "adaptive": self.adaptive.get_status(),
+            "sites": self.site_limits.get_status(),
+            "retry_queue_size": len(self.retry_queue),
+            "circuit_breakers": self.circuit_breaker.get_status(),
+            "admission": self.admission.get_status(),
+            "sessions": self.sessions.get_status() if self.sessions else None,
+            "recent_preemptions": len(self.preemption_history),
+            "metrics": self.metrics.get_summary()
         }
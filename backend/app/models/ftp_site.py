@@ -1,4 +1,6 @@
 from datetime import datetime
+from flask import current_app, has_app_context
+from sqlalchemy import event
 from app import db
 from cryptography.fernet import Fernet
 import os
@@ -19,6 +21,7 @@ class FtpSite(db.Model):
     passive_mode = db.Column(db.Boolean, default=True, nullable=False)
     encoding = db.Column(db.String(20), default='utf-8', nullable=False)
     timeout = db.Column(db.Integer, default=30, nullable=False)
+    max_connections = db.Column(db.Integer)  # 服务器允许的最大并发连接数，为空表示不限制
     is_active = db.Column(db.Boolean, default=True, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
@@ -101,6 +104,7 @@ class FtpSite(db.Model):
             'passive_mode': self.passive_mode,
             'encoding': self.encoding,
             'timeout': self.timeout,
+            'max_connections': self.max_connections,
             'is_active': self.is_active,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None,
@@ -117,3 +121,22 @@ class FtpSite(db.Model):
     
     def __repr__(self):
         return f'<FtpSite {self.name}@{self.host}:{self.port}>'
+
+def _task_scheduler():
+    """应用中运行的任务调度器，没有时返回None"""
+    return current_app.extensions.get('task_scheduler') if has_app_context() else None
+
+@event.listens_for(FtpSite, 'after_insert')
+@event.listens_for(FtpSite, 'after_update')
+def _sync_scheduler_site_limit(mapper, connection, site):
+    """站点新建或修改后，把最大连接数同步到运行中的调度器"""
+    scheduler = _task_scheduler()
+    if scheduler is not None:
+        scheduler.set_site_connection_limit(site.id, site.max_connections)
+
+@event.listens_for(FtpSite, 'after_delete')
+def _clear_scheduler_site_limit(mapper, connection, site):
+    """站点删除后取消其连接上限"""
+    scheduler = _task_scheduler()
+    if scheduler is not None:
+        scheduler.set_site_connection_limit(site.id, None)
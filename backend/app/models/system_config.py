@@ -68,7 +68,17 @@ class SystemConfig(db.Model):
             db.session.add(config)
         
         db.session.commit()
+        if key.startswith('scheduler.'):
+            cls._reload_scheduler_config()
         return config
+
+    @staticmethod
+    def _reload_scheduler_config():
+        """调度配置修改后，让运行中的调度器重新加载"""
+        from flask import current_app
+        scheduler = current_app.extensions.get('task_scheduler')
+        if scheduler is not None:
+            scheduler.load_config()
     
     @classmethod
     def get_public_configs(cls):
@@ -87,6 +97,17 @@ class SystemConfig(db.Model):
             ('scheduler.time_slice_seconds', 30, '时间片长度(秒)', 'int', False),
             ('scheduler.preemption_enabled', True, '是否启用抢占', 'bool', False),
             ('scheduler.starvation_threshold', 300, '饥饿阈值(秒)', 'int', False),
+            ('scheduler.retry_base_delay', 5, '首次重试前的等待时间(秒)，之后按指数增长', 'float', False),
+            ('scheduler.retry_max_delay', 300, '重试等待时间上限(秒)', 'float', False),
+            ('scheduler.circuit_failure_threshold', 5, '站点连续失败多少次后熔断', 'int', False),
+            ('scheduler.circuit_cooldown', 30, '熔断后暂停派发的时间(秒)，再次熔断时加倍', 'float', False),
+            ('scheduler.max_queued_tasks', 100000, '排队任务总数上限，超过时拒绝新提交', 'int', False),
+            ('scheduler.max_queued_tasks_per_user', 20000, '每个用户的排队任务数上限', 'int', False),
+            ('scheduler.max_queue_memory_mb', 256, '排队任务估计占用内存的上限(MB)', 'float', False),
+            ('scheduler.admission_min_available_memory_mb', 128, '主机可用内存低于该值时拒绝新提交(MB)', 'float', False),
+            ('scheduler.fair_share.user_weights', {}, '公平共享用户权重 {user_id: 权重}', 'json', False),
+            ('scheduler.fair_share.site_weights', {}, '公平共享站点权重 {site_id: 权重}', 'json', False),
+            ('scheduler.fair_share.default_task_bytes', 1048576, '公平共享中大小未知任务的预估字节数', 'int', False),
             
             # 文件传输配置
             ('transfer.chunk_size', 8192, '传输块大小(字节)', 'int', False),
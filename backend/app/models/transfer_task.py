@@ -41,6 +41,11 @@ class TransferTask(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     started_at = db.Column(db.DateTime)
     completed_at = db.Column(db.DateTime)
+    deadline = db.Column(db.DateTime)  # 期望完成时间，用于截止时间优先调度
+    
+    # 分布式调度租约
+    lease_owner = db.Column(db.String(128), index=True)  # 持有任务的调度节点
+    lease_expires_at = db.Column(db.DateTime, index=True)  # 租约到期时间，过期后其他节点可接管
     
     # 错误信息
     error_message = db.Column(db.Text)
@@ -170,6 +175,9 @@ class TransferTask(db.Model):
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'started_at': self.started_at.isoformat() if self.started_at else None,
             'completed_at': self.completed_at.isoformat() if self.completed_at else None,
+            'deadline': self.deadline.isoformat() if self.deadline else None,
+            'lease_owner': self.lease_owner,
+            'lease_expires_at': self.lease_expires_at.isoformat() if self.lease_expires_at else None,
             'error_message': self.error_message,
             'extra_config': self.get_extra_config(),
             'estimated_time_remaining': self.estimated_time_remaining,
@@ -9,6 +9,9 @@ from app import create_app, socketio
 app = create_app(os.getenv('FLASK_ENV', 'development'))
 
 if __name__ == '__main__':
+    # 启动任务调度器
+    app.extensions['task_scheduler'].start()
+    
     # 开发环境使用SocketIO运行
     socketio.run(
         app,
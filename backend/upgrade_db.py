@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+数据库升级脚本：为已有数据库补充新增的列和索引
+
+db.create_all() 只创建缺少的表，不会给已存在的表加列。从旧版本升级时运行一次：
+    python upgrade_db.py
+已经存在的列和索引会跳过，可以重复运行。
+"""
+import os
+
+# 升级时不启动任务调度器，调度器加载站点时会查询尚未添加的列
+os.environ['TASK_SCHEDULER_AUTOSTART'] = 'false'
+
+from sqlalchemy import inspect, text
+
+from app import create_app, db
+from app.models import FtpSite, TransferTask
+
+# 表模型 -> 需要补充的列
+NEW_COLUMNS = [
+    (FtpSite, ['max_connections']),
+    (TransferTask, ['deadline', 'lease_owner', 'lease_expires_at']),
+]
+
+def upgrade():
+    """添加缺少的列及其索引，返回添加的列名列表"""
+    inspector = inspect(db.engine)
+    added = []
+    for model, column_names in NEW_COLUMNS:
+        table = model.__table__
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        existing_indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+        for name in column_names:
+            if name in existing:
+                continue
+            column_type = table.c[name].type.compile(dialect=db.engine.dialect)
+            with db.engine.begin() as connection:
+                connection.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {name} {column_type}'))
+            added.append(f'{table.name}.{name}')
+        for index in table.indexes:
+            if index.name not in existing_indexes and set(index.columns.keys()) & set(column_names):
+                index.create(db.engine)
+    return added
+
+if __name__ == '__main__':
+    app = create_app(os.getenv('FLASK_ENV', 'development'))
+    with app.app_context():
+        added = upgrade()
+    if added:
+        print(f"✅ 已添加列: {', '.join(added)}")
+    else:
+        print("✅ 数据库已是最新结构")
@@ -0,0 +1,442 @@
+#!/usr/bin/env python3
+"""
+FTP服务器性能基准测试
+在本地启动 ftp_server.py，用多个并发客户端模拟不同负载，
+报告吞吐量、命令延迟分位数（p50/p99/p999）以及服务器CPU和内存占用
+"""
+
+import ftplib
+import io
+import json
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+SERVER_SCRIPT = Path(__file__).parent / 'ftp_server.py'
+USERNAME = 'admin'
+PASSWORD = 'admin123'
+
+SMALL_FILE_SIZE = 4 * 1024           # 小文件 4KB
+LARGE_FILE_SIZE = 16 * 1024 * 1024   # 大文件 16MB
+LIST_DIR_ENTRIES = 200               # LIST测试目录中的文件数
+
+# 回归判定时"越大越好"的指标，其余延迟类指标越小越好
+HIGHER_IS_BETTER = ('ops_per_sec', 'mb_per_sec')
+
+def find_free_port():
+    """获取一个空闲端口"""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def percentile(sorted_values, fraction):
+    """计算分位数（输入需已排序）"""
+    if not sorted_values:
+        return None
+    index = min(int(len(sorted_values) * fraction), len(sorted_values) - 1)
+    return sorted_values[index]
+
+class ProcessMonitor:
+    """通过 /proc 采样服务器进程的CPU时间和RSS（仅Linux）"""
+
+    def __init__(self, pid, interval=0.2):
+        self.pid = pid
+        self.interval = interval
+        self.peak_rss_kb = 0
+        self._running = False
+        self._thread = None
+        self._clock_ticks = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+
+    @property
+    def supported(self):
+        return Path(f'/proc/{self.pid}/stat').exists()
+
+    def cpu_seconds(self):
+        """进程累计的用户态+内核态CPU时间"""
+        try:
+            stat = Path(f'/proc/{self.pid}/stat').read_text()
+            # 进程名可能包含空格，从最后一个')'之后开始解析
+            fields = stat[stat.rindex(')') + 2:].split()
+            return (int(fields[11]) + int(fields[12])) / self._clock_ticks
+        except (OSError, ValueError, IndexError):
+            return None
+
+    def rss_kb(self):
+        """进程当前RSS（KB）"""
+        try:
+            for line in Path(f'/proc/{self.pid}/status').read_text().splitlines():
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+        except (OSError, ValueError):
+            pass
+        return None
+
+    def start(self):
+        if not self.supported:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        if self._thread:
+            self._thread.join(timeout=1)
+
+    def _loop(self):
+        while self._running:
+            rss = self.rss_kb()
+            if rss:
+                self.peak_rss_kb = max(self.peak_rss_kb, rss)
+            time.sleep(self.interval)
+
+class BenchmarkServer:
+    """在临时目录中启动一个独立的FTP服务器进程"""
+
+    def __init__(self, extra_args=None):
+        self.port = find_free_port()
+        self.workdir = Path(tempfile.mkdtemp(prefix='ftp_bench_'))
+        self.root = self.workdir / 'ftp_root'
+        self.extra_args = extra_args or []
+        self.process = None
+
+    def prepare_files(self):
+        """准备LIST目录和大文件"""
+        list_dir = self.root / 'listing'
+        list_dir.mkdir(parents=True, exist_ok=True)
+        for i in range(LIST_DIR_ENTRIES):
+            (list_dir / f'file_{i:04d}.txt').write_bytes(b'x' * 128)
+
+        (self.root / 'uploads').mkdir(exist_ok=True)
+        with open(self.root / 'large.bin', 'wb') as f:
+            chunk = os.urandom(1024 * 1024)
+            for _ in range(LARGE_FILE_SIZE // len(chunk)):
+                f.write(chunk)
+
+    def start(self, timeout=10):
+        self.prepare_files()
+        self.process = subprocess.Popen(
+            [sys.executable, str(SERVER_SCRIPT.resolve()),
+             '--host', '127.0.0.1', '--port', str(self.port), '--root', str(self.root)]
+            + self.extra_args,
+            cwd=self.workdir,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL
+        )
+
+        # 等待服务器开始监听
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            try:
+                with socket.create_connection(('127.0.0.1', self.port), timeout=1) as s:
+                    s.recv(1024)
+                return
+            except OSError:
+                time.sleep(0.1)
+        self.stop()
+        raise RuntimeError('FTP服务器启动超时')
+
+    def stop(self):
+        if self.process:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+class Workload:
+    """负载基类：每个客户端线程反复执行 run_once，记录各命令延迟"""
+
+    name = 'base'
+
+    def __init__(self, port):
+        self.port = port
+        self.latencies = {}   # 命令 -> [秒]
+        self.bytes = 0
+        self.ops = 0
+        self.errors = 0
+        self.lock = threading.Lock()
+
+    def record(self, command, seconds, nbytes=0):
+        with self.lock:
+            self.latencies.setdefault(command, []).append(seconds)
+            self.bytes += nbytes
+
+    def timed(self, command, func, nbytes=0):
+        start = time.perf_counter()
+        result = func()
+        self.record(command, time.perf_counter() - start, nbytes)
+        return result
+
+    def connect(self):
+        ftp = ftplib.FTP()
+        self.timed('CONNECT', lambda: ftp.connect('127.0.0.1', self.port, timeout=30))
+        self.timed('LOGIN', lambda: ftp.login(USERNAME, PASSWORD))
+        return ftp
+
+    def setup_client(self, client_id):
+        """每个客户端开始前调用，默认建立一个长连接"""
+        return self.connect()
+
+    def teardown_client(self, ftp):
+        if ftp:
+            try:
+                ftp.quit()
+            except Exception:
+                ftp.close()
+
+    def run_once(self, ftp, client_id, iteration):
+        raise NotImplementedError
+
+    def client_loop(self, client_id, deadline, max_ops):
+        ftp = None
+        iteration = 0
+        try:
+            ftp = self.setup_client(client_id)
+            while time.time() < deadline and (max_ops is None or iteration < max_ops):
+                try:
+                    ftp = self.run_once(ftp, client_id, iteration) or ftp
+                    with self.lock:
+                        self.ops += 1
+                except (ftplib.Error, OSError, EOFError):
+                    with self.lock:
+                        self.errors += 1
+                    # 连接可能已损坏，重新建立
+                    self.teardown_client(ftp)
+                    ftp = self.setup_client(client_id)
+                iteration += 1
+        except Exception:
+            with self.lock:
+                self.errors += 1
+        finally:
+            self.teardown_client(ftp)
+
+class LoginStormWorkload(Workload):
+    """登录风暴：每次操作都新建连接、登录、退出"""
+
+    name = 'login'
+
+    def setup_client(self, client_id):
+        return None
+
+    def run_once(self, ftp, client_id, iteration):
+        ftp = self.connect()
+        self.timed('QUIT', ftp.quit)
+        return None
+
+class ListWorkload(Workload):
+    """目录列表密集型"""
+
+    name = 'list'
+
+    def setup_client(self, client_id):
+        ftp = self.connect()
+        ftp.cwd('/listing')
+        return ftp
+
+    def run_once(self, ftp, client_id, iteration):
+        lines = []
+        self.timed('LIST', lambda: ftp.retrlines('LIST', lines.append))
+        return ftp
+
+class SmallFileWorkload(Workload):
+    """小文件上传+下载"""
+
+    name = 'small'
+    payload = os.urandom(SMALL_FILE_SIZE)
+
+    def setup_client(self, client_id):
+        ftp = self.connect()
+        ftp.cwd('/uploads')
+        return ftp
+
+    def run_once(self, ftp, client_id, iteration):
+        filename = f'small_{client_id}_{iteration % 50}.bin'
+        self.timed('STOR', lambda: ftp.storbinary(f'STOR {filename}', io.BytesIO(self.payload)),
+                   len(self.payload))
+        received = bytearray()
+        self.timed('RETR', lambda: ftp.retrbinary(f'RETR {filename}', received.extend),
+                   len(self.payload))
+        return ftp
+
+class LargeFileWorkload(Workload):
+    """大文件下载"""
+
+    name = 'large'
+
+    def run_once(self, ftp, client_id, iteration):
+        counter = [0]
+
+        def consume(block):
+            counter[0] += len(block)
+
+        self.timed('RETR', lambda: ftp.retrbinary('RETR large.bin', consume, blocksize=65536),
+                   LARGE_FILE_SIZE)
+        return ftp
+
+WORKLOADS = {
+    cls.name: cls for cls in (LoginStormWorkload, ListWorkload, SmallFileWorkload, LargeFileWorkload)
+}
+
+def run_workload(workload_cls, server, monitor, clients, duration, max_ops):
+    """运行单个负载并汇总结果"""
+    workload = workload_cls(server.port)
+    cpu_before = monitor.cpu_seconds()
+    monitor.peak_rss_kb = 0
+
+    deadline = time.time() + duration
+    start = time.perf_counter()
+    threads = [
+        threading.Thread(target=workload.client_loop, args=(i, deadline, max_ops), daemon=True)
+        for i in range(clients)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    cpu_after = monitor.cpu_seconds()
+
+    commands = {}
+    for command, values in workload.latencies.items():
+        values.sort()
+        commands[command] = {
+            'count': len(values),
+            'p50_ms': percentile(values, 0.50) * 1000,
+            'p99_ms': percentile(values, 0.99) * 1000,
+            'p999_ms': percentile(values, 0.999) * 1000,
+            'max_ms': values[-1] * 1000
+        }
+
+    cpu_seconds = (cpu_after - cpu_before) if cpu_before is not None and cpu_after is not None else None
+    return {
+        'clients': clients,
+        'elapsed_seconds': elapsed,
+        'operations': workload.ops,
+        'errors': workload.errors,
+        'ops_per_sec': workload.ops / elapsed if elapsed > 0 else 0,
+        'mb_per_sec': workload.bytes / 1024 / 1024 / elapsed if elapsed > 0 else 0,
+        'commands': commands,
+        'server_cpu_seconds': cpu_seconds,
+        'server_cpu_percent': cpu_seconds / elapsed * 100 if cpu_seconds is not None and elapsed > 0 else None,
+        'server_peak_rss_kb': monitor.peak_rss_kb or monitor.rss_kb()
+    }
+
+def compare_with_baseline(results, baseline, threshold):
+    """与基线结果比较，返回退化项列表"""
+    regressions = []
+    print("\n=== 与基线比较 ===")
+    for name, current in results['workloads'].items():
+        base = baseline.get('workloads', {}).get(name)
+        if not base:
+            print(f"{name}: 基线中无此负载，跳过")
+            continue
+
+        metrics = [('ops_per_sec', current['ops_per_sec'], base['ops_per_sec']),
+                   ('mb_per_sec', current['mb_per_sec'], base['mb_per_sec'])]
+        for command, stat in current['commands'].items():
+            base_stat = base.get('commands', {}).get(command)
+            if base_stat:
+                metrics.append((f'{command}.p99_ms', stat['p99_ms'], base_stat['p99_ms']))
+
+        for metric, value, base_value in metrics:
+            if not base_value:
+                continue
+            change = (value - base_value) / base_value * 100
+            worse = -change if metric in HIGHER_IS_BETTER else change
+            flag = '❌' if worse > threshold else '✅'
+            print(f"  {flag} {name}.{metric}: {base_value:.2f} -> {value:.2f} ({change:+.1f}%)")
+            if worse > threshold:
+                regressions.append(f"{name}.{metric}")
+    return regressions
+
+def print_report(results):
+    """打印可读的结果"""
+    for name, result in results['workloads'].items():
+        print(f"\n=== {name} ({result['clients']} 客户端, {result['elapsed_seconds']:.1f}s) ===")
+        print(f"操作数: {result['operations']}  错误: {result['errors']}  "
+              f"吞吐: {result['ops_per_sec']:.1f} ops/s, {result['mb_per_sec']:.2f} MB/s")
+        if result['server_cpu_percent'] is not None:
+            print(f"服务器CPU: {result['server_cpu_percent']:.1f}%  峰值RSS: {result['server_peak_rss_kb']} KB")
+        for command, stat in sorted(result['commands'].items()):
+            print(f"  {command:8s} n={stat['count']:<6d} p50={stat['p50_ms']:.2f}ms "
+                  f"p99={stat['p99_ms']:.2f}ms p999={stat['p999_ms']:.2f}ms max={stat['max_ms']:.2f}ms")
+
+def main():
+    """主函数"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='FTP服务器性能基准测试')
+    parser.add_argument('--workloads', default='login,list,small,large',
+                        help=f"要运行的负载，逗号分隔 (可选: {','.join(WORKLOADS)})")
+    parser.add_argument('--clients', type=int, default=16, help='并发客户端数 (默认: 16)')
+    parser.add_argument('--duration', type=float, default=10, help='每个负载的运行秒数 (默认: 10)')
+    parser.add_argument('--max-ops', type=int, help='每个客户端的最大操作数')
+    parser.add_argument('--output', default='bench_result.json', help='结果文件 (默认: bench_result.json)')
+    parser.add_argument('--baseline', help='基线结果文件，用于比较')
+    parser.add_argument('--threshold', type=float, default=10,
+                        help='相对基线的退化阈值百分比，超过时返回非0 (默认: 10)')
+    parser.add_argument('--server-args', default='', help='传给 ftp_server.py 的额外参数')
+
+    args = parser.parse_args()
+
+    names = [name.strip() for name in args.workloads.split(',') if name.strip()]
+    unknown = [name for name in names if name not in WORKLOADS]
+    if unknown:
+        parser.error(f"未知负载: {', '.join(unknown)}")
+
+    server = BenchmarkServer(args.server_args.split())
+    print(f"启动FTP服务器: 127.0.0.1:{server.port}")
+    server.start()
+    monitor = ProcessMonitor(server.process.pid)
+    monitor.start()
+
+    results = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'clients': args.clients,
+            'duration': args.duration,
+            'server_args': args.server_args
+        },
+        'workloads': {}
+    }
+
+    try:
+        for name in names:
+            print(f"运行负载: {name} ...")
+            results['workloads'][name] = run_workload(
+                WORKLOADS[name], server, monitor, args.clients, args.duration, args.max_ops
+            )
+    finally:
+        monitor.stop()
+        server.stop()
+
+    print_report(results)
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+    print(f"\n✅ 结果已保存: {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare_with_baseline(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n❌ 性能退化: {', '.join(regressions)}")
+            sys.exit(1)
+        print("\n✅ 未发现超过阈值的性能退化")
+
+if __name__ == '__main__':
+    main()
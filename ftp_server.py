@@ -6,13 +6,29 @@ Python FTP服务器
 
 import os
 import sys
+import errno
+import stat
+import gzip
+import json
+import queue
+import shutil
+import signal
+import select
 import socket
+import subprocess
 import threading
 import time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 import logging
 from datetime import datetime
 
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
 # 配置日志
 logging.basicConfig(
     level=logging.INFO,
@@ -24,10 +40,455 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# 平滑重启时通过环境变量把监听套接字和就绪管道交给新进程
+LISTEN_FD_ENV = 'FTP_SERVER_LISTEN_FD'
+READY_FD_ENV = 'FTP_SERVER_READY_FD'
+
+class _NullSpan:
+    """未启用追踪时使用的空span"""
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+_NULL_SPAN = _NullSpan()
+
+class _Span:
+    """命令执行阶段计时，嵌套时只记录各阶段的独占时间"""
+    
+    def __init__(self, record, phase):
+        self.record = record
+        self.phase = phase
+    
+    def __enter__(self):
+        now = time.perf_counter()
+        stack = self.record['stack']
+        if stack:
+            parent_phase, parent_start = stack[-1]
+            self.record['phases'][parent_phase] = self.record['phases'].get(parent_phase, 0.0) + now - parent_start
+        stack.append((self.phase, now))
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        now = time.perf_counter()
+        stack = self.record['stack']
+        phase, start = stack.pop()
+        self.record['phases'][phase] = self.record['phases'].get(phase, 0.0) + now - start
+        if stack:
+            stack[-1] = (stack[-1][0], now)
+        return False
+
+class CommandProfiler:
+    """命令耗时追踪器
+    
+    按阶段（parse/authorize/fs/data_setup/transfer/reply）记录每条命令的耗时，
+    保存在固定容量的环形缓冲区中；可选以低频率采样各线程调用栈。
+    """
+    
+    def __init__(self, enabled=False, capacity=1000, sample_interval=0.0):
+        self.enabled = enabled
+        self.records = deque(maxlen=capacity)
+        self.lock = threading.Lock()
+        self._local = threading.local()
+        
+        # 调用栈采样
+        self.sample_interval = sample_interval
+        self.stack_samples = Counter()
+        self._sampler_thread = None
+        self._sampler_stop = threading.Event()
+        self._sampler_lock = threading.Lock()
+    
+    def begin(self, command, client):
+        """开始记录一条命令"""
+        if not self.enabled:
+            self._local.record = None
+            return None
+        record = {
+            'command': command,
+            'client': client,
+            'started_at': time.time(),
+            'start': time.perf_counter(),
+            'phases': {},
+            'stack': []
+        }
+        self._local.record = record
+        return record
+    
+    def span(self, phase):
+        """返回当前命令某个阶段的计时上下文"""
+        record = getattr(self._local, 'record', None)
+        if record is None:
+            return _NULL_SPAN
+        return _Span(record, phase)
+    
+    def end(self, record):
+        """结束记录并写入环形缓冲区"""
+        self._local.record = None
+        if record is None:
+            return
+        total = time.perf_counter() - record.pop('start')
+        record.pop('stack')
+        record['total'] = total
+        # 未被任何阶段覆盖的时间计入other
+        other = total - sum(record['phases'].values())
+        if other > 0:
+            record['phases']['other'] = other
+        with self.lock:
+            self.records.append(record)
+    
+    def reset(self):
+        """清空已记录的数据"""
+        with self.lock:
+            self.records.clear()
+            self.stack_samples.clear()
+    
+    def summary(self):
+        """按命令汇总耗时统计（毫秒）"""
+        with self.lock:
+            records = list(self.records)
+        
+        by_command = {}
+        for record in records:
+            by_command.setdefault(record['command'], []).append(record)
+        
+        result = {}
+        for command, items in by_command.items():
+            totals = sorted(item['total'] for item in items)
+            phases = {}
+            for item in items:
+                for phase, seconds in item['phases'].items():
+                    phases[phase] = phases.get(phase, 0.0) + seconds
+            result[command] = {
+                'count': len(totals),
+                'avg_ms': sum(totals) / len(totals) * 1000,
+                'p50_ms': totals[int(len(totals) * 0.50)] * 1000,
+                'p99_ms': totals[min(int(len(totals) * 0.99), len(totals) - 1)] * 1000,
+                'max_ms': totals[-1] * 1000,
+                'phases_avg_ms': {
+                    phase: seconds / len(totals) * 1000 for phase, seconds in phases.items()
+                }
+            }
+        return result
+    
+    def dump_lines(self, top_stacks=10):
+        """生成可读的统计报告"""
+        lines = [f"profiling={'on' if self.enabled else 'off'} records={len(self.records)}"]
+        for command, stat in sorted(self.summary().items()):
+            phases = ' '.join(f"{phase}={ms:.2f}" for phase, ms in sorted(stat['phases_avg_ms'].items()))
+            lines.append(
+                f"{command} n={stat['count']} avg={stat['avg_ms']:.2f}ms "
+                f"p50={stat['p50_ms']:.2f}ms p99={stat['p99_ms']:.2f}ms max={stat['max_ms']:.2f}ms [{phases}]"
+            )
+        with self.lock:
+            hot_stacks = self.stack_samples.most_common(top_stacks)
+        for stack, count in hot_stacks:
+            lines.append(f"stack x{count}: {stack}")
+        return lines
+    
+    def log_dump(self, signum=None, frame=None):
+        """把统计报告写入日志（可作为信号处理函数）"""
+        for line in self.dump_lines():
+            logger.info(f"[profile] {line}")
+    
+    def start_sampling(self, interval=None):
+        """启动调用栈采样线程（已在采样时只更新采样间隔）"""
+        if interval:
+            self.sample_interval = interval
+        if self.sample_interval <= 0:
+            return
+        with self._sampler_lock:
+            if self._sampler_thread is not None:
+                return
+            self._sampler_stop = threading.Event()
+            self._sampler_thread = threading.Thread(
+                target=self._sample_loop, args=(self._sampler_stop,), name='ftp-profiler', daemon=True
+            )
+            self._sampler_thread.start()
+    
+    def stop_sampling(self):
+        """停止调用栈采样，等待采样线程退出"""
+        with self._sampler_lock:
+            thread, self._sampler_thread = self._sampler_thread, None
+            self._sampler_stop.set()
+            if thread is not None and thread is not threading.current_thread():
+                thread.join()
+    
+    def _sample_loop(self, stop):
+        """定期采样所有会话线程的调用栈"""
+        own_id = threading.get_ident()
+        main_id = threading.main_thread().ident
+        while not stop.wait(self.sample_interval):
+            frames = sys._current_frames()
+            with self.lock:
+                for thread_id, frame in frames.items():
+                    if thread_id in (own_id, main_id):
+                        continue
+                    self.stack_samples[self._format_stack(frame)] += 1
+    
+    @staticmethod
+    def _format_stack(frame, depth=6):
+        """把调用栈压缩成一行，最内层在右侧"""
+        parts = []
+        while frame is not None and len(parts) < depth:
+            code = frame.f_code
+            parts.append(f"{code.co_name}:{frame.f_lineno}")
+            frame = frame.f_back
+        return ' <- '.join(parts)
+
+class TransferLog:
+    """传输记录日志
+    
+    在每次RETR/STOR结束时记录用户、文件、字节数、耗时和速率，支持xferlog和NDJSON两种格式。
+    日志由后台线程异步写入，超过 max_bytes 后轮转，旧文件gzip压缩为 <file>.1.gz、<file>.2.gz ...
+    队列最多积压 max_queue 条记录，写入跟不上时丢弃新记录并计入 dropped。
+    平滑重启期间新旧进程会同时写同一个文件：写入时持有 <file>.lock 的共享锁，轮转时持有排他锁，
+    文件被另一个进程轮转后重新打开。
+    """
+    
+    FORMATS = ('xferlog', 'ndjson')
+    
+    def __init__(self, path, log_format='xferlog', max_bytes=50 * 1024 * 1024, backup_count=10,
+                 max_queue=10000):
+        if log_format not in self.FORMATS:
+            raise ValueError(f"不支持的传输日志格式: {log_format}")
+        self.path = Path(path)
+        self.log_format = log_format
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.dropped = 0  # 因队列已满或写入失败而丢弃的记录数
+        self._dropped_lock = threading.Lock()
+        self._closed = False
+        self._writer_thread = threading.Thread(target=self._writer_loop, daemon=True)
+        self._writer_thread.start()
+    
+    def record(self, direction, username, client_ip, path, size, duration, completed):
+        """记录一次传输（direction: 'o' 下载, 'i' 上传）"""
+        if self._closed:
+            return
+        try:
+            self.queue.put_nowait({
+                'time': time.time(),
+                'duration': duration,
+                'client': client_ip,
+                'bytes': size,
+                'path': path,
+                'direction': direction,
+                'username': username or '',
+                'completed': completed
+            })
+        except queue.Full:
+            self._count_dropped(1)
+    
+    def close(self, timeout=5):
+        """写完队列中的记录后停止后台线程"""
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            self.queue.put(None, timeout=timeout)
+        except queue.Full:
+            logger.error("传输日志队列已满，写入线程未响应")
+            return
+        self._writer_thread.join(timeout=timeout)
+    
+    def _count_dropped(self, count):
+        with self._dropped_lock:
+            self.dropped += count
+    
+    def format_entry(self, entry):
+        """按配置的格式生成一行日志"""
+        if self.log_format == 'ndjson':
+            duration = entry['duration']
+            return json.dumps({
+                'time': datetime.fromtimestamp(entry['time']).isoformat(),
+                'duration': round(duration, 6),
+                'client': entry['client'],
+                'username': entry['username'],
+                'direction': 'download' if entry['direction'] == 'o' else 'upload',
+                'path': entry['path'],
+                'bytes': entry['bytes'],
+                'speed_kbps': round(entry['bytes'] / 1024 / duration, 2) if duration > 0 else None,
+                'status': 'complete' if entry['completed'] else 'incomplete'
+            }, ensure_ascii=False)
+        
+        # wu-ftpd xferlog格式
+        access_mode = 'a' if entry['username'] == 'anonymous' else 'r'
+        return ' '.join([
+            time.strftime('%a %b %d %H:%M:%S %Y', time.localtime(entry['time'])),
+            str(max(1, round(entry['duration']))),
+            entry['client'],
+            str(entry['bytes']),
+            entry['path'].replace(' ', '_'),
+            'b',
+            '_',
+            entry['direction'],
+            access_mode,
+            entry['username'] or '*',
+            'ftp',
+            '0',
+            '*',
+            'c' if entry['completed'] else 'i'
+        ])
+    
+    def _writer_loop(self):
+        """后台写入线程：批量取出记录写入文件，单批失败只丢弃该批，线程继续运行"""
+        stream = None
+        lock_file = None
+        if fcntl is not None:
+            try:
+                lock_file = open(f"{self.path}.lock", 'a')
+            except OSError as e:
+                logger.error(f"无法打开传输日志锁文件: {e}")
+        try:
+            while True:
+                entry = self.queue.get()
+                batch = [entry]
+                # 一次取出积压的记录，减少flush次数
+                while entry is not None and len(batch) < 1000:
+                    try:
+                        entry = self.queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    batch.append(entry)
+                
+                lines = self._format_batch(item for item in batch if item is not None)
+                if lines:
+                    try:
+                        stream = self._write_lines(stream, lock_file, lines)
+                    except Exception as e:
+                        logger.error(f"写入传输日志失败，丢弃 {len(lines)} 条记录: {e}")
+                        self._count_dropped(len(lines))
+                        stream = self._close_stream(stream)
+                
+                if batch[-1] is None:
+                    break
+        finally:
+            self._close_stream(stream)
+            if lock_file is not None:
+                lock_file.close()
+    
+    def _format_batch(self, entries):
+        """格式化一批记录，无法格式化的记录单独丢弃"""
+        lines = []
+        for entry in entries:
+            try:
+                lines.append(self.format_entry(entry) + '\n')
+            except Exception as e:
+                logger.error(f"传输记录格式错误: {e}")
+                self._count_dropped(1)
+        return lines
+    
+    def _write_lines(self, stream, lock_file, lines):
+        """在共享锁内写入一批记录，返回（可能重新打开的）文件流"""
+        self._lock(lock_file, 'LOCK_SH')
+        try:
+            if stream is None or self._replaced(stream):
+                self._close_stream(stream)
+                stream = open(self.path, 'a', encoding='utf-8')
+            stream.write(''.join(lines))
+            stream.flush()
+            rotate = self.max_bytes and stream.tell() >= self.max_bytes
+        finally:
+            self._lock(lock_file, 'LOCK_UN')
+        
+        if rotate:
+            stream = self._close_stream(stream)
+            self._rotate(lock_file)
+        return stream
+    
+    def _replaced(self, stream):
+        """日志文件是否已被其他进程轮转（路径指向了另一个文件或已不存在）"""
+        try:
+            return os.stat(self.path).st_ino != os.fstat(stream.fileno()).st_ino
+        except OSError:
+            return True
+    
+    @staticmethod
+    def _lock(lock_file, operation):
+        """对锁文件执行 flock（operation 为 'LOCK_SH' / 'LOCK_EX' / 'LOCK_UN'），不支持时跳过"""
+        if lock_file is not None:
+            fcntl.flock(lock_file.fileno(), getattr(fcntl, operation))
+    
+    @staticmethod
+    def _close_stream(stream):
+        if stream is not None:
+            try:
+                stream.close()
+            except OSError:
+                pass
+        return None
+    
+    def _rotate(self, lock_file=None):
+        """轮转日志文件并gzip压缩；持有排他锁，文件已被其他进程轮转时跳过"""
+        self._lock(lock_file, 'LOCK_EX')
+        try:
+            if self.path.stat().st_size < self.max_bytes:
+                return
+            for i in range(self.backup_count - 1, 0, -1):
+                source = Path(f"{self.path}.{i}.gz")
+                if source.exists():
+                    source.replace(f"{self.path}.{i + 1}.gz")
+            if self.backup_count > 0:
+                with open(self.path, 'rb') as src, gzip.open(f"{self.path}.1.gz", 'wb') as dst:
+                    shutil.copyfileobj(src, dst)
+            self.path.unlink()
+        except OSError as e:
+            logger.error(f"轮转传输日志失败: {e}")
+        finally:
+            self._lock(lock_file, 'LOCK_UN')
+
+# Linux FICLONE ioctl，用于在btrfs/xfs等文件系统上创建reflink
+FICLONE = 0x40049409
+
+def copy_file_fast(src, dst):
+    """服务器端复制文件，优先使用reflink，其次copy_file_range，最后回退到普通复制
+    
+    返回复制的字节数；源和目标是同一个文件时抛出 shutil.SameFileError（打开目标会截断源文件）
+    """
+    if os.path.exists(dst) and os.path.samefile(src, dst):
+        raise shutil.SameFileError(f"{src} 和 {dst} 是同一个文件")
+    size = os.path.getsize(src)
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        # 1. reflink（写时复制，不产生实际I/O）
+        if fcntl is not None:
+            try:
+                fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+                shutil.copymode(src, dst)
+                return size
+            except OSError:
+                pass
+        
+        # 2. copy_file_range（数据在内核中复制，不经过用户态）
+        if hasattr(os, 'copy_file_range'):
+            try:
+                copied = 0
+                while copied < size:
+                    count = os.copy_file_range(fsrc.fileno(), fdst.fileno(), size - copied)
+                    if count == 0:
+                        break
+                    copied += count
+                shutil.copymode(src, dst)
+                return copied
+            except OSError:
+                fsrc.seek(0)
+                fdst.seek(0)
+                fdst.truncate()
+        
+        # 3. 普通复制
+        shutil.copyfileobj(fsrc, fdst, 1024 * 1024)
+    shutil.copymode(src, dst)
+    return size
+
 class FTPServer:
     """FTP服务器类"""
     
-    def __init__(self, host='localhost', port=21, root_dir=None):
+    def __init__(self, host='localhost', port=21, root_dir=None, pid_file=None,
+                 drain_timeout=60, upgrade_timeout=10, profile=False, profile_sample_interval=0.0,
+                 transfer_logs=None, fs_workers=8):
         self.host = host
         self.port = port
         self.root_dir = Path(root_dir) if root_dir else Path.cwd() / 'ftp_root'
@@ -36,9 +497,28 @@ class FTPServer:
             'user': 'user123',
             'anonymous': ''
         }
+        self.admin_users = {'admin'}  # 可以执行服务器级管理命令（如 SITE PROFILE）的用户
         self.server_socket = None
         self.running = False
         
+        # 平滑重启相关
+        self.pid_file = Path(pid_file) if pid_file else None
+        self.drain_timeout = drain_timeout        # 旧进程等待会话结束的最长时间（秒）
+        self.upgrade_timeout = upgrade_timeout    # 等待新进程就绪的最长时间（秒）
+        self.upgrade_requested = False
+        self.draining = False
+        self.sessions = set()
+        self.sessions_lock = threading.Lock()
+        
+        # 命令耗时追踪
+        self.profiler = CommandProfiler(enabled=profile, sample_interval=profile_sample_interval)
+        
+        # 传输记录日志（TransferLog列表）
+        self.transfer_logs = list(transfer_logs or [])
+        
+        # 批量文件操作（SITE COPY/RMTREE/DELE）的工作线程池
+        self.fs_executor = ThreadPoolExecutor(max_workers=fs_workers, thread_name_prefix='ftp-fs')
+        
         # 确保根目录存在
         self.root_dir.mkdir(exist_ok=True)
         logger.info(f"FTP根目录: {self.root_dir.absolute()}")
@@ -46,16 +526,25 @@ class FTPServer:
     def start(self):
         """启动FTP服务器"""
         try:
-            self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            self.server_socket.bind((self.host, self.port))
-            self.server_socket.listen(5)
+            self.server_socket = self._create_server_socket()
+            # 使用超时的accept，以便及时响应重启信号
+            self.server_socket.settimeout(1.0)
             
             self.running = True
+            self._install_signal_handlers()
+            self._write_pid_file()
+            self._notify_ready()
+            if self.profiler.enabled:
+                self.profiler.start_sampling()
             logger.info(f"FTP服务器启动成功: {self.host}:{self.port}")
             logger.info(f"支持的用户: {list(self.users.keys())}")
             
             while self.running:
+                if self.upgrade_requested:
+                    self.upgrade_requested = False
+                    if self.graceful_upgrade():
+                        break
+                
                 try:
                     client_socket, client_address = self.server_socket.accept()
                     logger.info(f"新客户端连接: {client_address}")
@@ -68,6 +557,8 @@ class FTPServer:
                     client_thread.daemon = True
                     client_thread.start()
                     
+                except socket.timeout:
+                    continue
                 except socket.error as e:
                     if self.running:
                         logger.error(f"接受连接时出错: {e}")
@@ -76,27 +567,155 @@ class FTPServer:
             logger.error(f"启动FTP服务器失败: {e}")
         finally:
             self.stop()
+            if self.draining:
+                self.drain_sessions()
+            for transfer_log in self.transfer_logs:
+                transfer_log.close()
     
     def stop(self):
         """停止FTP服务器"""
         self.running = False
+        self.profiler.stop_sampling()
         if self.server_socket:
+            # 只关闭本进程的描述符，不能shutdown，新进程仍在使用同一个监听套接字
             self.server_socket.close()
+        self._remove_pid_file()
         logger.info("FTP服务器已停止")
     
     def handle_client(self, client_socket, client_address):
         """处理客户端连接"""
-        session = FTPSession(client_socket, client_address, self.root_dir, self.users)
-        session.handle()
+        session = FTPSession(client_socket, client_address, self.root_dir, self.users, server=self)
+        with self.sessions_lock:
+            self.sessions.add(session)
+        try:
+            session.handle()
+        finally:
+            with self.sessions_lock:
+                self.sessions.discard(session)
+    
+    def _create_server_socket(self):
+        """创建监听套接字，平滑重启时直接继承旧进程的套接字"""
+        inherited_fd = os.environ.pop(LISTEN_FD_ENV, None)
+        if inherited_fd is not None:
+            server_socket = socket.socket(fileno=int(inherited_fd))
+            self.host, self.port = server_socket.getsockname()[:2]
+            logger.info(f"继承监听套接字: fd={inherited_fd}")
+            return server_socket
+        
+        server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        server_socket.bind((self.host, self.port))
+        server_socket.listen(5)
+        return server_socket
+    
+    def _install_signal_handlers(self):
+        """注册SIGHUP作为平滑重启信号，SIGUSR1输出耗时统计（仅POSIX）"""
+        if not hasattr(signal, 'SIGHUP'):
+            return
+        if threading.current_thread() is not threading.main_thread():
+            return
+        signal.signal(signal.SIGHUP, self._on_upgrade_signal)
+        signal.signal(signal.SIGUSR1, self.profiler.log_dump)
+    
+    def _on_upgrade_signal(self, signum, frame):
+        """收到重启信号，交给accept循环处理"""
+        self.upgrade_requested = True
+    
+    def _notify_ready(self):
+        """通知旧进程新进程已开始监听"""
+        ready_fd = os.environ.pop(READY_FD_ENV, None)
+        if ready_fd is None:
+            return
+        try:
+            os.write(int(ready_fd), b'1')
+            os.close(int(ready_fd))
+        except OSError as e:
+            logger.error(f"通知旧进程失败: {e}")
+    
+    def graceful_upgrade(self):
+        """启动新进程接管监听套接字，本进程停止accept并排空会话"""
+        logger.info("收到平滑重启请求，正在启动新进程...")
+        listen_fd = self.server_socket.fileno()
+        ready_r, ready_w = os.pipe()
+        
+        env = os.environ.copy()
+        env[LISTEN_FD_ENV] = str(listen_fd)
+        env[READY_FD_ENV] = str(ready_w)
+        
+        try:
+            process = subprocess.Popen(
+                [sys.executable] + sys.argv,
+                env=env,
+                pass_fds=(listen_fd, ready_w)
+            )
+        except Exception as e:
+            logger.error(f"启动新进程失败: {e}")
+            os.close(ready_r)
+            os.close(ready_w)
+            return False
+        os.close(ready_w)
+        
+        try:
+            readable, _, _ = select.select([ready_r], [], [], self.upgrade_timeout)
+            ready = bool(readable) and os.read(ready_r, 1) == b'1'
+        finally:
+            os.close(ready_r)
+        
+        if not ready:
+            logger.error(f"新进程 {process.pid} 未在 {self.upgrade_timeout} 秒内就绪，继续由本进程提供服务")
+            process.kill()
+            return False
+        
+        logger.info(f"新进程 {process.pid} 已接管监听套接字，开始排空现有会话")
+        self.draining = True
+        self.running = False
+        return True
+    
+    def drain_sessions(self):
+        """等待现有会话结束，超时后强制断开"""
+        deadline = time.time() + self.drain_timeout
+        while time.time() < deadline:
+            with self.sessions_lock:
+                remaining = len(self.sessions)
+            if remaining == 0:
+                logger.info("所有会话已结束，旧进程退出")
+                return
+            time.sleep(0.5)
+        
+        with self.sessions_lock:
+            sessions = list(self.sessions)
+        logger.warning(f"排空超时，强制关闭 {len(sessions)} 个会话")
+        for session in sessions:
+            session.abort()
+    
+    def _write_pid_file(self):
+        """写入PID文件，供reload命令发送信号"""
+        if self.pid_file:
+            self.pid_file.write_text(str(os.getpid()), encoding='utf-8')
+    
+    def _remove_pid_file(self):
+        """删除PID文件（仅当文件仍属于本进程时）"""
+        if not self.pid_file or not self.pid_file.exists():
+            return
+        try:
+            if self.pid_file.read_text(encoding='utf-8').strip() == str(os.getpid()):
+                self.pid_file.unlink()
+        except OSError:
+            pass
 
 class FTPSession:
     """FTP会话类"""
     
-    def __init__(self, client_socket, client_address, root_dir, users):
+    def __init__(self, client_socket, client_address, root_dir, users, server=None):
         self.client_socket = client_socket
         self.client_address = client_address
         self.root_dir = root_dir
         self.users = users
+        self.server = server
+        self.profiler = server.profiler if server else CommandProfiler()
+        self.transfer_logs = server.transfer_logs if server else []
+        self.fs_executor = server.fs_executor if server else None
+        self.admin_users = server.admin_users if server else set()
         
         self.current_dir = root_dir
         self.authenticated = False
@@ -123,6 +742,15 @@ class FTPSession:
             'QUIT': self.cmd_quit,
             'SYST': self.cmd_syst,
             'FEAT': self.cmd_feat,
+            'SITE': self.cmd_site,
+        }
+        
+        # SITE子命令映射
+        self.site_commands = {
+            'PROFILE': self.site_profile,
+            'COPY': self.site_copy,
+            'RMTREE': self.site_rmtree,
+            'DELE': self.site_dele,
         }
     
     def handle(self):
@@ -141,15 +769,28 @@ class FTPSession:
                     logger.info(f"[{self.client_address[0]}] 收到命令: {data}")
                     
                     # 解析命令
-                    parts = data.split(' ', 1)
-                    command = parts[0].upper()
-                    args = parts[1] if len(parts) > 1 else ''
+                    record = self.profiler.begin(None, self.client_address[0])
+                    with self.span('parse'):
+                        parts = data.split(' ', 1)
+                        command = parts[0].upper()
+                        args = parts[1] if len(parts) > 1 else ''
+                    if record is not None:
+                        record['command'] = command
+                    
+                    # 平滑重启期间，空闲会话收到新命令时通知客户端重连到新进程
+                    if (self.server and self.server.draining and not self.data_socket
+                            and command != 'QUIT'):
+                        self.send_response('421 Server restarting, please reconnect')
+                        break
                     
                     # 执行命令
-                    if command in self.commands:
-                        self.commands[command](args)
-                    else:
-                        self.send_response('502 Command not implemented')
+                    try:
+                        if command in self.commands:
+                            self.commands[command](args)
+                        else:
+                            self.send_response('502 Command not implemented')
+                    finally:
+                        self.profiler.end(record)
                         
                 except socket.error:
                     break
@@ -162,10 +803,25 @@ class FTPSession:
         finally:
             self.cleanup()
     
+    def log_transfer(self, direction, file_path, size, started_at, completed):
+        """写入传输记录日志"""
+        if not self.transfer_logs:
+            return
+        path = self.virtual_path(file_path)
+        duration = time.time() - started_at
+        for transfer_log in self.transfer_logs:
+            transfer_log.record(direction, self.username, self.client_address[0],
+                                path, size, duration, completed)
+    
+    def span(self, phase):
+        """当前命令的阶段计时（未启用追踪时为空操作）"""
+        return self.profiler.span(phase)
+    
     def send_response(self, message):
         """发送响应消息"""
         try:
-            self.client_socket.send(f"{message}\r\n".encode('utf-8'))
+            with self.span('reply'):
+                self.client_socket.send(f"{message}\r\n".encode('utf-8'))
             logger.info(f"[{self.client_address[0]}] 发送响应: {message}")
         except socket.error as e:
             logger.error(f"发送响应失败: {e}")
@@ -182,18 +838,31 @@ class FTPSession:
         except:
             pass
     
+    def abort(self):
+        """强制中断会话（平滑重启排空超时时使用）"""
+        try:
+            self.client_socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        if self.data_socket:
+            try:
+                self.data_socket.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+    
     # FTP命令实现
     def cmd_user(self, username):
         """USER命令 - 设置用户名"""
-        self.username = username
-        if username in self.users:
-            if self.users[username] == '':  # 匿名用户
-                self.authenticated = True
-                self.send_response('230 Anonymous login successful')
+        with self.span('authorize'):
+            self.username = username
+            if username in self.users:
+                if self.users[username] == '':  # 匿名用户
+                    self.authenticated = True
+                    self.send_response('230 Anonymous login successful')
+                else:
+                    self.send_response('331 Password required')
             else:
-                self.send_response('331 Password required')
-        else:
-            self.send_response('530 Invalid username')
+                self.send_response('530 Invalid username')
     
     def cmd_pass(self, password):
         """PASS命令 - 验证密码"""
@@ -201,11 +870,12 @@ class FTPSession:
             self.send_response('503 Login with USER first')
             return
         
-        if self.username in self.users and self.users[self.username] == password:
-            self.authenticated = True
-            self.send_response('230 Login successful')
-        else:
-            self.send_response('530 Login incorrect')
+        with self.span('authorize'):
+            if self.username in self.users and self.users[self.username] == password:
+                self.authenticated = True
+                self.send_response('230 Login successful')
+            else:
+                self.send_response('530 Login incorrect')
     
     def cmd_pwd(self, args):
         """PWD命令 - 显示当前目录"""
@@ -215,8 +885,9 @@ class FTPSession:
 
         try:
             # 确保两个路径都是绝对路径
-            root_abs = self.root_dir.resolve()
-            current_abs = self.current_dir.resolve()
+            with self.span('fs'):
+                root_abs = self.root_dir.resolve()
+                current_abs = self.current_dir.resolve()
 
             rel_path = current_abs.relative_to(root_abs)
             path_str = '/' + str(rel_path).replace('\\', '/') if rel_path != Path('.') else '/'
@@ -241,17 +912,19 @@ class FTPSession:
             else:
                 new_dir = self.current_dir / path
 
-            new_dir = new_dir.resolve()
+            with self.span('fs'):
+                new_dir = new_dir.resolve()
 
-            # 确保不能访问根目录之外的目录
-            root_str = str(self.root_dir.resolve())
-            new_str = str(new_dir)
+                # 确保不能访问根目录之外的目录
+                root_str = str(self.root_dir.resolve())
+                new_str = str(new_dir)
+                is_dir = new_dir.is_dir()
 
             if not new_str.startswith(root_str):
                 self.send_response('550 Permission denied')
                 return
 
-            if new_dir.is_dir():
+            if is_dir:
                 self.current_dir = new_dir
                 self.send_response('250 Directory changed')
             else:
@@ -276,20 +949,22 @@ class FTPSession:
             
             # 生成目录列表
             listing = []
-            for item in self.current_dir.iterdir():
-                stat = item.stat()
-                mtime = datetime.fromtimestamp(stat.st_mtime)
-                
-                if item.is_dir():
-                    listing.append(f"drwxr-xr-x 1 owner group {stat.st_size:>8} {mtime.strftime('%b %d %H:%M')} {item.name}")
-                else:
-                    listing.append(f"-rw-r--r-- 1 owner group {stat.st_size:>8} {mtime.strftime('%b %d %H:%M')} {item.name}")
+            with self.span('fs'):
+                for item in self.current_dir.iterdir():
+                    stat = item.stat()
+                    mtime = datetime.fromtimestamp(stat.st_mtime)
+                    
+                    if item.is_dir():
+                        listing.append(f"drwxr-xr-x 1 owner group {stat.st_size:>8} {mtime.strftime('%b %d %H:%M')} {item.name}")
+                    else:
+                        listing.append(f"-rw-r--r-- 1 owner group {stat.st_size:>8} {mtime.strftime('%b %d %H:%M')} {item.name}")
             
             # 发送列表
-            data = '\r\n'.join(listing) + '\r\n'
-            self.data_socket.send(data.encode('utf-8'))
-            self.data_socket.close()
-            self.data_socket = None
+            with self.span('transfer'):
+                data = '\r\n'.join(listing) + '\r\n'
+                self.data_socket.send(data.encode('utf-8'))
+                self.data_socket.close()
+                self.data_socket = None
             
             self.send_response('226 Transfer complete')
             
@@ -310,21 +985,32 @@ class FTPSession:
         try:
             file_path = self.current_dir / filename
             
-            if not file_path.exists() or not file_path.is_file():
+            with self.span('fs'):
+                is_file = file_path.exists() and file_path.is_file()
+            if not is_file:
                 self.send_response('550 File not found')
                 return
             
             self.send_response('150 Opening data connection')
             
-            with open(file_path, 'rb') as f:
-                while True:
-                    data = f.read(8192)
-                    if not data:
-                        break
-                    self.data_socket.send(data)
-            
-            self.data_socket.close()
-            self.data_socket = None
+            started_at = time.time()
+            transferred = 0
+            completed = False
+            try:
+                with self.span('transfer'):
+                    with open(file_path, 'rb') as f:
+                        while True:
+                            data = f.read(8192)
+                            if not data:
+                                break
+                            self.data_socket.sendall(data)
+                            transferred += len(data)
+                    
+                    self.data_socket.close()
+                    self.data_socket = None
+                completed = True
+            finally:
+                self.log_transfer('o', file_path, transferred, started_at, completed)
             self.send_response('226 Transfer complete')
             
         except Exception as e:
@@ -346,18 +1032,27 @@ class FTPSession:
             
             self.send_response('150 Opening data connection')
             
-            with open(file_path, 'wb') as f:
-                while True:
-                    try:
-                        data = self.data_socket.recv(8192)
-                        if not data:
-                            break
-                        f.write(data)
-                    except socket.timeout:
-                        break
-            
-            self.data_socket.close()
-            self.data_socket = None
+            started_at = time.time()
+            transferred = 0
+            completed = False
+            try:
+                with self.span('transfer'):
+                    with open(file_path, 'wb') as f:
+                        while True:
+                            try:
+                                data = self.data_socket.recv(8192)
+                                if not data:
+                                    break
+                                f.write(data)
+                                transferred += len(data)
+                            except socket.timeout:
+                                break
+                    
+                    self.data_socket.close()
+                    self.data_socket = None
+                completed = True
+            finally:
+                self.log_transfer('i', file_path, transferred, started_at, completed)
             self.send_response('226 Transfer complete')
             
         except Exception as e:
@@ -373,8 +1068,11 @@ class FTPSession:
         try:
             file_path = self.current_dir / filename
             
-            if file_path.exists() and file_path.is_file():
-                file_path.unlink()
+            with self.span('fs'):
+                deleted = file_path.exists() and file_path.is_file()
+                if deleted:
+                    file_path.unlink()
+            if deleted:
                 self.send_response('250 File deleted')
             else:
                 self.send_response('550 File not found')
@@ -391,7 +1089,8 @@ class FTPSession:
         
         try:
             dir_path = self.current_dir / dirname
-            dir_path.mkdir()
+            with self.span('fs'):
+                dir_path.mkdir()
             self.send_response('257 Directory created')
             
         except Exception as e:
@@ -407,8 +1106,11 @@ class FTPSession:
         try:
             dir_path = self.current_dir / dirname
             
-            if dir_path.exists() and dir_path.is_dir():
-                dir_path.rmdir()
+            with self.span('fs'):
+                removed = dir_path.exists() and dir_path.is_dir()
+                if removed:
+                    dir_path.rmdir()
+            if removed:
                 self.send_response('250 Directory deleted')
             else:
                 self.send_response('550 Directory not found')
@@ -436,7 +1138,8 @@ class FTPSession:
             self.send_response(f'227 Entering Passive Mode ({",".join(ip_parts)},{port_high},{port_low})')
             
             # 等待数据连接
-            self.data_socket, _ = self.passive_socket.accept()
+            with self.span('data_setup'):
+                self.data_socket, _ = self.passive_socket.accept()
             
         except Exception as e:
             logger.error(f"PASV命令错误: {e}")
@@ -455,8 +1158,9 @@ class FTPSession:
             port = int(parts[4]) * 256 + int(parts[5])
             
             # 创建数据连接
-            self.data_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.data_socket.connect((ip, port))
+            with self.span('data_setup'):
+                self.data_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                self.data_socket.connect((ip, port))
             
             self.send_response('200 PORT command successful')
             
@@ -479,6 +1183,7 @@ class FTPSession:
             ' PASV',
             ' PORT',
             ' TYPE I',
+            ' SITE',
             '211 End'
         ]
         for feature in features:
@@ -488,6 +1193,250 @@ class FTPSession:
         """CDUP命令 - 返回上级目录"""
         self.cmd_cwd('..')
 
+    def cmd_site(self, args):
+        """SITE命令 - 服务器扩展命令"""
+        if not self.authenticated:
+            self.send_response('530 Not logged in')
+            return
+        
+        parts = args.split(' ', 1)
+        subcommand = parts[0].upper()
+        sub_args = parts[1] if len(parts) > 1 else ''
+        
+        if subcommand in self.site_commands:
+            self.site_commands[subcommand](sub_args)
+        else:
+            self.send_response('504 SITE command not implemented')
+    
+    def virtual_path(self, path):
+        """把服务器上的绝对路径转换为客户端看到的路径"""
+        try:
+            return '/' + Path(path).resolve().relative_to(self.root_dir.resolve()).as_posix()
+        except ValueError:
+            return str(path)
+    
+    def resolve_path(self, path):
+        """把客户端路径解析为根目录内的绝对路径，越界时返回None"""
+        if path.startswith('/'):
+            target = self.root_dir / path.lstrip('/')
+        else:
+            target = self.current_dir / path
+        target = target.resolve()
+        try:
+            target.relative_to(self.root_dir.resolve())
+        except ValueError:
+            return None
+        return target
+    
+    def run_batch(self, label, items, func, progress_interval=1.0):
+        """在工作线程池中并行执行批量文件操作，并通过控制连接报告进度
+        
+        调用方需先发送 '250-' 开头的多行响应首行，本方法只发送中间的进度行。
+        返回 (成功数, 字节数, 错误列表)
+        """
+        done = 0
+        total_bytes = 0
+        errors = []
+        last_report = time.time()
+        
+        if self.fs_executor is None:
+            self.fs_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='ftp-fs')
+        
+        with self.span('fs'):
+            futures = {self.fs_executor.submit(func, item): item for item in items}
+            for future in as_completed(futures):
+                try:
+                    total_bytes += future.result() or 0
+                    done += 1
+                except Exception as e:
+                    item = futures[future]
+                    path = item[0] if isinstance(item, tuple) else item
+                    reason = getattr(e, 'strerror', None) or str(e)
+                    errors.append(f"{self.virtual_path(path)}: {reason}")
+                
+                now = time.time()
+                if now - last_report >= progress_interval:
+                    last_report = now
+                    self.send_response(f' {label} {done + len(errors)}/{len(futures)}')
+        return done, total_bytes, errors
+    
+    def _finish_batch(self, action, done, total_bytes, errors):
+        """发送批量操作的最终结果"""
+        for error in errors[:20]:
+            self.send_response(f' error: {error}')
+        if len(errors) > 20:
+            self.send_response(f' ... {len(errors) - 20} more errors')
+        summary = f'{action} {done} files ({total_bytes} bytes)'
+        if errors:
+            summary += f', {len(errors)} failed'
+        self.send_response(f'250 {summary}')
+    
+    def site_copy(self, args):
+        """SITE COPY <源> <目标> - 服务器端复制文件或目录"""
+        parts = args.split()
+        if len(parts) != 2:
+            self.send_response('501 Usage: SITE COPY <source> <target>')
+            return
+        
+        src = self.resolve_path(parts[0])
+        dst = self.resolve_path(parts[1])
+        if src is None or dst is None:
+            self.send_response('550 Permission denied')
+            return
+        if not src.exists():
+            self.send_response('550 Source not found')
+            return
+        if dst.is_dir():
+            dst = dst / src.name
+        if dst == src or (dst.exists() and os.path.samefile(src, dst)):
+            self.send_response('553 Source and target are the same file')
+            return
+        if src.is_dir() and src in dst.parents:
+            self.send_response('553 Cannot copy a directory into itself')
+            return
+        
+        skipped = []
+        try:
+            # 先建立目录结构，文件复制交给线程池
+            if src.is_dir():
+                jobs = []
+                for dirpath, dirnames, filenames in os.walk(src):
+                    target_dir = dst / Path(dirpath).relative_to(src)
+                    target_dir.mkdir(parents=True, exist_ok=True)
+                    # 符号链接可能指向根目录之外，不跟随也不复制（指向目录的链接出现在dirnames中，os.walk不会进入）
+                    for name in dirnames + filenames:
+                        path = Path(dirpath) / name
+                        mode = os.lstat(path).st_mode
+                        if stat.S_ISLNK(mode):
+                            skipped.append(f"{self.virtual_path(path.parent)}/{name}: symbolic link not copied")
+                        elif stat.S_ISREG(mode):
+                            jobs.append((path, target_dir / name))
+                        elif not stat.S_ISDIR(mode):
+                            skipped.append(f"{self.virtual_path(path)}: not a regular file")
+            else:
+                dst.parent.mkdir(parents=True, exist_ok=True)
+                jobs = [(src, dst)]
+        except OSError as e:
+            logger.error(f"SITE COPY错误: {e}")
+            self.send_response('550 Copy failed')
+            return
+        
+        self.send_response(f'250-Copying {len(jobs)} files')
+        done, total_bytes, errors = self.run_batch('copied', jobs, self._copy_regular_file)
+        self._finish_batch('Copied', done, total_bytes, skipped + errors)
+    
+    @staticmethod
+    def _copy_regular_file(job):
+        """复制单个文件（供线程池调用），源文件在扫描后被替换为符号链接时拒绝复制"""
+        src, dst = job
+        if not stat.S_ISREG(os.lstat(src).st_mode):
+            raise OSError(errno.EINVAL, 'not a regular file')
+        return copy_file_fast(src, dst)
+    
+    def site_rmtree(self, args):
+        """SITE RMTREE <目录> - 递归删除目录"""
+        target = self.resolve_path(args.strip()) if args.strip() else None
+        if target is None or target == self.root_dir.resolve():
+            self.send_response('550 Permission denied')
+            return
+        if not target.is_dir():
+            self.send_response('550 Directory not found')
+            return
+        
+        files = []
+        dirs = []
+        for dirpath, dirnames, filenames in os.walk(target, topdown=False):
+            files.extend(Path(dirpath) / filename for filename in filenames)
+            # 指向目录的符号链接出现在dirnames中，只删除链接本身，不进入链接指向的目录
+            files.extend(Path(dirpath) / name for name in dirnames if os.path.islink(os.path.join(dirpath, name)))
+            dirs.append(Path(dirpath))
+        
+        self.send_response(f'250-Removing {len(files)} files, {len(dirs)} directories')
+        done, _, errors = self.run_batch('removed', files, self._unlink_file)
+        
+        # 文件删除完成后自底向上删除目录
+        for directory in dirs:
+            try:
+                directory.rmdir()
+            except OSError as e:
+                errors.append(f"{self.virtual_path(directory)}: {e.strerror}")
+        
+        current = self.current_dir.resolve()
+        if current == target or target in current.parents:
+            self.current_dir = target.parent
+        self._finish_batch('Removed', done, 0, errors)
+    
+    def site_dele(self, args):
+        """SITE DELE <列表文件> - 批量删除列表文件中的文件（每行一个路径）"""
+        list_file = self.resolve_path(args.strip()) if args.strip() else None
+        if list_file is None:
+            self.send_response('501 Usage: SITE DELE <list-file>')
+            return
+        if not list_file.is_file():
+            self.send_response('550 List file not found')
+            return
+        
+        targets = []
+        errors = []
+        with open(list_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                path = line.strip()
+                if not path:
+                    continue
+                target = self.resolve_path(path)
+                if target is None:
+                    errors.append(f"{path}: permission denied")
+                else:
+                    targets.append(target)
+        
+        self.send_response(f'250-Deleting {len(targets)} files')
+        done, _, batch_errors = self.run_batch('deleted', targets, self._unlink_file)
+        self._finish_batch('Deleted', done, 0, errors + batch_errors)
+    
+    @staticmethod
+    def _unlink_file(path):
+        """删除单个文件（供线程池调用）"""
+        path.unlink()
+        return 0
+    
+    def site_profile(self, args):
+        """SITE PROFILE [ON|OFF|RESET|SAMPLE <ms>] - 命令耗时统计（影响整个服务器，仅限管理员）"""
+        if self.username not in self.admin_users:
+            self.send_response('550 Permission denied')
+            return
+        
+        action = args.strip().upper()
+        
+        if action == 'ON':
+            self.profiler.enabled = True
+            self.send_response('200 Profiling enabled')
+        elif action == 'OFF':
+            self.profiler.enabled = False
+            self.profiler.stop_sampling()
+            self.send_response('200 Profiling disabled')
+        elif action == 'RESET':
+            self.profiler.reset()
+            self.send_response('200 Profile data cleared')
+        elif action.startswith('SAMPLE'):
+            try:
+                interval_ms = float(action.split()[1])
+            except (IndexError, ValueError):
+                self.send_response('501 Usage: SITE PROFILE SAMPLE <ms>')
+                return
+            if interval_ms <= 0:
+                self.profiler.stop_sampling()
+                self.send_response('200 Stack sampling disabled')
+            else:
+                self.profiler.start_sampling(interval_ms / 1000)
+                self.send_response(f'200 Stack sampling every {interval_ms:g} ms')
+        elif action in ('', 'DUMP'):
+            self.send_response('211-Profile:')
+            for line in self.profiler.dump_lines():
+                self.send_response(f' {line}')
+            self.send_response('211 End')
+        else:
+            self.send_response('501 Usage: SITE PROFILE [ON|OFF|RESET|SAMPLE <ms>]')
+
     def cmd_quit(self, args):
         """QUIT命令 - 退出"""
         self.send_response('221 Goodbye')
@@ -501,14 +1450,33 @@ def main():
     parser.add_argument('--host', default='localhost', help='服务器地址 (默认: localhost)')
     parser.add_argument('--port', type=int, default=2121, help='服务器端口 (默认: 2121)')
     parser.add_argument('--root', help='FTP根目录 (默认: ./ftp_root)')
+    parser.add_argument('--pid-file', help='PID文件路径，用于平滑重启 (kill -HUP)')
+    parser.add_argument('--drain-timeout', type=int, default=60, help='平滑重启时等待会话结束的秒数 (默认: 60)')
+    parser.add_argument('--profile', action='store_true', help='启用命令耗时追踪 (SITE PROFILE / kill -USR1 查看)')
+    parser.add_argument('--profile-sample-ms', type=float, default=0, help='调用栈采样间隔毫秒，0表示不采样 (默认: 0)')
+    parser.add_argument('--fs-workers', type=int, default=8, help='批量文件操作的工作线程数 (默认: 8)')
+    parser.add_argument('--xferlog', help='xferlog格式传输日志文件')
+    parser.add_argument('--transfer-json-log', help='NDJSON格式传输日志文件')
     
     args = parser.parse_args()
     
+    transfer_logs = []
+    if args.xferlog:
+        transfer_logs.append(TransferLog(args.xferlog, 'xferlog'))
+    if args.transfer_json_log:
+        transfer_logs.append(TransferLog(args.transfer_json_log, 'ndjson'))
+    
     # 创建FTP服务器
     server = FTPServer(
         host=args.host,
         port=args.port,
-        root_dir=args.root
+        root_dir=args.root,
+        pid_file=args.pid_file,
+        drain_timeout=args.drain_timeout,
+        profile=args.profile,
+        profile_sample_interval=args.profile_sample_ms / 1000,
+        transfer_logs=transfer_logs,
+        fs_workers=args.fs_workers
     )
     
     try:
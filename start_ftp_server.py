@@ -6,6 +6,7 @@ FTP服务器启动脚本
 
 import os
 import sys
+import signal
 import argparse
 from pathlib import Path
 import json
@@ -16,7 +17,9 @@ def create_config_file():
         "server": {
             "host": "localhost",
             "port": 2121,
-            "root_directory": "./ftp_root"
+            "root_directory": "./ftp_root",
+            "pid_file": "ftp_server.pid",
+            "drain_timeout": 60
         },
         "users": {
             "admin": {
@@ -35,6 +38,12 @@ def create_config_file():
         "logging": {
             "level": "INFO",
             "file": "ftp_server.log"
+        },
+        "transfer_log": {
+            "xferlog": "xferlog",
+            "ndjson": "",
+            "max_bytes": 52428800,
+            "backup_count": 10
         }
     }
     
@@ -107,13 +116,28 @@ def start_server(config):
     """启动FTP服务器"""
     try:
         # 导入FTP服务器
-        from ftp_server import FTPServer
+        from ftp_server import FTPServer, TransferLog
+        
+        # 传输记录日志
+        transfer_config = config.get("transfer_log", {})
+        transfer_logs = []
+        for log_format, key in (('xferlog', 'xferlog'), ('ndjson', 'ndjson')):
+            if transfer_config.get(key):
+                transfer_logs.append(TransferLog(
+                    transfer_config[key],
+                    log_format,
+                    max_bytes=transfer_config.get("max_bytes", 52428800),
+                    backup_count=transfer_config.get("backup_count", 10)
+                ))
         
         # 创建服务器实例
         server = FTPServer(
             host=config["server"]["host"],
             port=config["server"]["port"],
-            root_dir=config["server"]["root_directory"]
+            root_dir=config["server"]["root_directory"],
+            pid_file=config["server"].get("pid_file", "ftp_server.pid"),
+            drain_timeout=config["server"].get("drain_timeout", 60),
+            transfer_logs=transfer_logs
         )
         
         # 更新用户配置
@@ -140,6 +164,36 @@ def start_server(config):
     except Exception as e:
         print(f"❌ 启动FTP服务器失败: {e}")
 
+def reload_server():
+    """平滑重启FTP服务器（新进程接管监听套接字，旧进程排空会话后退出）"""
+    config = load_config()
+    pid_file = Path(config["server"].get("pid_file", "ftp_server.pid"))
+    
+    if not hasattr(signal, 'SIGHUP'):
+        print("❌ 当前平台不支持平滑重启")
+        return False
+    
+    if not pid_file.exists():
+        print(f"❌ PID文件不存在: {pid_file}，服务器可能未运行")
+        return False
+    
+    try:
+        pid = int(pid_file.read_text(encoding='utf-8').strip())
+        os.kill(pid, signal.SIGHUP)
+    except ValueError:
+        print(f"❌ PID文件内容无效: {pid_file}")
+        return False
+    except ProcessLookupError:
+        print(f"❌ 进程 {pid} 不存在，服务器可能已停止")
+        return False
+    except Exception as e:
+        print(f"❌ 发送重启信号失败: {e}")
+        return False
+    
+    print(f"✅ 已向进程 {pid} 发送平滑重启信号")
+    print(f"   旧进程最多等待 {config['server'].get('drain_timeout', 60)} 秒排空现有传输")
+    return True
+
 def show_status():
     """显示服务器状态"""
     config = load_config()
@@ -150,6 +204,9 @@ def show_status():
     print(f"服务器端口: {config['server']['port']}")
     print(f"根目录: {config['server']['root_directory']}")
     print(f"日志文件: {config['logging']['file']}")
+    transfer_config = config.get('transfer_log', {})
+    if transfer_config.get('xferlog') or transfer_config.get('ndjson'):
+        print(f"传输日志: {transfer_config.get('xferlog') or '-'} (xferlog), {transfer_config.get('ndjson') or '-'} (ndjson)")
     
     print("\n用户列表:")
     for username, user_config in config['users'].items():
@@ -207,8 +264,8 @@ def run_test():
 def main():
     """主函数"""
     parser = argparse.ArgumentParser(description='FTP服务器管理工具')
-    parser.add_argument('action', choices=['start', 'config', 'status', 'test'], 
-                       help='操作: start(启动), config(配置), status(状态), test(测试)')
+    parser.add_argument('action', choices=['start', 'config', 'status', 'test', 'reload'], 
+                       help='操作: start(启动), config(配置), status(状态), test(测试), reload(平滑重启)')
     parser.add_argument('--host', help='服务器地址')
     parser.add_argument('--port', type=int, help='服务器端口')
     parser.add_argument('--root', help='FTP根目录')
@@ -240,6 +297,10 @@ def main():
         success = run_test()
         sys.exit(0 if success else 1)
         
+    elif args.action == 'reload':
+        success = reload_server()
+        sys.exit(0 if success else 1)
+        
     elif args.action == 'start':
         config = load_config()
         
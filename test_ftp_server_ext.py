@@ -0,0 +1,458 @@
+#!/usr/bin/env python3
+"""
+测试FTP服务器的扩展功能：平滑重启、命令耗时追踪、传输日志、SITE批量文件操作、性能基准
+每个测试在临时目录中启动独立的服务器进程，不依赖已运行的服务器
+"""
+
+import ftplib
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+SERVER_SCRIPT = Path(__file__).resolve().parent / 'ftp_server.py'
+
+def find_free_port():
+    """获取一个空闲端口"""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def wait_until(condition, timeout=10, interval=0.05):
+    """等待条件成立，超时返回False"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(interval)
+    return False
+
+class ServerProcess:
+    """在临时目录中启动的FTP服务器进程"""
+
+    def __init__(self, workdir, *extra_args):
+        self.workdir = Path(workdir)
+        self.root = self.workdir / 'ftp_root'
+        self.root.mkdir(exist_ok=True)
+        self.port = find_free_port()
+        self.pid_file = self.workdir / 'ftp_server.pid'
+        self.process = subprocess.Popen(
+            [sys.executable, str(SERVER_SCRIPT), '--host', '127.0.0.1', '--port', str(self.port),
+             '--root', str(self.root), '--pid-file', str(self.pid_file)] + list(extra_args),
+            cwd=self.workdir,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL
+        )
+        if not wait_until(self._listening):
+            self.stop()
+            raise RuntimeError('FTP服务器启动超时')
+
+    def _listening(self):
+        try:
+            with socket.create_connection(('127.0.0.1', self.port), timeout=1) as s:
+                return s.recv(1024).startswith(b'220')
+        except OSError:
+            return False
+
+    def current_pid(self):
+        try:
+            return int(self.pid_file.read_text().strip())
+        except (OSError, ValueError):
+            return None
+
+    def connect(self, username='admin', password='admin123'):
+        ftp = ftplib.FTP()
+        ftp.connect('127.0.0.1', self.port, timeout=10)
+        ftp.login(username, password)
+        return ftp
+
+    def stop(self):
+        """停止服务器（平滑重启后由PID文件找到新进程）"""
+        pids = {self.process.pid, self.current_pid()} - {None}
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError:
+                pass
+        try:
+            self.process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+
+@pytest.fixture
+def server(tmp_path):
+    server = ServerProcess(tmp_path)
+    yield server
+    server.stop()
+
+def test_graceful_reload_hands_over_listening_socket(server):
+    """SIGHUP后新进程接管监听套接字，旧进程排空会话后退出，期间不拒绝新连接"""
+    old_pid = server.process.pid
+    idle_client = server.connect()
+
+    os.kill(old_pid, signal.SIGHUP)
+    assert wait_until(lambda: server.current_pid() not in (None, old_pid))
+    new_pid = server.current_pid()
+
+    # 新连接由新进程处理
+    for _ in range(5):
+        ftp = server.connect()
+        assert ftp.pwd() == '/'
+        ftp.quit()
+
+    # 旧进程中的空闲会话收到命令时被要求重连，会话结束后旧进程退出
+    with pytest.raises(ftplib.error_temp, match='421'):
+        idle_client.pwd()
+    idle_client.close()
+    server.process.wait(timeout=10)
+    assert server.process.returncode is not None
+
+    os.kill(new_pid, 0)  # 新进程仍在运行
+    ftp = server.connect()
+    assert ftp.pwd() == '/'
+    ftp.quit()
+
+def test_site_profile_requires_admin(server):
+    """SITE PROFILE 影响整个服务器，普通用户和匿名用户无权执行"""
+    for username, password in (('user', 'user123'), ('anonymous', '')):
+        ftp = server.connect(username, password)
+        for command in ('SITE PROFILE ON', 'SITE PROFILE SAMPLE 5', 'SITE PROFILE'):
+            with pytest.raises(ftplib.error_perm, match='550'):
+                ftp.sendcmd(command)
+        ftp.quit()
+
+    ftp = server.connect()
+    assert ftp.sendcmd('SITE PROFILE ON').startswith('200')
+    assert ftp.sendcmd('SITE PROFILE SAMPLE 5').startswith('200')
+    assert ftp.sendcmd('SITE PROFILE OFF').startswith('200')
+    ftp.quit()
+
+def test_site_profile_records_command_phases(server):
+    """开启追踪后，LIST 和 RETR 按命令记录 fs、transfer、reply 各阶段的耗时"""
+    (server.root / 'data.bin').write_bytes(b'x' * 100000)
+    ftp = server.connect()
+    assert ftp.sendcmd('SITE PROFILE ON').startswith('200')
+    ftp.retrlines('LIST', lambda line: None)
+    chunks = []
+    ftp.retrbinary('RETR data.bin', chunks.append)
+    assert sum(map(len, chunks)) == 100000
+
+    dump = ftp.sendcmd('SITE PROFILE').splitlines()
+    ftp.quit()
+    assert dump[0].startswith('211-') and dump[-1] == '211 End'
+    stats = {line.split()[0]: line for line in dump[1:-1]}
+    for command in ('LIST', 'RETR'):
+        assert f'{command} n=1 ' in stats[command]
+        phases = dict(item.split('=') for item in stats[command].split('[')[1].rstrip(']').split())
+        assert {'fs', 'transfer', 'reply'} <= set(phases)
+        assert all(float(ms) >= 0 for ms in phases.values())
+
+def test_profiler_sampling_restart_keeps_single_thread():
+    """反复 OFF / SAMPLE 不会留下多个采样线程"""
+    import threading
+    from ftp_server import CommandProfiler
+
+    def sampler_threads():
+        return [thread for thread in threading.enumerate() if thread.name == 'ftp-profiler']
+
+    profiler = CommandProfiler(enabled=True)
+    for _ in range(5):
+        profiler.start_sampling(0.005)
+        profiler.start_sampling(0.005)
+        profiler.stop_sampling()
+        profiler.start_sampling(0.005)
+        assert len(sampler_threads()) == 1
+
+    # 采样线程跳过主线程和自身，用一个工作线程模拟会话线程
+    done = threading.Event()
+    worker = threading.Thread(target=done.wait)
+    worker.start()
+    assert wait_until(lambda: profiler.stack_samples, timeout=2)
+    done.set()
+    worker.join()
+
+    profiler.stop_sampling()
+    assert not sampler_threads()
+
+def read_transfer_log(path):
+    """读取传输日志及其所有gzip轮转文件中的记录"""
+    import gzip
+    lines = []
+    for backup in sorted(path.parent.glob(f'{path.name}.*.gz')):
+        with gzip.open(backup, 'rt', encoding='utf-8') as f:
+            lines.extend(f.read().splitlines())
+    if path.exists():
+        lines.extend(path.read_text(encoding='utf-8').splitlines())
+    return lines
+
+def test_server_logs_retr_and_stor_including_aborted(tmp_path):
+    """服务器在RETR/STOR结束时写入xferlog和NDJSON记录，客户端中断的下载记为未完成"""
+    import io
+    import json
+    import struct
+
+    xferlog, json_log = tmp_path / 'xferlog', tmp_path / 'transfers.ndjson'
+    server = ServerProcess(tmp_path, '--xferlog', str(xferlog), '--transfer-json-log', str(json_log))
+    try:
+        big_size = 64 * 1024 * 1024
+        with open(server.root / 'big.bin', 'wb') as f:
+            f.truncate(big_size)
+
+        ftp = server.connect('user', 'user123')
+        ftp.storbinary('STOR up.bin', io.BytesIO(b'u' * 5000))
+        chunks = []
+        ftp.retrbinary('RETR up.bin', chunks.append)
+        assert sum(map(len, chunks)) == 5000
+
+        # 读取少量数据后重置数据连接，服务器发送失败
+        conn = ftp.transfercmd('RETR big.bin')
+        conn.recv(8192)
+        conn.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack('ii', 1, 0))
+        conn.close()
+        with pytest.raises(ftplib.Error):
+            ftp.voidresp()
+        ftp.quit()
+
+        assert wait_until(lambda: len(read_transfer_log(xferlog)) == 3 and len(read_transfer_log(json_log)) == 3)
+    finally:
+        server.stop()
+
+    xfer = [line.split() for line in read_transfer_log(xferlog)]
+    # 字段：时间(5) 耗时 客户端 字节数 路径 类型 动作 方向 访问方式 用户 服务 认证方式 认证用户 状态
+    assert [(fields[7], fields[8], fields[11], fields[13], fields[17]) for fields in xfer[:2]] == [
+        ('5000', '/up.bin', 'i', 'user', 'c'),
+        ('5000', '/up.bin', 'o', 'user', 'c'),
+    ]
+    assert xfer[2][8] == '/big.bin' and xfer[2][11] == 'o' and xfer[2][17] == 'i'
+    assert 0 < int(xfer[2][7]) < big_size
+
+    entries = [json.loads(line) for line in read_transfer_log(json_log)]
+    assert [(entry['direction'], entry['bytes'], entry['username'], entry['status'])
+            for entry in entries[:2]] == [('upload', 5000, 'user', 'complete'),
+                                          ('download', 5000, 'user', 'complete')]
+    assert entries[2]['status'] == 'incomplete' and entries[2]['bytes'] == int(xfer[2][7])
+
+def test_transfer_log_survives_write_errors(tmp_path):
+    """格式错误的记录和写入失败只丢弃对应的记录，写入线程继续工作"""
+    from ftp_server import TransferLog
+
+    path = tmp_path / 'xferlog'
+    transfer_log = TransferLog(path)
+    transfer_log.record('o', 'admin', '127.0.0.1', None, 10, 0.1, True)  # 路径为None，无法格式化
+    transfer_log.record('o', 'admin', '127.0.0.1', '/a.txt', 10, 0.1, True)
+    assert wait_until(lambda: len(read_transfer_log(path)) == 1)
+
+    # 日志路径变成目录，写入失败
+    path.unlink()
+    path.mkdir()
+    transfer_log.record('i', 'admin', '127.0.0.1', '/b.txt', 10, 0.1, True)
+    assert wait_until(lambda: transfer_log.dropped == 2)
+
+    path.rmdir()
+    transfer_log.record('i', 'admin', '127.0.0.1', '/c.txt', 10, 0.1, True)
+    transfer_log.close()
+    lines = read_transfer_log(path)
+    assert len(lines) == 1 and '/c.txt' in lines[0]
+    assert transfer_log.dropped == 2
+
+def test_transfer_log_queue_is_bounded(tmp_path):
+    """写入线程阻塞时队列不会无限增长，超出的记录计入 dropped"""
+    fcntl = pytest.importorskip('fcntl')
+    from ftp_server import TransferLog
+
+    path = tmp_path / 'xferlog'
+    with open(f'{path}.lock', 'a') as lock_file:
+        # 模拟另一个进程正在轮转，写入线程在锁上等待
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        transfer_log = TransferLog(path, max_queue=5)
+        for i in range(50):
+            transfer_log.record('o', 'admin', '127.0.0.1', f'/file_{i}.txt', 10, 0.1, True)
+        assert transfer_log.queue.qsize() <= 5
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    transfer_log.close()
+    written = len(read_transfer_log(path))
+    assert written + transfer_log.dropped == 50
+    assert transfer_log.dropped >= 30
+
+def test_transfer_log_rotation_shared_between_writers(tmp_path):
+    """平滑重启期间新旧进程写同一个日志文件，轮转时不丢失记录"""
+    import threading
+    from ftp_server import TransferLog
+
+    path = tmp_path / 'xferlog'
+    writers = [TransferLog(path, 'ndjson', max_bytes=16 * 1024, backup_count=1000) for _ in range(2)]
+
+    def produce(transfer_log, writer_id):
+        for round_index in range(20):
+            for i in range(50):
+                transfer_log.record('o', 'admin', '127.0.0.1', f'/w{writer_id}/{round_index}/{i}.txt',
+                                    1024, 0.1, True)
+            time.sleep(0.005)
+
+    threads = [threading.Thread(target=produce, args=(writer, i)) for i, writer in enumerate(writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for writer in writers:
+        writer.close()
+
+    lines = read_transfer_log(path)
+    assert len(list(tmp_path.glob('xferlog.*.gz'))) > 1, "应发生多次轮转"
+    assert sum(writer.dropped for writer in writers) == 0
+    assert len(lines) == 2000
+    assert len(set(lines)) == 2000
+
+def test_copy_file_fast_refuses_same_file(tmp_path):
+    """复制到自身（包括硬链接）时报错，源文件内容不变"""
+    import shutil
+    from ftp_server import copy_file_fast
+
+    src = tmp_path / 'a.txt'
+    src.write_bytes(b'hello world')
+    os.link(src, tmp_path / 'link.txt')
+    for dst in (src, tmp_path / 'link.txt'):
+        with pytest.raises(shutil.SameFileError):
+            copy_file_fast(str(src), str(dst))
+    assert src.read_bytes() == b'hello world'
+
+    assert copy_file_fast(str(src), str(tmp_path / 'b.txt')) == 11
+    assert (tmp_path / 'b.txt').read_bytes() == b'hello world'
+
+def test_site_copy_onto_itself_is_rejected(server):
+    """SITE COPY a.txt a.txt 和 SITE COPY a.txt . 返回553，不截断文件"""
+    (server.root / 'a.txt').write_bytes(b'x' * 4096)
+    (server.root / 'dir').mkdir()
+    (server.root / 'dir' / 'f.txt').write_bytes(b'y' * 100)
+
+    ftp = server.connect()
+    for command in ('SITE COPY a.txt a.txt', 'SITE COPY a.txt .', 'SITE COPY /a.txt /',
+                    'SITE COPY dir .', 'SITE COPY dir dir/sub'):
+        with pytest.raises(ftplib.error_perm, match='553'):
+            ftp.sendcmd(command)
+    assert (server.root / 'a.txt').read_bytes() == b'x' * 4096
+    assert (server.root / 'dir' / 'f.txt').read_bytes() == b'y' * 100
+
+    # 正常复制仍然可用
+    assert ftp.sendcmd('SITE COPY a.txt dir').startswith('250')
+    assert (server.root / 'dir' / 'a.txt').read_bytes() == b'x' * 4096
+    ftp.quit()
+
+def site_reply(ftp, command):
+    """发送SITE命令，返回多行响应的各行"""
+    return ftp.sendcmd(command).splitlines()
+
+def test_site_copy_does_not_follow_symlinks(server, tmp_path):
+    """目录复制跳过符号链接并在响应中报告，不把根目录之外的数据复制进来"""
+    outside = tmp_path / 'outside'
+    outside.mkdir()
+    (outside / 'secret.txt').write_text('secret')
+    src = server.root / 'src'
+    (src / 'sub').mkdir(parents=True)
+    (src / 'sub' / 'f.txt').write_bytes(b'f' * 10)
+    os.symlink(outside / 'secret.txt', src / 'file-link')
+    os.symlink(outside, src / 'dir-link')
+
+    ftp = server.connect()
+    lines = site_reply(ftp, 'SITE COPY src dst')
+    ftp.quit()
+    assert lines[0] == '250-Copying 1 files'
+    assert lines[-1] == '250 Copied 1 files (10 bytes), 2 failed'
+    assert sorted(line.strip() for line in lines[1:-1]) == [
+        'error: /src/dir-link: symbolic link not copied',
+        'error: /src/file-link: symbolic link not copied',
+    ]
+    copied = server.root / 'dst'
+    assert sorted(path.relative_to(copied).as_posix() for path in copied.rglob('*')) == ['sub', 'sub/f.txt']
+
+def test_site_rmtree_removes_links_but_not_their_targets(server, tmp_path):
+    """递归删除目录：删除指向目录和文件的符号链接本身，链接指向的内容保留"""
+    outside = tmp_path / 'outside'
+    outside.mkdir()
+    (outside / 'keep.txt').write_text('keep')
+    tree = server.root / 'tree'
+    (tree / 'a' / 'b').mkdir(parents=True)
+    for path in (tree / 'x.txt', tree / 'a' / 'y.txt', tree / 'a' / 'b' / 'z.txt'):
+        path.write_text('data')
+    os.symlink(outside, tree / 'a' / 'dir-link')
+    os.symlink(outside / 'keep.txt', tree / 'file-link')
+
+    ftp = server.connect()
+    ftp.cwd('tree/a')
+    lines = site_reply(ftp, 'SITE RMTREE /tree')
+    assert lines[0] == '250-Removing 5 files, 3 directories'
+    assert lines[-1] == '250 Removed 5 files (0 bytes)'
+    assert ftp.pwd() == '/'  # 当前目录被删除后回到上级
+    for command in ('SITE RMTREE /', 'SITE RMTREE ../..'):
+        with pytest.raises(ftplib.error_perm, match='550'):
+            ftp.sendcmd(command)
+    ftp.quit()
+    assert not tree.exists()
+    assert (outside / 'keep.txt').read_text() == 'keep'
+
+def test_site_dele_batch_reports_each_failure(server):
+    """批量删除列表中的文件，根目录之外和不存在的路径逐条报告，不影响其他文件"""
+    for name in ('a.txt', 'b.txt', 'c.txt'):
+        (server.root / name).write_text(name)
+    (server.root / 'list.txt').write_text('a.txt\n/b.txt\n\nmissing.txt\n../../etc/passwd\nc.txt\n')
+
+    ftp = server.connect()
+    lines = site_reply(ftp, 'SITE DELE list.txt')
+    ftp.quit()
+    assert lines[0] == '250-Deleting 4 files'
+    assert lines[-1] == '250 Deleted 3 files (0 bytes), 2 failed'
+    errors = sorted(line.strip() for line in lines[1:-1])
+    assert errors[0] == 'error: ../../etc/passwd: permission denied'
+    assert errors[1].startswith('error: /missing.txt:')
+    assert sorted(path.name for path in server.root.iterdir()) == ['list.txt']
+
+def test_batch_progress_lines_between_multiline_reply(tmp_path):
+    """批量操作在 250- 首行和 250 结束行之间发送进度行"""
+    from ftp_server import FTPSession
+
+    session = FTPSession(None, ('127.0.0.1', 0), tmp_path, {})
+    replies = []
+    session.send_response = replies.append
+    try:
+        replies.append('250-Working 3 files')
+        done, total_bytes, errors = session.run_batch(
+            'processed', [1, 2, 3], lambda item: item * 10, progress_interval=0)
+        session._finish_batch('Processed', done, total_bytes, errors)
+    finally:
+        session.fs_executor.shutdown()
+    assert replies == ['250-Working 3 files', ' processed 1/3', ' processed 2/3', ' processed 3/3',
+                       '250 Processed 3 files (60 bytes)']
+
+def test_benchmark_workloads_and_baseline_comparison():
+    """基准测试能对真实服务器跑完负载、统计延迟分位数，并识别相对基线的退化"""
+    import copy
+    from ftp_benchmark import BenchmarkServer, ProcessMonitor, WORKLOADS, run_workload, compare_with_baseline
+
+    server = BenchmarkServer()
+    server.start()
+    monitor = ProcessMonitor(server.process.pid)
+    try:
+        results = {'workloads': {
+            name: run_workload(WORKLOADS[name], server, monitor, clients=2, duration=30, max_ops=5)
+            for name in ('list', 'small')
+        }}
+    finally:
+        server.stop()
+
+    small = results['workloads']['small']
+    assert small['operations'] == 10 and small['errors'] == 0
+    assert small['commands']['STOR']['count'] == 10 and small['commands']['RETR']['count'] == 10
+    for stat in small['commands'].values():
+        assert stat['p50_ms'] <= stat['p99_ms'] <= stat['max_ms']
+    assert results['workloads']['list']['commands']['LIST']['count'] == 10
+
+    assert compare_with_baseline(results, copy.deepcopy(results), threshold=10) == []
+    baseline = copy.deepcopy(results)
+    baseline['workloads']['small']['ops_per_sec'] *= 2
+    assert 'small.ops_per_sec' in compare_with_baseline(results, baseline, threshold=10)
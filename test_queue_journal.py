@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+测试调度队列日志：批量写出、写入失败后的重试和重启后的队列恢复
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent / 'backend' / 'app'))
+
+from core.priority_queue import TaskItem, TaskPriority
+from core.queue_journal import FileQueueJournal
+
+def make_task(task_id, **kwargs):
+    return TaskItem(task_id=task_id, priority=TaskPriority.NORMAL, created_at=1.0, **kwargs)
+
+def test_file_journal_skips_bad_records_and_retries_failed_writes(tmp_path):
+    """无法序列化的记录单独丢弃；写入失败时整批保留并撤销内存状态，恢复后重写，不丢记录"""
+    path = tmp_path / 'journal' / 'queue.jsonl'
+    journal = FileQueueJournal(str(path), flush_interval=60, compact_ratio=1000)
+    journal.record_enqueue([make_task('a'), make_task('bad', payload={'handle': object()}), make_task('b')])
+    journal.flush()
+    assert set(journal.live) == {'a', 'b'}
+    assert not journal.buffer
+
+    # 日志路径暂时不可写：该批记录保留在缓冲区，live 不变
+    writable_path = journal.path
+    journal.path = str(tmp_path)
+    journal.record_complete('a', 'completed')
+    journal.record_enqueue([make_task('c')])
+    with pytest.raises(OSError):
+        journal.flush()
+    assert set(journal.live) == {'a', 'b'}
+    assert len(journal.buffer) == 2
+
+    journal.path = writable_path
+    journal.record_dispatch('b')
+    journal.close()
+    assert set(journal.live) == {'b', 'c'}
+    assert not journal.buffer
+
+    recovered = FileQueueJournal(str(path), flush_interval=60)
+    assert sorted(task_item.task_id for task_item in recovered.recover()) == ['b', 'c']
+    recovered.close()
+
+@pytest.fixture
+def db_app(tmp_path):
+    """使用SQLite数据库的最小Flask应用（依赖未安装时跳过）"""
+    for module in ('flask', 'flask_sqlalchemy', 'flask_migrate', 'flask_jwt_extended', 'flask_cors',
+                   'flask_socketio', 'celery', 'dotenv', 'werkzeug', 'cryptography'):
+        pytest.importorskip(module)
+    sys.path.insert(0, str(Path(__file__).resolve().parent / 'backend'))
+    from flask import Flask
+    from app import db
+    from app import models  # noqa: F401  导入后模型才会注册，create_all 才会建表
+
+    app = Flask('test_queue_journal')
+    app.config.update(SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path / 'tasks.db'}",
+                      SQLALCHEMY_TRACK_MODIFICATIONS=False)
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+    return app
+
+def test_task_leases_claim_renew_reclaim_release_and_recover(db_app):
+    """多个节点通过租约共享任务：认领互斥、续租发现被接管、接管过期任务、
+    结束状态随租约一起写入、恢复时不接管其他节点仍在执行的任务"""
+    from datetime import datetime, timedelta
+    from types import SimpleNamespace
+    from app import db
+    from app.models import TransferTask
+    from app.core.queue_journal import DatabaseQueueJournal
+    from app.core.task_lease import TaskLeaseManager
+
+    def add_rows(count, **kwargs):
+        with db_app.app_context():
+            rows = [TransferTask(1, 1, 'download', '/local', '/remote', **kwargs) for _ in range(count)]
+            db.session.add_all(rows)
+            db.session.commit()
+            return [row.id for row in rows]
+
+    def row(row_id):
+        with db_app.app_context():
+            task = db.session.get(TransferTask, row_id)
+            return task.status, task.lease_owner
+
+    def set_row(row_id, **values):
+        with db_app.app_context():
+            TransferTask.query.filter_by(id=row_id).update(values)
+            db.session.commit()
+
+    node_a = TaskLeaseManager(db_app, node_id='a')
+    node_b = TaskLeaseManager(db_app, node_id='b')
+    high = add_rows(2, priority=2)
+    low = add_rows(1, priority=4)
+
+    # 认领：按优先级，已被持有的任务不会被其他节点认领
+    assert {task_item.task_id for task_item in node_a.claim_batch(2)} == {str(row_id) for row_id in high}
+    assert [task_item.task_id for task_item in node_b.claim_batch(5)] == [str(low[0])]
+    assert node_b.claim_batch(5) == []
+
+    # 续租：任务被其他节点接管后不再由本节点持有
+    assert node_a.renew() == set()
+    set_row(high[1], lease_owner='b')
+    assert node_a.renew() == {high[1]}
+    assert node_a.held == {high[0]}
+
+    # 接管：租约过期的 running 任务重置为 pending
+    past = datetime.utcnow() - timedelta(minutes=5)
+    set_row(low[0], status='running', lease_owner='dead', lease_expires_at=past)
+    assert node_b.reclaim_expired() == 1
+    assert row(low[0]) == ('pending', None)
+
+    # 任务结束：结束状态与清除租约同时写入，其他节点无法在两者之间重新认领
+    execution = SimpleNamespace(task_item=SimpleNamespace(task_id=str(high[0])))
+    node_a._on_task_event('completed', execution)
+    node_a._release_pending()
+    assert row(high[0]) == ('completed', None)
+    assert str(high[0]) not in [task_item.task_id for task_item in node_b.claim_batch(10)]
+
+    # 队列日志之后写入的 running 不会覆盖已结束的状态
+    journal = DatabaseQueueJournal(db_app, node_id='a', flush_interval=60)
+    journal.record_dispatch(str(high[0]))
+    journal.flush()
+    assert row(high[0])[0] == 'completed'
+
+    # 恢复：只重置无人持有、本节点持有或租约过期的 running 任务
+    future = datetime.utcnow() + timedelta(minutes=5)
+    live_b, own, expired, orphan = add_rows(4, status='running')
+    set_row(live_b, lease_owner='b', lease_expires_at=future)
+    set_row(own, lease_owner='a', lease_expires_at=future)
+    set_row(expired, lease_owner='dead', lease_expires_at=past)
+    recovered = {task_item.task_id for task_item in journal.recover()}
+    assert {str(own), str(expired), str(orphan)} <= recovered
+    assert str(live_b) not in recovered and str(high[0]) not in recovered
+    assert row(live_b) == ('running', 'b')
+    for row_id in (own, expired, orphan):
+        assert row(row_id) == ('pending', None)
+    journal.close()
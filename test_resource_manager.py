@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+测试资源管理器 ResourceManager：层次令牌桶分配、/proc 资源采样和增量记账
+"""
+
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent / 'backend' / 'app'))
+
+from core.priority_queue import TaskPriority
+from core.proc_stats import HostStatsSampler
+from core.resource_manager import ResourceAllocation, ResourceManager, SystemResources
+
+def make_manager():
+    """容量取整百，便于按百分比计算各级的保证份额"""
+    return ResourceManager(SystemResources(max_ftp_connections=100, max_bandwidth_kbps=10000,
+                                           max_concurrent_tasks=100, max_disk_io_mbps=1000,
+                                           max_memory_mb=10000))
+
+def one_task(priority):
+    return ResourceAllocation(priority, ftp_connections=1, concurrent_tasks=1)
+
+def test_htb_borrows_idle_capacity_and_reclaims_guarantee():
+    """空闲时低优先级可借满全部容量；高优先级等待时回收借用的份额，借用方不能再占用"""
+    manager = make_manager()
+    low = TaskPriority.LOW
+    for i in range(100):
+        assert manager.allocate_resources(f"low-{i}", low, one_task(low))
+    assert not manager.can_allocate_resources(low, one_task(low))
+    assert manager.get_resource_status()[low]["borrowed"]["concurrent_tasks"] == 96
+    assert manager.bandwidth_rates[low] == 10000  # 只有LOW活跃时独占带宽
+
+    high = TaskPriority.HIGH
+    assert not manager.can_allocate_resources(high, one_task(high))
+    assert manager.find_reclaimable(high, one_task(high)) == ["low-99"]
+    assert manager.get_resource_status()[high]["reclaiming"]
+
+    manager.release_resources("low-99", low)
+    assert not manager.can_allocate_resources(low, one_task(low)), "回收期间借用方不能占用HIGH的保证份额"
+    assert manager.allocate_resources("high-0", high, one_task(high))
+    assert not manager.get_resource_status()[high]["reclaiming"]
+
+    # HIGH活跃后得到保证速率并优先借用剩余带宽，LOW回到保证速率
+    assert manager.bandwidth_rates[high] == 10000 - 400
+    assert manager.bandwidth_rates[low] == 400
+
+    # 保证份额之内不需要回收，超出保证份额的部分只能借用
+    assert manager.find_reclaimable(low, one_task(low)) == []
+
+def write_proc(root, cpu, io_ticks, sectors, net_bytes, available_kb):
+    """生成一个最小的 /proc 目录：本进程ID为100，有一个子进程101"""
+    (root / 'stat').write_text(f"cpu  {' '.join(map(str, cpu))} 0 0 0\ncpu0 0 0 0 0\n")
+    (root / 'meminfo').write_text(f"MemTotal:       8388608 kB\nMemFree:  1000 kB\n"
+                                  f"MemAvailable:   {available_kb} kB\n")
+    (root / 'diskstats').write_text(
+        f"   8       0 sda 10 0 {sectors} 0 10 0 {sectors} 0 0 {io_ticks} 0\n"
+        f"   8       1 sda1 10 0 999999 0 10 0 999999 0 0 999999 0\n"
+        f"   7       0 loop0 10 0 999999 0 10 0 999999 0 0 999999 0\n")
+    (root / 'net').mkdir(exist_ok=True)
+    (root / 'net' / 'dev').write_text(
+        "Inter-|   Receive\n face |bytes packets\n"
+        f"    lo: 999999 0 0 0 0 0 0 0 999999 0 0 0 0 0 0 0\n"
+        f"  eth0: {net_bytes} 0 0 0 0 0 0 0 {net_bytes} 0 0 0 0 0 0 0\n")
+    for pid, rss_kb in ((100, 204800), (101, 102400)):
+        (root / str(pid)).mkdir(exist_ok=True)
+        (root / str(pid) / 'status').write_text(f"Name:\tpython\nVmRSS:\t  {rss_kb} kB\n")
+    (root / '100' / 'task' / '100').mkdir(parents=True, exist_ok=True)
+    (root / '100' / 'task' / '100' / 'children').write_text("101 ")
+
+def test_proc_sampler_and_host_pressure(tmp_path):
+    """从 /proc 计算CPU、磁盘、网络、内存和进程RSS；主机可用内存不足时暂缓启动新任务"""
+    proc_root, sys_root = tmp_path / 'proc', tmp_path / 'sys'
+    proc_root.mkdir()
+    (sys_root / 'block' / 'sda').mkdir(parents=True)  # 只有整块磁盘在 /sys/block 下
+    sampler = HostStatsSampler(str(proc_root), str(sys_root), pid=100)
+
+    # user nice system idle iowait irq softirq steal
+    write_proc(proc_root, [100, 0, 100, 700, 100, 0, 0, 0], 0, 0, 0, 4194304)
+    first = sampler.sample()
+    assert first["cpu_percent"] is None and first["disk_busy_percent"] is None  # 第一次只建立基线
+    assert first["memory_total_mb"] == 8192 and first["memory_available_mb"] == 4096
+    assert first["process_rss_mb"] == 300
+
+    time.sleep(0.05)
+    write_proc(proc_root, [400, 0, 200, 1000, 200, 0, 0, 0], 10 ** 6, 2048, 1024 * 1024, 102400)
+    second = sampler.sample()
+    assert second["cpu_percent"] == 50.0
+    assert second["disk_busy_percent"] == 100.0
+    assert second["disk_io_mbps"] > 0 and second["net_kbps"] > 0
+    assert second["memory_available_mb"] == 100
+
+    manager = make_manager()
+    low = TaskPriority.LOW
+    required = ResourceAllocation(low, concurrent_tasks=1, memory_mb=64)
+    manager.update_measured_usage(second)
+    assert manager.allocate_resources("first", low, required), "没有运行中的任务时总是允许启动"
+    assert not manager.can_allocate_resources(low, required)
+
+    manager.update_measured_usage({**second, "memory_available_mb": 4096, "disk_busy_percent": 10})
+    assert manager.can_allocate_resources(low, required)
+    # 预留的内存按实测RSS修正
+    manager.update_measured_usage({"process_rss_mb": 9990})
+    assert not manager.can_allocate_resources(low, required)
+
+def test_incremental_bookkeeping_matches_recount_and_snapshots_are_immutable():
+    """随机分配和释放后，增量维护的用量与逐任务重新累加一致；已发布的状态快照不再被修改"""
+    import random
+    from core.resource_manager import RESOURCE_FIELDS
+
+    rng = random.Random(43)
+    manager = make_manager()
+    running = {}
+    for step in range(2000):
+        if running and rng.random() < 0.45:
+            task_id = rng.choice(list(running))
+            manager.release_resources(task_id, running.pop(task_id))
+            continue
+        priority = rng.choice(list(TaskPriority))
+        required = ResourceAllocation(priority, ftp_connections=rng.randint(0, 2), bandwidth_kbps=rng.randint(0, 500),
+                                      concurrent_tasks=1, disk_io_mbps=rng.randint(0, 20),
+                                      memory_mb=rng.randint(0, 200))
+        if manager.allocate_resources(str(step), priority, required):
+            running[str(step)] = priority
+
+    for field in RESOURCE_FIELDS:
+        for priority in TaskPriority:
+            expected = sum(getattr(manager.task_allocations[task_id], field)
+                           for task_id, task_priority in running.items() if task_priority == priority)
+            assert getattr(manager.current_usage[priority], field) == expected
+        assert getattr(manager.total_usage, field) == sum(
+            getattr(manager.task_allocations[task_id], field) for task_id in running)
+    assert sum(len(tasks) for tasks in manager.active_tasks.values()) == len(running)
+
+    status = manager.get_resource_status()
+    total = manager.get_total_usage()
+    assert manager.get_resource_status() is status
+    active = {priority: status[priority]["active_tasks"] for priority in TaskPriority}
+    assert sum(active.values()) == len(running)
+
+    task_id = next(iter(running))
+    manager.release_resources(task_id, running.pop(task_id))
+    assert manager.get_resource_status() is not status
+    assert {priority: status[priority]["active_tasks"] for priority in TaskPriority} == active
+    assert manager.get_total_usage()["total_usage"]["concurrent_tasks"] == total["total_usage"]["concurrent_tasks"] - 1
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+测试调度器管理接口：应用创建的调度器注册到 app.extensions，状态和指标接口返回调度器数据
+"""
+
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+@pytest.fixture
+def api_app(tmp_path):
+    """注册了API蓝图和任务调度器的最小Flask应用（依赖未安装时跳过）"""
+    for module in ('flask', 'flask_sqlalchemy', 'flask_migrate', 'flask_jwt_extended', 'flask_cors',
+                   'flask_socketio', 'celery', 'dotenv', 'werkzeug', 'cryptography', 'marshmallow'):
+        pytest.importorskip(module)
+    sys.path.insert(0, str(Path(__file__).resolve().parent / 'backend'))
+    from flask import Flask
+    from app import configure_task_scheduler, db, jwt
+    from app.api import api_bp
+    from app.config import TestingConfig
+    from app import models  # noqa: F401  导入后模型才会注册，create_all 才会建表
+
+    app = Flask('test_scheduler_api')
+    app.config.from_object(TestingConfig)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path / 'api.db'}"
+    db.init_app(app)
+    jwt.init_app(app)
+    app.register_blueprint(api_bp, url_prefix='/api')
+    with app.app_context():
+        db.create_all()
+    configure_task_scheduler(app)
+    yield app
+    app.extensions['task_scheduler'].shutdown()
+
+def test_scheduler_endpoints_report_registered_scheduler(api_app):
+    """调度器启动时加载站点上限和系统配置，站点和配置修改后同步；管理员可读取状态和指标"""
+    from flask_jwt_extended import create_access_token
+    from app import db
+    from app.core.priority_queue import TaskItem, TaskPriority
+    from app.models import FtpSite, SystemConfig, User
+
+    with api_app.app_context():
+        admin, user = User('admin', 'admin@example.com', 'secret'), User('user', 'user@example.com', 'secret')
+        admin.is_admin = True
+        site = FtpSite(1, 'site', 'ftp.example.com')
+        site.max_connections = 3
+        db.session.add_all([admin, user, site])
+        db.session.commit()
+        SystemConfig.set_config('scheduler.time_slice_seconds', 7, config_type='int')
+        admin_token = create_access_token(identity=str(admin.id))
+        user_token = create_access_token(identity=str(user.id))
+        site_id = site.id
+
+    scheduler = api_app.extensions['task_scheduler']
+    scheduler.config['resource_sampling_interval'] = 0
+    scheduler.register_handler('transfer', lambda context: 'done')
+    scheduler.start()
+    assert scheduler.config['time_slice_seconds'] == 7
+    assert scheduler.site_limits.limit(site_id) == 3
+
+    with api_app.app_context():
+        db.session.get(FtpSite, site_id).max_connections = 1
+        db.session.commit()
+        SystemConfig.set_config('scheduler.time_slice_seconds', 12, config_type='int')
+    assert scheduler.site_limits.limit(site_id) == 1
+    assert scheduler.config['time_slice_seconds'] == 12
+
+    scheduler.add_task(TaskItem(task_id='t', priority=TaskPriority.HIGH, site_id=site_id))
+    deadline = time.time() + 10
+    while scheduler.stats['total_completed'] < 1 and time.time() < deadline:
+        time.sleep(0.01)
+
+    client = api_app.test_client()
+    admin_headers = {'Authorization': f'Bearer {admin_token}'}
+    assert client.get('/api/system/scheduler',
+                      headers={'Authorization': f'Bearer {user_token}'}).status_code == 403
+
+    response = client.get('/api/system/scheduler', headers=admin_headers)
+    assert response.status_code == 200
+    assert response.get_json()['success']
+
+    response = client.get('/api/system/scheduler/metrics?buckets=true', headers=admin_headers)
+    assert response.status_code == 200
+    body = response.get_json()
+    assert body['stats']['total_completed'] == 1
+    assert body['metrics']
+
+def test_scheduler_status_with_and_without_site(api_app):
+    """带站点和不带站点的任务同时排队时，状态中的站点和用户键都是字符串，接口可以正常序列化"""
+    from flask_jwt_extended import create_access_token
+    from app import db
+    from app.core.priority_queue import TaskItem, TaskPriority
+    from app.models import User
+
+    with api_app.app_context():
+        admin = User('admin', 'admin@example.com', 'secret')
+        admin.is_admin = True
+        db.session.add(admin)
+        db.session.commit()
+        admin_token = create_access_token(identity=str(admin.id))
+
+    scheduler = api_app.extensions['task_scheduler']
+    scheduler.add_task(TaskItem(task_id='with-site', priority=TaskPriority.NORMAL, site_id=1, user_id=1))
+    scheduler.add_task(TaskItem(task_id='no-site', priority=TaskPriority.NORMAL))
+    scheduler.set_site_connection_limit(1, 2)
+    scheduler.circuit_breaker.record_failure(1)
+
+    response = api_app.test_client().get('/api/system/scheduler',
+                                         headers={'Authorization': f'Bearer {admin_token}'})
+    assert response.status_code == 200
+    status = response.get_json()['scheduler']
+    assert set(status['fair_share']['users']) == {'1', 'None'}
+    assert set(status['fair_share']['users']['None']['sites']) == {'None'}
+    assert status['sites']['1']['limit'] == 2
+    assert status['circuit_breakers']['1']['consecutive_failures'] == 1
+
+def test_upgrade_adds_scheduler_columns_to_existing_tables(api_app):
+    """旧版本的表缺少调度相关的列时，升级脚本补充列和索引，重复运行不做修改"""
+    from sqlalchemy import inspect, text
+    from app import db
+    from upgrade_db import upgrade
+
+    with api_app.app_context():
+        with db.engine.begin() as connection:
+            connection.execute(text('ALTER TABLE ftp_sites DROP COLUMN max_connections'))
+            for index in ('ix_transfer_tasks_lease_owner', 'ix_transfer_tasks_lease_expires_at'):
+                connection.execute(text(f'DROP INDEX {index}'))
+            for column in ('deadline', 'lease_owner', 'lease_expires_at'):
+                connection.execute(text(f'ALTER TABLE transfer_tasks DROP COLUMN {column}'))
+
+        assert sorted(upgrade()) == ['ftp_sites.max_connections', 'transfer_tasks.deadline',
+                                     'transfer_tasks.lease_expires_at', 'transfer_tasks.lease_owner']
+        inspector = inspect(db.engine)
+        assert 'max_connections' in {column['name'] for column in inspector.get_columns('ftp_sites')}
+        assert {'ix_transfer_tasks_lease_owner', 'ix_transfer_tasks_lease_expires_at'} <= {
+            index['name'] for index in inspector.get_indexes('transfer_tasks')}
+        assert upgrade() == []
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+测试调度队列 PriorityTaskQueue：索引堆、阻塞获取、批量入队和批量取消
+"""
+
+import random
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent / 'backend' / 'app'))
+
+from core.priority_queue import IndexedHeap, KeyedTaskIndex, PriorityTaskQueue, TaskItem, TaskPriority
+
+def make_task(task_id, priority=TaskPriority.NORMAL, created_at=None, **kwargs):
+    return TaskItem(task_id=str(task_id), priority=priority,
+                    created_at=created_at if created_at is not None else float(task_id), **kwargs)
+
+def drain(task_queue):
+    """按出队顺序取出所有任务的task_id"""
+    order = []
+    while True:
+        task_item = task_queue.get()
+        if task_item is None:
+            return order
+        order.append(task_item.task_id)
+
+def test_indexed_heap_matches_sorted_reference():
+    """随机插入、删除、调整优先级后，弹出顺序与排序结果一致，位置索引始终正确"""
+    rng = random.Random(31)
+    heap = IndexedHeap()
+    reference = {}
+    for step in range(3000):
+        action = rng.random()
+        if action < 0.5 or not reference:
+            task_item = make_task(step, rng.randint(1, 5))
+            heap.push(task_item)
+            reference[task_item.task_id] = task_item
+        elif action < 0.75:
+            task_id = rng.choice(list(reference))
+            assert heap.remove(task_id) is reference.pop(task_id)
+        else:
+            task_item = reference[rng.choice(list(reference))]
+            task_item.priority = rng.randint(1, 5)
+            assert heap.update(task_item.task_id)
+
+        if step % 500 == 0:
+            assert all(heap.heap[index].task_id == task_id for task_id, index in heap.positions.items())
+
+    assert heap.remove('missing') is None
+    popped = [heap.pop() for _ in range(len(heap))]
+    assert popped == sorted(reference.values())
+    assert heap.pop() is None and not heap.positions
+
+def test_queue_remove_and_update_priority_keep_order():
+    """删除和调整优先级后，出队顺序仍按优先级和创建时间，不出现已删除的任务"""
+    task_queue = PriorityTaskQueue()
+    for i in range(100):
+        task_queue.put(make_task(i, TaskPriority.LOW))
+
+    for i in range(0, 100, 3):
+        assert task_queue.remove(str(i))
+    assert not task_queue.remove('0')
+    assert task_queue.update_priority('50', TaskPriority.CRITICAL)
+    assert task_queue.update_priority('97', TaskPriority.HIGH)
+    assert not task_queue.update_priority('3', TaskPriority.HIGH)
+
+    expected = ['50', '97'] + [str(i) for i in range(100) if i % 3 and i not in (50, 97)]
+    assert len(task_queue) == len(expected)
+    assert drain(task_queue) == expected
+
+def test_blocking_get_wakes_on_put_and_honours_timeout():
+    """get(timeout) 阻塞到有任务入队时立即返回，超时返回None；只等待指定优先级的任务"""
+    task_queue = PriorityTaskQueue()
+    result = {}
+
+    def consumer():
+        result['task'] = task_queue.get([TaskPriority.HIGH], timeout=5)
+        result['at'] = time.monotonic()
+
+    thread = threading.Thread(target=consumer)
+    thread.start()
+    time.sleep(0.1)
+    task_queue.put(make_task(1, TaskPriority.LOW))  # 不满足过滤条件，不应唤醒消费者
+    time.sleep(0.1)
+    assert thread.is_alive()
+
+    put_at = time.monotonic()
+    task_queue.put(make_task(2, TaskPriority.HIGH))
+    thread.join(timeout=2)
+    assert result['task'].task_id == '2'
+    assert result['at'] - put_at < 0.5
+
+    started = time.monotonic()
+    assert task_queue.get([TaskPriority.HIGH], timeout=0.2) is None
+    assert time.monotonic() - started >= 0.19
+    assert task_queue.get(timeout=0).task_id == '1'
+
+def test_scheduler_dispatches_on_arrival_without_polling():
+    """调度线程空闲时阻塞等待，新任务入队后立即派发，而不是等下一次轮询"""
+    from core.resource_manager import ResourceManager
+    from core.task_scheduler import TaskScheduler
+
+    scheduler = TaskScheduler(ResourceManager(), PriorityTaskQueue())
+    scheduler.config["resource_sampling_interval"] = 0
+    started = threading.Event()
+    scheduler.register_handler("transfer", lambda context: started.set())
+    scheduler.start()
+    try:
+        time.sleep(0.3)
+        rounds = scheduler.stats["last_schedule_time"]
+        time.sleep(0.5)
+        assert scheduler.stats["last_schedule_time"] == rounds, "空闲时不应轮询"
+
+        added_at = time.monotonic()
+        scheduler.add_task(TaskItem(task_id="t1", priority=TaskPriority.NORMAL))
+        assert started.wait(2)
+        assert time.monotonic() - added_at < 0.5
+    finally:
+        scheduler.shutdown()
+
+def test_bulk_put_and_cancel_keep_indexes_consistent():
+    """put_many 去重并替换已有任务，remove_many / remove_where 同步维护二级索引"""
+    task_queue = PriorityTaskQueue()
+    index = KeyedTaskIndex(lambda task_item: (task_item.created_at,))
+    task_queue.add_index(index)
+
+    task_queue.put_many([make_task(i, TaskPriority.LOW if i % 2 else TaskPriority.NORMAL) for i in range(1000)])
+    # 同一批内重复的task_id以最后一个为准，已在队列中的任务被替换
+    task_queue.put_many([make_task(5, TaskPriority.HIGH), make_task(5, TaskPriority.CRITICAL),
+                         make_task(1000, TaskPriority.HIGH)])
+    assert len(task_queue) == 1001 and len(index) == 1001
+    assert task_queue.get_task('5').priority == TaskPriority.CRITICAL
+
+    # 少量删除逐个进行，大量删除整体重建，两条路径结果相同
+    assert task_queue.remove_many(['1', '3', 'missing']) == 2
+    assert task_queue.remove_many([str(i) for i in range(0, 1000, 2)]) == 500
+    removed = task_queue.remove_where(lambda task_item: int(task_item.task_id) > 900)
+    assert sorted(int(task_item.task_id) for task_item in removed) == list(range(901, 1001, 2)) + [1000]
+    assert len(task_queue) == len(index) == 1001 - 2 - 500 - 51
+
+    assert index.peek().task_id == '5'
+    order = drain(task_queue)
+    assert order[0] == '5'
+    assert order[1:] == [str(i) for i in range(7, 901, 2)]
+    assert len(index) == 0
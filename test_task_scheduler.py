@@ -0,0 +1,606 @@
+#!/usr/bin/env python3
+"""
+测试任务调度器 TaskScheduler：执行器、时间片轮转、公平共享、自适应并发、老化、抢占、
+截止时间调度、站点连接限制、失败重试和准入控制
+"""
+
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent / 'backend' / 'app'))
+
+from core.adaptive import AdaptiveController
+from core.admission import AdmissionController, AdmissionRejected
+from core.priority_queue import PriorityTaskQueue, TaskItem, TaskPriority
+from core.resource_manager import ResourceManager
+from core.retry_policy import CircuitBreaker, PermanentError, RetryPolicy
+from core.task_executor import ProcessPoolTaskExecutor
+from core.task_scheduler import SchedulingPolicy, TaskScheduler
+
+def make_scheduler(policy=SchedulingPolicy.PRIORITY_PREEMPTIVE, system_config=None, **config):
+    """system_config 模拟 SystemConfig 中的配置，start() 和 load_config() 时加载"""
+    get_config = None
+    if system_config is not None:
+        get_config = lambda key, default=None: system_config.get(key, default)
+    scheduler = TaskScheduler(ResourceManager(), PriorityTaskQueue(), get_config=get_config)
+    scheduler.scheduling_policy = policy
+    scheduler.config["resource_sampling_interval"] = 0
+    scheduler.config.update(config)
+    return scheduler
+
+def wait_until(condition, timeout=10, interval=0.01):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(interval)
+    return False
+
+class EventLog:
+    """收集调度器的任务事件"""
+
+    def __init__(self, scheduler):
+        self.events = []
+        self.lock = threading.Lock()
+        scheduler.add_task_listener(self)
+
+    def __call__(self, event, execution):
+        with self.lock:
+            self.events.append((event, execution.task_item.task_id, execution))
+
+    def final(self, task_id):
+        """任务最后一次完成或失败的执行"""
+        with self.lock:
+            for event, event_task_id, execution in reversed(self.events):
+                if event_task_id == task_id and event in ("completed", "failed"):
+                    return event, execution
+        return None
+
+def square_in_subprocess(task_id, payload):
+    """进程池执行器的处理函数（模块级，可pickle）"""
+    return payload["value"] ** 2, os.getpid()
+
+def test_executors_run_handlers_and_report_results():
+    """任务交给注册的执行器运行，结果、进度和失败通过事件返回"""
+    scheduler = make_scheduler()
+    scheduler.register_executor("process", ProcessPoolTaskExecutor(max_workers=1))
+    log = EventLog(scheduler)
+
+    def transfer(context):
+        context.report_progress(0.5, transferred_bytes=512)
+        return context.payload["name"].upper()
+
+    def broken(context):
+        raise PermanentError("配置错误")
+
+    scheduler.register_handler("transfer", transfer)
+    scheduler.register_handler("square", square_in_subprocess, executor="process")
+    scheduler.register_handler("broken", broken)
+    scheduler.start()
+    try:
+        scheduler.add_task(TaskItem(task_id="t", priority=TaskPriority.NORMAL, payload={"name": "abc"}))
+        scheduler.add_task(TaskItem(task_id="p", priority=TaskPriority.NORMAL, task_type="square",
+                                    payload={"value": 7}))
+        scheduler.add_task(TaskItem(task_id="b", priority=TaskPriority.NORMAL, task_type="broken"))
+        scheduler.add_task(TaskItem(task_id="u", priority=TaskPriority.NORMAL, task_type="unknown"))
+        assert wait_until(lambda: all(log.final(task_id) for task_id in "tpbu"))
+        assert wait_until(lambda: not scheduler.running_tasks)
+    finally:
+        scheduler.shutdown()
+
+    event, execution = log.final("t")
+    assert event == "completed" and execution.result == "ABC" and execution.executor == "thread"
+    assert any(event == "progress" and task_id == "t" for event, task_id, _ in log.events)
+
+    event, execution = log.final("p")
+    value, pid = execution.result
+    assert event == "completed" and value == 49 and pid != os.getpid()
+
+    for task_id in "bu":
+        event, execution = log.final(task_id)
+        assert event == "failed" and execution.task_item.retry_count == 0
+    assert scheduler.stats["total_completed"] == 2 and scheduler.stats["total_failed"] == 2
+
+@pytest.mark.filterwarnings("error::pytest.PytestUnhandledThreadExceptionWarning")
+def test_concurrent_removal_while_tasks_finish(capsys):
+    """API线程移除任务与执行器回调、调度线程并发时，每个任务只结束一次，资源全部归还"""
+    import random
+
+    scheduler = make_scheduler()
+    total = 300
+
+    def transfer(context):
+        time.sleep(random.random() * 0.002)
+        return "done"
+
+    scheduler.register_handler("transfer", transfer)
+    scheduler.start()
+    removed = []
+    try:
+        scheduler.add_tasks([TaskItem(task_id=str(i), priority=random.choice(list(TaskPriority)),
+                                      site_id=i % 3) for i in range(total)])
+
+        def remover(seed):
+            rng = random.Random(seed)
+            for _ in range(300):
+                # 一半针对正在运行或刚结束的任务，使移除与完成回调、资源回收交错
+                running = [task_id for task_id in tuple(scheduler.running_tasks)]
+                task_id = rng.choice(running) if running and rng.random() < 0.5 else str(rng.randrange(total))
+                if scheduler.remove_task(task_id):
+                    removed.append(task_id)
+
+        switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-5)
+        threads = [threading.Thread(target=remover, args=(seed,)) for seed in range(4)]
+        try:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            sys.setswitchinterval(switch_interval)
+        assert wait_until(lambda: scheduler.stats["total_completed"] + len(removed) == total)
+        assert wait_until(lambda: not scheduler.running_tasks and scheduler.task_queue.is_empty())
+    finally:
+        scheduler.shutdown()
+
+    assert "调度器错误" not in capsys.readouterr().out
+    assert scheduler.stats["total_completed"] + len(removed) == total
+    assert len(set(removed)) == len(removed)
+    assert all(value == 0 for value in scheduler.resource_manager.get_total_usage()["total_usage"].values())
+    assert all(scheduler.site_limits.in_use(site_id) == 0 for site_id in range(3))
+
+def test_round_robin_yields_at_chunk_boundaries_and_resumes():
+    """时间片用完时任务在块边界让出，排到队尾，恢复后跳过已完成的块"""
+    scheduler = make_scheduler(SchedulingPolicy.ROUND_ROBIN, time_slice_seconds=0.05)
+    scheduler.site_limits.set_limit(1, 1)  # 同一时刻只运行一个任务
+    log = EventLog(scheduler)
+    chunks = []
+
+    def transfer(context):
+        for chunk_index, start_offset, end_offset in context.pending_chunks(1, 60, 10):
+            time.sleep(0.02)
+            chunks.append((context.task_id, chunk_index))
+            context.checkpoint(1, chunk_index, start_offset, end_offset)
+            if context.should_yield():
+                return context.yield_task()
+        return "done"
+
+    scheduler.register_handler("transfer", transfer)
+    for task_id in "ab":
+        scheduler.add_task(TaskItem(task_id=task_id, priority=TaskPriority.NORMAL, site_id=1))
+    scheduler.start()
+    try:
+        assert wait_until(lambda: log.final("a") and log.final("b"))
+    finally:
+        scheduler.shutdown()
+
+    for task_id in "ab":
+        assert log.final(task_id)[0] == "completed"
+        assert sorted(chunk for owner, chunk in chunks if owner == task_id) == list(range(6))
+    # 两个任务交替执行，而不是一个执行完再执行另一个
+    owners = [owner for owner, _ in chunks]
+    switches = sum(1 for previous, current in zip(owners, owners[1:]) if previous != current)
+    assert switches >= 2
+    assert scheduler.stats["total_yielded"] >= 2
+
+def test_fair_share_weights_follow_system_config():
+    """调度器启动和配置修改后加载公平共享权重，权重变化改变各用户分得的派发次数"""
+    system_config = {"scheduler.time_slice_seconds": 5}
+    scheduler = TaskScheduler(ResourceManager(), PriorityTaskQueue(),
+                              get_config=lambda key, default=None: system_config.get(key, default))
+    scheduler.config["resource_sampling_interval"] = 0
+    scheduler.start()
+    scheduler.shutdown()
+    assert scheduler.config["time_slice_seconds"] == 5
+    assert scheduler.fair_share.user_weights == {}
+
+    for user_id in (1, 2):
+        scheduler.task_queue.put_many([TaskItem(task_id=f"{user_id}-{i}", priority=TaskPriority.NORMAL,
+                                                user_id=user_id, site_id=1, total_bytes=1000)
+                                       for i in range(200)])
+
+    def dispatch(count):
+        """按公平共享顺序派发 count 个任务（立即按预估字节数结算），返回各用户分得的次数"""
+        served = {1: 0, 2: 0}
+        for _ in range(count):
+            task_item = scheduler.fair_share.select()
+            scheduler.fair_share.charge(task_item)
+            scheduler.task_queue.remove(task_item.task_id)
+            scheduler.fair_share.settle(task_item.task_id, task_item.total_bytes)
+            served[task_item.user_id] += 1
+        return served
+
+    assert dispatch(40) == {1: 20, 2: 20}
+
+    system_config["scheduler.fair_share.user_weights"] = {"2": 3}
+    scheduler.load_config()
+    assert scheduler.fair_share.user_weights == {2: 3.0}
+    served = dispatch(80)
+    assert served[2] == 3 * served[1]
+
+class IdleHostSampler:
+    def sample(self):
+        return {"cpu_percent": None, "disk_busy_percent": None}
+
+def test_adaptive_uses_wait_trend_and_retry_rate():
+    """排队等待时间增长时才增加并发，重试率上升时回退"""
+    now = [0.0]
+    controller = AdaptiveController(initial_limit=2, interval=10, host_sampler=IdleHostSampler(),
+                                    clock=lambda: now[0])
+
+    def window(site_id, waits, retries=0, transferred=0):
+        """模拟一个评估窗口：按给定等待时间启动任务，站点并发已满，返回评估后的上限"""
+        for index, wait in enumerate(waits):
+            controller.record_start(site_id, wait, index < retries)
+        controller.has_capacity(site_id, controller.sites[site_id].limit)
+        controller.record_progress(f"{site_id}-{now[0]}", site_id, transferred)
+        now[0] += 10
+        controller.update()
+        return controller.sites[site_id].limit
+
+    # 等待时间持续增长：逐步增加并发（吞吐量同时上升）
+    assert window(1, [5, 5], transferred=1000) == 3
+    assert window(1, [20, 20], transferred=2000) == 4
+    # 等待时间在下降：虽然并发已满也不再增加
+    assert window(1, [0, 0], transferred=4000) == 4
+    assert controller.sites[1].last_action == "hold"
+
+    # 重试率上升时回退，重试率回落后不再继续回退
+    controller.has_capacity(2, 0)
+    assert window(2, [1, 1, 1, 1], retries=0) == 3
+    assert window(2, [1, 1, 1, 1], retries=2) == 2
+    assert controller.sites[2].last_action == "backoff"
+    assert controller.get_status()["sites"]["2"]["retry_rate"] == 0.5
+    assert window(2, [1, 1, 1, 1], retries=1) >= 2
+    assert controller.sites[2].last_action != "backoff"
+
+def test_adaptive_limit_stays_within_site_connection_caps():
+    """自适应并发不超过站点配置的连接数和421后学到的上限，学到的上限回升后随之放开"""
+    from types import SimpleNamespace
+
+    now = [0.0]
+    scheduler = TaskScheduler(ResourceManager(), PriorityTaskQueue(), clock=lambda: now[0])
+    controller = scheduler.adaptive
+    controller.host_sampler = IdleHostSampler()
+    scheduler.site_limits.probe_interval = 100
+
+    def saturated_window(wait):
+        controller.record_start(1, wait, False)
+        controller.has_capacity(1, controller.sites[1].limit)
+        now[0] += controller.interval
+        controller.update()
+        return controller.sites[1].limit
+
+    scheduler.set_site_connection_limit(1, 3)
+    assert [saturated_window(wait) for wait in (10, 20, 30, 40)] == [3, 3, 3, 3]
+
+    # 两个连接时服务器返回421：上限学到1，自适应并发立即降到1
+    scheduler.site_limits.acquire(1, 2)
+    scheduler._record_refused(SimpleNamespace(refused=False, task_item=SimpleNamespace(site_id=1)))
+    scheduler.site_limits.release(1, 2)
+    assert scheduler.site_limits.limit(1) == 1 and controller.sites[1].limit == 1
+    assert saturated_window(50) == 1
+
+    # 试探间隔过后学到的上限回升到2，自适应并发可以随之增加，仍不超过配置的3
+    now[0] += 100
+    assert [saturated_window(wait) for wait in (60, 70, 80)] == [2, 2, 2]
+
+    # 取消配置的连接数后只受学到的上限约束
+    scheduler.set_site_connection_limit(1, None)
+    assert controller.site_max_limits[1] == scheduler.site_limits.limit(1) == 2
+    scheduler.shutdown()
+
+def test_aging_serves_starving_low_task_without_contesting_high():
+    """等待过久的LOW任务逐级提升，最多到NORMAL：排在后来的NORMAL任务之前，但不与HIGH任务争抢"""
+    now = [0.0]
+    scheduler = TaskScheduler(ResourceManager(), PriorityTaskQueue(), clock=lambda: now[0])
+    scheduler.config["starvation_threshold"] = 10
+    scheduler.add_task(TaskItem(task_id="low", priority=TaskPriority.BACKGROUND, created_at=0.0))
+
+    for step in range(1, 11):
+        now[0] = step * 10.0
+        scheduler.add_task(TaskItem(task_id=f"normal-{step}", priority=TaskPriority.NORMAL, created_at=now[0]))
+        scheduler.add_task(TaskItem(task_id=f"high-{step}", priority=TaskPriority.HIGH, created_at=now[0]))
+        scheduler._handle_starvation()
+
+    task_queue = scheduler.task_queue
+    assert task_queue.get_task("low").priority == TaskPriority.NORMAL
+    assert task_queue.get_task("normal-1").priority == TaskPriority.NORMAL
+    assert scheduler.aging.next_due(now[0], 10) is None
+    order = [task_queue.get().task_id for _ in range(len(task_queue))]
+    assert order == [f"high-{step}" for step in range(1, 11)] + ["low"] + [f"normal-{step}" for step in range(1, 11)]
+
+def test_requeued_task_keeps_its_place_in_aging_order():
+    """让出或被抢占后放回队列的任务保留原计时，按进入时间排入FIFO，到期时按时提升"""
+    now = [0.0]
+    scheduler = TaskScheduler(ResourceManager(), PriorityTaskQueue(), clock=lambda: now[0])
+    scheduler.config["starvation_threshold"] = 10
+    task_queue = scheduler.task_queue
+    for name, since in (("a", 0.0), ("x", 2.0), ("b", 5.0), ("c", 8.0)):
+        now[0] = since
+        task_queue.put(TaskItem(task_id=name, priority=TaskPriority.LOW, created_at=since))
+
+    # a 和 x 被派发，运行期间它们在FIFO中的记录失效并被清理；之后先后让出放回队列
+    running = [task_queue.get_task(name) for name in "ax"]
+    for task_item in running:
+        task_queue.remove(task_item.task_id)
+    now[0] = 9.0
+    assert scheduler.aging.next_due(now[0], 10) == 6.0
+    for task_item in running:
+        task_queue.put(task_item)
+    assert [task_item.level_since for task_item in running] == [0.0, 2.0]
+    assert scheduler.aging.next_due(now[0], 10) == 1.0
+
+    now[0] = 12.5
+    scheduler._handle_starvation()
+    assert {name: task_queue.get_task(name).priority for name in "axbc"} == {
+        "a": TaskPriority.NORMAL, "x": TaskPriority.NORMAL, "b": TaskPriority.LOW, "c": TaskPriority.LOW}
+    assert scheduler.aging.next_due(now[0], 10) == 2.5
+
+def test_preempted_task_stops_at_chunk_boundary_and_resumes():
+    """被抢占的任务在块边界暂停、保留断点，恢复后只传输剩余的块"""
+    scheduler = make_scheduler()
+    log = EventLog(scheduler)
+    chunks = []
+    started = threading.Event()
+    preempted = threading.Event()
+
+    def transfer(context):
+        for chunk_index, start_offset, end_offset in context.pending_chunks(1, 50, 10):
+            chunks.append(chunk_index)
+            context.checkpoint(1, chunk_index, start_offset, end_offset)
+            started.set()
+            preempted.wait(5)
+            if context.should_yield():
+                return context.yield_task()
+        return "done"
+
+    scheduler.register_handler("transfer", transfer)
+    scheduler.start()
+    try:
+        scheduler.add_task(TaskItem(task_id="low", priority=TaskPriority.LOW))
+        assert started.wait(5)
+        scheduler._preempt_task("low")
+        assert scheduler.running_tasks["low"].status == "preempting"
+        preempted.set()
+        assert wait_until(lambda: log.final("low"))
+    finally:
+        scheduler.shutdown()
+
+    events = [event for event, task_id, _ in log.events if task_id == "low"]
+    assert events == ["preempted", "completed"]
+    assert chunks == [0, 1, 2, 3, 4]
+    assert scheduler.stats["total_scheduled"] == 2
+
+def test_waiting_high_task_preempts_only_one_victim():
+    """被抢占的任务到块边界前，高优先级任务每次被唤醒都不再抢占新的任务，被抢占的任务只计一次"""
+    from core.resource_manager import SystemResources
+
+    scheduler = TaskScheduler(ResourceManager(SystemResources(max_concurrent_tasks=2)), PriorityTaskQueue())
+    release = threading.Event()
+
+    def transfer(context):
+        release.wait(5)
+        return context.yield_task() if context.should_yield() else "done"
+
+    scheduler.register_handler("transfer", transfer)
+    try:
+        for name in ("low-1", "low-2"):
+            scheduler.add_task(TaskItem(task_id=name, priority=TaskPriority.LOW))
+            scheduler.schedule_once()
+        assert set(scheduler.running_tasks) == {"low-1", "low-2"}
+
+        scheduler.add_task(TaskItem(task_id="high", priority=TaskPriority.HIGH))
+        for _ in range(4):
+            scheduler.schedule_once()
+        statuses = sorted(execution.status for execution in scheduler.running_tasks.values())
+        assert statuses == ["preempting", "running"]
+        assert scheduler.stats["total_preempted"] == 1
+        assert scheduler.task_queue.contains("high")
+
+        release.set()
+        assert wait_until(lambda: all(execution.status != "preempting"
+                                      for execution in scheduler.running_tasks.values()))
+        scheduler.schedule_once()
+        assert "high" in scheduler.running_tasks
+    finally:
+        release.set()
+        scheduler.shutdown()
+
+def run_serially(policy, task_items):
+    """同一站点限制为一个连接，按派发顺序逐个执行，返回执行顺序和调度器"""
+    scheduler = make_scheduler(policy)
+    scheduler.site_limits.set_limit(1, 1)
+    log = EventLog(scheduler)
+    order = []
+    scheduler.register_handler("transfer", lambda context: order.append(context.task_id))
+    for task_item in task_items:
+        task_item.site_id = 1
+        scheduler.add_task(task_item)
+    scheduler.start()
+    try:
+        assert wait_until(lambda: all(log.final(task_item.task_id) for task_item in task_items))
+        assert wait_until(lambda: not scheduler.running_tasks)
+    finally:
+        scheduler.shutdown()
+    return order, scheduler
+
+def test_deadline_and_remaining_bytes_policies_order_dispatch():
+    """EDF按截止时间派发，SRB按剩余字节数派发；关键任务始终最先，缺少信息的任务排在最后"""
+    now = time.time()
+    order, scheduler = run_serially(SchedulingPolicy.EARLIEST_DEADLINE_FIRST, [
+        TaskItem(task_id="none", priority=TaskPriority.HIGH),
+        TaskItem(task_id="late", priority=TaskPriority.LOW, deadline=now + 300),
+        TaskItem(task_id="missed", priority=TaskPriority.LOW, deadline=now - 1),
+        TaskItem(task_id="soon", priority=TaskPriority.BACKGROUND, deadline=now + 60),
+        TaskItem(task_id="critical", priority=TaskPriority.CRITICAL),
+    ])
+    assert order == ["critical", "missed", "soon", "late", "none"]
+    assert scheduler.stats["deadline_missed"] == 1
+
+    order, _ = run_serially(SchedulingPolicy.SHORTEST_REMAINING_BYTES, [
+        TaskItem(task_id="unknown", priority=TaskPriority.HIGH),
+        TaskItem(task_id="big", priority=TaskPriority.NORMAL, total_bytes=10_000),
+        TaskItem(task_id="mostly-done", priority=TaskPriority.LOW, total_bytes=50_000, transferred_bytes=49_000),
+        TaskItem(task_id="small", priority=TaskPriority.LOW, total_bytes=5_000),
+    ])
+    assert order == ["mostly-done", "small", "big", "unknown"]
+
+def test_site_limits_load_on_start_and_refusal_counts_once():
+    """启动时加载站点配置的连接上限；处理函数报告421后又抛出421异常，只记一次拒绝"""
+    import ftplib
+    from types import SimpleNamespace
+
+    sites = [SimpleNamespace(id=1, max_connections=3), SimpleNamespace(id=2, max_connections=None)]
+    scheduler = TaskScheduler(ResourceManager(), PriorityTaskQueue(), get_sites=lambda: sites)
+    scheduler.config["resource_sampling_interval"] = 0
+    scheduler.site_limits.retry_delay = 0.05
+    log = EventLog(scheduler)
+    attempts = []
+
+    def transfer(context):
+        attempts.append(context.task_id)
+        if len(attempts) == 1:
+            context.connection_refused()
+            raise ftplib.error_temp("421 Too many connections")
+        return "done"
+
+    scheduler.register_handler("transfer", transfer)
+    scheduler.start()
+    try:
+        assert scheduler.site_limits.limit(1) == 3 and scheduler.site_limits.limit(2) is None
+        scheduler.add_task(TaskItem(task_id="t", priority=TaskPriority.NORMAL, site_id=1))
+        assert wait_until(lambda: log.final("t"))
+    finally:
+        scheduler.shutdown()
+
+    assert log.final("t")[0] == "completed" and attempts == ["t", "t"]
+    status = scheduler.site_limits.get_status()["1"]
+    assert status["refused"] == 1
+    assert status["learned"] == 1
+
+def test_retry_backoff_permanent_errors_and_circuit_breaker():
+    """临时错误按退避重试后成功，5xx永久错误不重试；站点连续失败后熔断，冷却后只放行一个试探任务"""
+    import ftplib
+
+    policy = RetryPolicy(base_delay=10, max_delay=60, jitter=0.5, seed=48)
+    for attempt, cap in ((1, 10), (2, 20), (3, 40), (6, 60)):
+        assert cap * 0.5 <= policy.delay(attempt) <= cap
+
+    now = [0.0]
+    breaker = CircuitBreaker(failure_threshold=2, cooldown=30, max_cooldown=50, clock=lambda: now[0])
+    breaker.record_failure(1)
+    assert breaker.allow(1)
+    breaker.record_failure(1)
+    assert not breaker.allow(1) and breaker.allow(2)
+    assert breaker.cooldown_remaining(1, now[0]) == 30
+    now[0] = 30.0
+    assert breaker.allow(1)
+    breaker.on_dispatch(1)
+    assert not breaker.allow(1), "半开状态下只放行一个试探任务"
+    breaker.record_failure(1)
+    assert breaker.get_status()["1"]["cooldown"] == 50 and breaker.get_status()["1"]["trips"] == 2
+    now[0] = 80.0
+    breaker.on_dispatch(1)
+    breaker.record_success(1)
+    assert breaker.get_status()["1"]["state"] == "closed" and breaker.allow(1)
+
+    # 重试和熔断参数来自系统配置
+    system_config = {"scheduler.retry_base_delay": 0.02, "scheduler.retry_max_delay": 0.05,
+                     "scheduler.circuit_failure_threshold": 4}
+    scheduler = make_scheduler(system_config=system_config)
+    log = EventLog(scheduler)
+    attempts = {"flaky": 0, "missing": 0}
+
+    def transfer(context):
+        attempts[context.task_id] += 1
+        if context.task_id == "missing":
+            raise ftplib.error_perm("550 No such file")
+        if attempts["flaky"] < 3:
+            raise ConnectionResetError("connection reset by peer")
+        return "done"
+
+    scheduler.register_handler("transfer", transfer)
+    scheduler.start()
+    try:
+        scheduler.add_task(TaskItem(task_id="flaky", priority=TaskPriority.NORMAL, site_id=1))
+        scheduler.add_task(TaskItem(task_id="missing", priority=TaskPriority.NORMAL, site_id=2))
+        assert wait_until(lambda: log.final("flaky") and log.final("missing"))
+        assert wait_until(lambda: not scheduler.running_tasks)
+    finally:
+        scheduler.shutdown()
+
+    assert log.final("flaky")[0] == "completed" and attempts["flaky"] == 3
+    assert log.final("flaky")[1].task_item.retry_count == 2
+    assert log.final("missing")[0] == "failed" and attempts["missing"] == 1
+    assert [event for event, task_id, _ in log.events if task_id == "flaky"].count("retrying") == 2
+    assert scheduler.stats["total_retried"] == 2
+    assert scheduler.circuit_breaker.get_status()["1"]["state"] == "closed"
+    assert (scheduler.retry_policy.base_delay, scheduler.retry_policy.max_delay) == (0.02, 0.05)
+    assert scheduler.circuit_breaker.failure_threshold == 4
+
+    # 配置修改后重新加载，生效的参数与状态中报告的一致
+    system_config.update({"scheduler.circuit_failure_threshold": 7, "scheduler.circuit_cooldown": 90})
+    scheduler.load_config()
+    assert scheduler.circuit_breaker.failure_threshold == 7 and scheduler.circuit_breaker.base_cooldown == 90
+    assert scheduler.get_scheduler_status()["config"]["circuit_cooldown"] == 90
+
+def test_admission_rejects_over_limits_with_retry_after():
+    """超出排队总数、单用户数量或主机内存下限时拒绝提交，批量提交整体拒绝；
+    retry_after 按派发速率估计，移除排队任务后可以再次提交"""
+    now = [0.0]
+    memory = [4096]
+    admission = AdmissionController(max_queued_tasks=4, max_queued_per_user=None, max_queue_memory_mb=None,
+                                    min_available_memory_mb=128, available_memory=lambda: memory[0],
+                                    clock=lambda: now[0])
+    for _ in range(20):
+        admission.on_dispatch()
+    now[0] = 10.0
+    admission.on_dispatch()  # 10秒内派发21个任务
+    assert admission.dispatch_rate == 2.1
+    for i in range(4):
+        admission.add(TaskItem(task_id=f"q{i}", priority=TaskPriority.NORMAL))
+    with pytest.raises(AdmissionRejected) as rejected:
+        admission.admit([TaskItem(task_id=f"n{i}", priority=TaskPriority.NORMAL) for i in range(3)])
+    assert rejected.value.reason == "queue_full" and rejected.value.retry_after == 1.4
+    memory[0] = 64
+    with pytest.raises(AdmissionRejected) as rejected:
+        admission.admit([TaskItem(task_id="m", priority=TaskPriority.NORMAL)])
+    assert rejected.value.reason == "host_memory"
+    assert admission.get_status()["rejected"] == {"queue_full": 1, "host_memory": 1}
+
+    system_config = {"scheduler.max_queued_tasks": 3, "scheduler.max_queued_tasks_per_user": 2}
+    scheduler = make_scheduler(system_config=system_config)
+    scheduler.load_config()
+    assert scheduler.admission.get_status()["limits"]["max_queued_tasks"] == 3
+
+    def task(task_id, user_id):
+        return TaskItem(task_id=task_id, priority=TaskPriority.NORMAL, user_id=user_id)
+
+    scheduler.add_task(task("a1", 1))
+    scheduler.add_task(task("a2", 1))
+    with pytest.raises(AdmissionRejected) as rejected:
+        scheduler.add_task(task("a3", 1))
+    assert rejected.value.reason == "user_queue_full" and rejected.value.to_dict()["retry_after"] > 0
+    scheduler.add_task(task("b1", 2))
+    with pytest.raises(AdmissionRejected) as rejected:
+        scheduler.add_tasks([task("c1", 3), task("c2", 3)])
+    assert rejected.value.reason == "queue_full"
+    assert len(scheduler.task_queue) == 3 and scheduler.stats["total_rejected"] == 3
+
+    assert scheduler.remove_task("a1")
+    scheduler.add_task(task("a3", 1))
+    assert scheduler.admission.get_status()["queued_tasks"] == 3
+
+    # 调高配置的上限后重新加载即可继续提交
+    system_config["scheduler.max_queued_tasks"] = 5
+    scheduler.load_config()
+    scheduler.add_tasks([task("c1", 3), task("c2", 3)])
+    assert scheduler.get_scheduler_status()["config"]["max_queued_tasks"] == 5
+    scheduler.shutdown()